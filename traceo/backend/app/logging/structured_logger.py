@@ -5,18 +5,37 @@ Semantic logging with automatic PII/secret detection and redaction
 Date: November 21, 2024
 """
 
+import bisect
 import logging
 import json
 import re
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, field
 from enum import Enum
 import traceback
 
+try:
+    import hyperscan
+except ImportError:  # optional: fall back to scanning every pattern with re
+    hyperscan = None
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
+def _dumps(payload: Dict) -> str:
+    """Serialize a log payload to a JSON string"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(payload)
+
+
 class LogLevel(Enum):
     """Structured log levels"""
     DEBUG = 'DEBUG'
@@ -26,6 +45,16 @@ class LogLevel(Enum):
     CRITICAL = 'CRITICAL'
 
 
+# Numeric values matching the stdlib logging levels
+LEVEL_INT = {
+    LogLevel.DEBUG: logging.DEBUG,
+    LogLevel.INFO: logging.INFO,
+    LogLevel.WARNING: logging.WARNING,
+    LogLevel.ERROR: logging.ERROR,
+    LogLevel.CRITICAL: logging.CRITICAL,
+}
+
+
 class PIIType(Enum):
     """Types of personally identifiable information"""
     EMAIL = 'email'
@@ -45,7 +74,7 @@ class PIIType(Enum):
 class PIIDetection:
     """Record of detected PII"""
     timestamp: datetime
-    pii_type: PIIType
+    pii_type: str  # PIIType value
     field_name: str
     original_value: str
     redacted_value: str
@@ -57,7 +86,7 @@ class PIIDetection:
 class LogRecord:
     """Structured log record"""
     timestamp: datetime
-    level: LogLevel
+    level: str  # LogLevel value
     service: str
     message: str
     context: Dict[str, Any] = field(default_factory=dict)
@@ -67,12 +96,14 @@ class LogRecord:
     request_id: Optional[str] = None
     user_id: Optional[str] = None
     pii_detections: List[PIIDetection] = field(default_factory=list)
+    level_int: int = 0  # LEVEL_INT value, used for buffer filtering
+    timestamp_ns: int = field(default_factory=time.time_ns)
 
     def to_dict(self) -> Dict:
         """Convert to dictionary"""
         return {
             'timestamp': self.timestamp.isoformat(),
-            'level': self.level.value,
+            'level': self.level,
             'service': self.service,
             'message': self.message,
             'context': self.context,
@@ -133,40 +164,104 @@ class PIIDetector:
         }
     }
 
-    def __init__(self):
+    def __init__(self, light_mode: bool = False):
+        # light_mode skips the surrounding-text context stored per detection
+        self.light_mode = light_mode
         self.compiled_patterns = {
             pii_type: {
                 'regex': re.compile(pattern['pattern'], re.IGNORECASE),
-                'confidence': pattern['confidence']
+                'confidence': pattern['confidence'],
+                'type': pii_type.value
             }
             for pii_type, pattern in self.PATTERNS.items()
         }
+        self.pattern_order = list(self.compiled_patterns.values())
+        self.hs_database = self._compile_hyperscan()
         self.detections: List[PIIDetection] = []
 
-    def detect(self, text: str, field_name: str = 'unknown') -> List[PIIDetection]:
-        """Detect PII in text"""
-        detections = []
-
-        for pii_type, compiled_info in self.compiled_patterns.items():
-            pattern = compiled_info['regex']
-            confidence = compiled_info['confidence']
+    def _compile_hyperscan(self):
+        """Compile all patterns into one Hyperscan database (None if unavailable)"""
+        if hyperscan is None:
+            return None
+
+        # Python's \s also matches \x1c-\x1f; every \s in PATTERNS sits inside
+        # a character class, so widening it there keeps both engines in step.
+        expressions = [
+            pattern['pattern'].replace(r'\s', r'\s\x1c-\x1f').encode()
+            for pattern in self.PATTERNS.values()
+        ]
+        flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+
+        try:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=expressions,
+                ids=list(range(len(expressions))),
+                elements=len(expressions),
+                flags=[flags] * len(expressions)
+            )
+        except hyperscan.error as e:
+            logger.warning(f"Hyperscan compile failed, using re only: {e}")
+            return None
+
+        return database
+
+    def _candidate_patterns(self, text: str) -> List[Dict]:
+        """Return the compiled patterns that can match text"""
+        # Hyperscan works on bytes with ASCII semantics; non-ASCII text goes
+        # through every re pattern so Unicode \b/\d/IGNORECASE rules still apply.
+        if self.hs_database is None or not text.isascii():
+            return self.pattern_order
+
+        matched_ids = set()
+
+        def on_match(pattern_id, start, end, flags, context):
+            matched_ids.add(pattern_id)
+
+        self.hs_database.scan(text.encode(), match_event_handler=on_match)
+        return [self.pattern_order[i] for i in sorted(matched_ids)]
+
+    def _scan(self, text: str) -> List[Tuple[Dict, Any]]:
+        """Return (compiled pattern, match) pairs for every PII match in text"""
+        return [
+            (compiled_info, match)
+            for compiled_info in self._candidate_patterns(text)
+            for match in compiled_info['regex'].finditer(text)
+        ]
+
+    def _make_detection(self, compiled_info: Dict, match: Any, text: str,
+                        field_name: str, lower: int = 0,
+                        upper: Optional[int] = None) -> PIIDetection:
+        """Build a detection, clamping its context to text[lower:upper]"""
+        if self.light_mode:
+            context = ""
+        else:
+            upper = len(text) if upper is None else upper
+            start = max(lower, match.start() - 20)
+            end = min(upper, match.end() + 20)
+            context = text[start:end]
 
-            matches = pattern.finditer(str(text))
+        pii_type = compiled_info['type']
 
-            for match in matches:
-                detection = PIIDetection(
-                    timestamp=datetime.utcnow(),
-                    pii_type=pii_type,
-                    field_name=field_name,
-                    original_value=match.group(),
-                    redacted_value=self._mask_value(match.group(), pii_type),
-                    confidence=confidence,
-                    context=text[:max(0, match.start()-20):match.start()+20]
-                )
+        return PIIDetection(
+            timestamp=datetime.utcnow(),
+            pii_type=pii_type,
+            field_name=field_name,
+            original_value=match.group(),
+            redacted_value=self._mask_value(match.group(), pii_type),
+            confidence=compiled_info['confidence'],
+            context=context
+        )
 
-                detections.append(detection)
+    def detect(self, text: str, field_name: str = 'unknown') -> List[PIIDetection]:
+        """Detect PII in text"""
+        text = str(text)
+        detections = [
+            self._make_detection(compiled_info, match, text, field_name)
+            for compiled_info, match in self._scan(text)
+        ]
 
-            self.detections.extend(detections)
+        self.detections.extend(detections)
 
         return detections
 
@@ -176,6 +271,61 @@ class PIIDetector:
             return None, []
 
         detections = self.detect(text, field_name)
+        return self._apply_redactions(text, detections), detections
+
+    def redact_fields(self, fields: List[Tuple[str, str]]) -> Tuple[List[str], List[PIIDetection]]:
+        """Redact several (field_name, text) pairs with a single scan
+
+        The texts are joined with newlines, which patterns only consume as
+        whitespace padding after a keyword. If a match does run across a
+        join, the fields are redacted one at a time instead.
+        """
+        offsets = []
+        position = 0
+        for _, text in fields:
+            offsets.append(position)
+            position += len(text) + 1
+
+        joined = '\n'.join(text for _, text in fields)
+        matches_by_field = [[] for _ in fields]
+
+        for compiled_info, match in self._scan(joined):
+            index = bisect.bisect_right(offsets, match.start()) - 1
+            if match.end() > offsets[index] + len(fields[index][1]):
+                return self._redact_each(fields)
+            matches_by_field[index].append((compiled_info, match))
+
+        redacted_texts = []
+        all_detections = []
+
+        for (field_name, text), offset, matches in zip(fields, offsets, matches_by_field):
+            detections = [
+                self._make_detection(compiled_info, match, joined, field_name,
+                                     lower=offset, upper=offset + len(text))
+                for compiled_info, match in matches
+            ]
+            redacted_texts.append(self._apply_redactions(text, detections))
+            all_detections.extend(detections)
+
+        self.detections.extend(all_detections)
+
+        return redacted_texts, all_detections
+
+    def _redact_each(self, fields: List[Tuple[str, str]]) -> Tuple[List[str], List[PIIDetection]]:
+        """Redact each (field_name, text) pair with its own scan"""
+        redacted_texts = []
+        all_detections = []
+
+        for field_name, text in fields:
+            # Not redact(): every text, empty ones included, comes back as a string
+            detections = self.detect(text, field_name)
+            redacted_texts.append(self._apply_redactions(text, detections))
+            all_detections.extend(detections)
+
+        return redacted_texts, all_detections
+
+    def _apply_redactions(self, text: str, detections: List[PIIDetection]) -> str:
+        """Replace every detected value in text with its masked form"""
         redacted = text
 
         # Sort by position (reverse) to maintain correct indices
@@ -184,47 +334,47 @@ class PIIDetector:
         for detection in sorted_detections:
             redacted = redacted.replace(detection.original_value, detection.redacted_value)
 
-        return redacted, detections
+        return redacted
 
-    def _mask_value(self, value: str, pii_type: PIIType) -> str:
-        """Generate masked value for PII"""
-        if pii_type == PIIType.EMAIL:
+    def _mask_value(self, value: str, pii_type: str) -> str:
+        """Generate masked value for PII (pii_type is a PIIType value)"""
+        if pii_type == 'email':
             parts = value.split('@')
             return f"{parts[0][0]}***@{parts[1]}" if len(parts) > 1 else "***@***"
 
-        elif pii_type == PIIType.CREDIT_CARD:
+        elif pii_type == 'credit_card':
             return f"****-****-****-{value[-4:]}"
 
-        elif pii_type == PIIType.SSN:
+        elif pii_type == 'ssn':
             return "***-**-****"
 
-        elif pii_type == PIIType.PHONE:
+        elif pii_type == 'phone':
             return "***-***-****"
 
-        elif pii_type == PIIType.API_KEY:
+        elif pii_type == 'api_key':
             return f"{value[:6]}...{value[-4:]}" if len(value) > 10 else "[API_KEY]"
 
-        elif pii_type == PIIType.JWT:
+        elif pii_type == 'jwt':
             return "[JWT_TOKEN]"
 
-        elif pii_type == PIIType.PASSWORD:
+        elif pii_type == 'password':
             return "[PASSWORD]"
 
-        elif pii_type == PIIType.DATABASE_URL:
+        elif pii_type == 'database_url':
             # Extract host part
             match = re.search(r'://([^:@/]+)', value)
             host = match.group(1) if match else "***"
             return f"[DATABASE_URL:{host}]"
 
-        elif pii_type == PIIType.OAUTH_TOKEN:
+        elif pii_type == 'oauth_token':
             return "[OAUTH_TOKEN]"
 
-        elif pii_type == PIIType.IP_ADDRESS:
+        elif pii_type == 'ip_address':
             # Return partially masked IP
             parts = value.split('.')
             return f"{parts[0]}.{parts[1]}.***.***.***" if len(parts) == 4 else "[IP_ADDRESS]"
 
-        elif pii_type == PIIType.PRIVATE_KEY:
+        elif pii_type == 'private_key':
             return "[PRIVATE_KEY]"
 
         else:
@@ -239,7 +389,7 @@ class PIIDetector:
         by_field = {}
 
         for detection in recent:
-            pii_type = detection.pii_type.value
+            pii_type = detection.pii_type
             field = detection.field_name
 
             if pii_type not in by_type:
@@ -262,9 +412,12 @@ class PIIDetector:
 class StructuredLogger:
     """Advanced structured logging with PII detection"""
 
-    def __init__(self, service_name: str):
+    def __init__(self, service_name: str, retain_records: bool = True):
         self.service_name = service_name
         self.detector = PIIDetector()
+        # Without retention, entries are serialized straight from the redacted
+        # fields and get_logs()/get_statistics() only see the PII summary.
+        self.retain_records = retain_records
         self.log_buffer: List[LogRecord] = []
         self.handler = logging.StreamHandler()
         self.handler.setFormatter(logging.Formatter('%(message)s'))
@@ -276,46 +429,65 @@ class StructuredLogger:
                          trace_id: Optional[str] = None,
                          span_id: Optional[str] = None) -> LogRecord:
         """Build structured log record"""
-        context = context or {}
-
-        # Redact context values
-        redacted_context = {}
-        pii_detections = []
-
-        for key, value in context.items():
-            if isinstance(value, str):
-                redacted_value, detections = self.detector.redact(value, field_name=key)
-                redacted_context[key] = redacted_value
-                pii_detections.extend(detections)
-            else:
-                redacted_context[key] = value
+        redacted_message, redacted_context, pii_detections = self._redact_fields(message, context)
 
-        # Redact message
-        redacted_message, msg_detections = self.detector.redact(message)
-        pii_detections.extend(msg_detections)
+        timestamp_ns = time.time_ns()
 
         record = LogRecord(
-            timestamp=datetime.utcnow(),
-            level=level,
+            timestamp=datetime.utcfromtimestamp(timestamp_ns / 1e9),
+            level=level.value,
             service=self.service_name,
             message=redacted_message,
             context=redacted_context,
             trace_id=trace_id,
             span_id=span_id,
-            pii_detections=pii_detections
+            pii_detections=pii_detections,
+            level_int=LEVEL_INT[level],
+            timestamp_ns=timestamp_ns
         )
 
         return record
 
+    def _redact_fields(self, message: str,
+                       context: Dict[str, Any] = None) -> Tuple[str, Dict[str, Any], List[PIIDetection]]:
+        """Redact PII from the message and string context values"""
+        context = context or {}
+
+        # Message and string context values share one detector pass
+        fields = [(key, value) for key, value in context.items() if isinstance(value, str)]
+        has_message = isinstance(message, str)
+        if has_message:
+            fields.append(('unknown', message))
+
+        redacted_texts, pii_detections = self.detector.redact_fields(fields)
+
+        redacted_message = redacted_texts.pop() if has_message else message
+        redacted_context = dict(context)
+        for (key, _), redacted_value in zip(fields, redacted_texts):
+            redacted_context[key] = redacted_value
+
+        return redacted_message, redacted_context, pii_detections
+
+    def _log(self, level: LogLevel, message: str, context: Dict[str, Any],
+             error: Optional[Dict] = None):
+        """Redact and emit one entry"""
+        if not self.retain_records:
+            redacted_message, redacted_context, pii_detections = self._redact_fields(message, context)
+            self._emit_fast(level.value, redacted_message, redacted_context,
+                            error=error, pii_count=len(pii_detections))
+            return
+
+        record = self._build_log_record(level, message, context)
+        record.error = error
+        self._emit(record)
+
     def info(self, message: str, **kwargs):
         """Log info level"""
-        record = self._build_log_record(LogLevel.INFO, message, kwargs)
-        self._emit(record)
+        self._log(LogLevel.INFO, message, kwargs)
 
     def warning(self, message: str, **kwargs):
         """Log warning level"""
-        record = self._build_log_record(LogLevel.WARNING, message, kwargs)
-        self._emit(record)
+        self._log(LogLevel.WARNING, message, kwargs)
 
     def error(self, message: str, exception: Exception = None, **kwargs):
         """Log error level"""
@@ -328,14 +500,11 @@ class StructuredLogger:
                 'traceback': traceback.format_exc()
             }
 
-        record = self._build_log_record(LogLevel.ERROR, message, kwargs)
-        record.error = error_dict
-        self._emit(record)
+        self._log(LogLevel.ERROR, message, kwargs, error=error_dict)
 
     def debug(self, message: str, **kwargs):
         """Log debug level"""
-        record = self._build_log_record(LogLevel.DEBUG, message, kwargs)
-        self._emit(record)
+        self._log(LogLevel.DEBUG, message, kwargs)
 
     def critical(self, message: str, exception: Exception = None, **kwargs):
         """Log critical level"""
@@ -347,38 +516,66 @@ class StructuredLogger:
                 'message': str(exception)
             }
 
-        record = self._build_log_record(LogLevel.CRITICAL, message, kwargs)
-        record.error = error_dict
-        self._emit(record)
+        self._log(LogLevel.CRITICAL, message, kwargs, error=error_dict)
 
     def _emit(self, record: LogRecord):
         """Emit log record"""
         self.log_buffer.append(record)
 
         # Convert to JSON
-        json_output = json.dumps(record.to_dict())
-        self.logger.log(getattr(logging, record.level.value), json_output)
+        json_output = _dumps(record.to_dict())
+        self.logger.log(getattr(logging, record.level), json_output)
+
+    def _emit_fast(self, level: str, message: str, context: Dict[str, Any],
+                   error: Optional[Dict] = None,
+                   trace_id: Optional[str] = None,
+                   span_id: Optional[str] = None,
+                   pii_count: int = 0):
+        """Emit already-redacted fields as JSON without building a LogRecord"""
+        json_output = _dumps({
+            'timestamp': datetime.utcnow().isoformat(),
+            'level': level,
+            'service': self.service_name,
+            'message': message,
+            'context': context,
+            'error': error,
+            'trace_id': trace_id,
+            'span_id': span_id,
+            'request_id': None,
+            'user_id': None,
+            'pii_detected': pii_count > 0,
+            'pii_count': pii_count
+        })
+        self.logger.log(getattr(logging, level), json_output)
 
     def get_logs(self, hours: int = 24, level: Optional[LogLevel] = None) -> List[LogRecord]:
         """Get logs from buffer"""
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
-        logs = [r for r in self.log_buffer if r.timestamp >= cutoff]
+        cutoff_ns = time.time_ns() - hours * 3_600_000_000_000
 
         if level:
-            logs = [r for r in logs if r.level == level]
+            wanted = LEVEL_INT[level]
+            return [
+                r for r in self.log_buffer
+                if r.timestamp_ns >= cutoff_ns and r.level_int == wanted
+            ]
 
-        return logs
+        return [r for r in self.log_buffer if r.timestamp_ns >= cutoff_ns]
 
     def get_statistics(self, hours: int = 24) -> Dict:
         """Get logging statistics"""
         logs = self.get_logs(hours)
 
         if not logs:
-            return {'period_hours': hours, 'total_logs': 0}
+            # Detections are tracked even when records are not retained
+            return {
+                'period_hours': hours,
+                'total_logs': 0,
+                'pii_summary': self.detector.get_detection_summary(hours)
+            }
 
         by_level = {}
         for log in logs:
-            level = log.level.value
+            level = log.level
             if level not in by_level:
                 by_level[level] = 0
             by_level[level] += 1
@@ -19,7 +19,7 @@ Performance:
 import json
 import time
 import logging
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, FrozenSet, List, Optional, Protocol, Tuple, Any
 from dataclasses import dataclass, field, asdict
 from enum import Enum
 from datetime import datetime, timedelta
@@ -27,16 +27,69 @@ import hashlib
 import hmac
 import base64
 import uuid
+import array
+import bisect
+import heapq
+import itertools
+import random
+import sys
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 # Async support
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib decoder/encoder
+    orjson = None
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
 
+def _json_loads(data: bytes) -> Any:
+    """Decode JSON bytes"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Encode an object as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+# Response bodies are fixed per status, so encode them once at import
+_OK_BODY = _json_dumps({"status": "ok"})
+_ERROR_BODIES: Dict[int, bytes] = {
+    status_code: _json_dumps({"error": reason})
+    for status_code, reason in (
+        (401, "Unauthorized"),
+        (404, "Not Found"),
+        (429, "Too Many Requests"),
+        (500, "Internal Server Error"),
+        (502, "Bad Gateway"),
+        (503, "Service Unavailable"),
+        (504, "Gateway Timeout"),
+    )
+}
+
+
+# (monotonic millisecond tick, datetime.utcnow() taken during that tick)
+_clock_cache: List[Any] = [-1, None]
+
+
+def _utcnow() -> datetime:
+    """datetime.utcnow() cached per millisecond, shared by all timestamps in that tick"""
+    tick = time.monotonic_ns() // 1_000_000
+    if tick != _clock_cache[0]:
+        _clock_cache[0] = tick
+        _clock_cache[1] = datetime.utcnow()
+    return _clock_cache[1]
+
+
 # ============================================================================
 # Enums & Constants
 # ============================================================================
@@ -72,11 +125,37 @@ class ProtocolType(Enum):
     GRPC = "grpc"
 
 
+# Endpoint health states (ServiceEndpoint.health_state); lower is better
+HEALTH_STATE_HEALTHY = 0
+HEALTH_STATE_DEGRADED = 1
+HEALTH_STATE_UNHEALTHY = 2
+
+# Health score boundaries between the states (0-100 scale)
+HEALTHY_SCORE_THRESHOLD = 80.0
+UNHEALTHY_SCORE_THRESHOLD = 50.0
+
+# Consecutive observations needed before the state moves
+HEALTH_RECOVERY_OBSERVATIONS = 2
+HEALTH_DEGRADE_OBSERVATIONS = 3
+
+# ServiceEndpoint fields whose assignment bumps the endpoint's version counter
+_ENDPOINT_HEALTH_FIELDS = frozenset({"healthy", "health_score", "health_state"})
+
+
+def _health_state_for(score: float) -> int:
+    """Map a health score to a health state without hysteresis"""
+    if score >= HEALTHY_SCORE_THRESHOLD:
+        return HEALTH_STATE_HEALTHY
+    if score > UNHEALTHY_SCORE_THRESHOLD:
+        return HEALTH_STATE_DEGRADED
+    return HEALTH_STATE_UNHEALTHY
+
+
 # ============================================================================
 # Data Classes
 # ============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class RateLimit:
     """Rate limit configuration"""
     requests_per_second: int
@@ -95,7 +174,7 @@ class RateLimit:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class AuthConfig:
     """Authentication configuration"""
     auth_type: AuthType
@@ -103,6 +182,8 @@ class AuthConfig:
 
     # API Key
     api_keys: List[str] = field(default_factory=list)
+    # Hex SHA-256 digests, for deployments that only distribute hashed keys
+    api_key_hashes: List[str] = field(default_factory=list)
 
     # JWT
     jwt_secret: Optional[str] = None
@@ -119,7 +200,7 @@ class AuthConfig:
     client_cert_required: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceEndpoint:
     """Service endpoint configuration"""
     name: str
@@ -130,27 +211,90 @@ class ServiceEndpoint:
     healthy: bool = True
     response_time_ms: float = 0.0
     error_rate: float = 0.0
-    created_at: datetime = field(default_factory=datetime.utcnow)
+    created_at: datetime = field(default_factory=_utcnow)
+
+    # Derived from the metrics above; refreshed by update_metrics()
+    health_score: float = field(init=False, default=100.0)
+    health_state: int = field(init=False, default=HEALTH_STATE_HEALTHY)
+    _pending_state: int = field(init=False, default=HEALTH_STATE_HEALTHY, repr=False)
+    _pending_count: int = field(init=False, default=0, repr=False)
+    # Version counter of the LoadBalancer serving this endpoint, bumped
+    # whenever a field in _ENDPOINT_HEALTH_FIELDS is assigned
+    _version: Optional["_VersionCounter"] = field(init=False, default=None, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in _ENDPOINT_HEALTH_FIELDS:
+            # Unset while __init__ assigns the fields declared before it
+            version = getattr(self, "_version", None)
+            if version is not None:
+                version.value += 1
+
+    def __post_init__(self):
+        self.health_score = self._compute_health_score()
+        self.health_state = _health_state_for(self.health_score)
+        self._pending_state = self.health_state
 
     @property
     def url(self) -> str:
         """Get service URL"""
         return f"{self.protocol.value}://{self.host}:{self.port}"
 
-    @property
-    def health_score(self) -> float:
+    def _compute_health_score(self) -> float:
         """Calculate health score (0-100)"""
         health = 100.0
         health -= min(self.error_rate * 1000, 50)  # Penalize errors
         health -= min(self.response_time_ms / 10, 30)  # Penalize slowness
         return max(health, 0.0)
 
+    def update_metrics(self, response_time_ms: float, error_rate: float) -> bool:
+        """
+        Record new latency/error metrics and refresh the health score
+
+        Assigning health_score takes a new stamp, so load balancers pick
+        up the new weight without being told.
 
-@dataclass
+        The health state only moves after HEALTH_RECOVERY_OBSERVATIONS
+        consecutive updates pointing to a better state, or
+        HEALTH_DEGRADE_OBSERVATIONS pointing to a worse one, so an endpoint
+        near a threshold does not flap.
+
+        Returns:
+            True if health_state changed
+        """
+        self.response_time_ms = response_time_ms
+        self.error_rate = error_rate
+        self.health_score = self._compute_health_score()
+
+        target = _health_state_for(self.health_score)
+        if target == self.health_state:
+            self._pending_state = target
+            self._pending_count = 0
+            return False
+
+        if target == self._pending_state:
+            self._pending_count += 1
+        else:
+            self._pending_state = target
+            self._pending_count = 1
+
+        required = (
+            HEALTH_RECOVERY_OBSERVATIONS if target < self.health_state
+            else HEALTH_DEGRADE_OBSERVATIONS
+        )
+        if self._pending_count < required:
+            return False
+
+        self.health_state = target
+        self._pending_count = 0
+        return True
+
+
+@dataclass(slots=True)
 class Route:
     """API route configuration"""
     path: str
-    methods: List[str]
+    methods: FrozenSet[str]  # any iterable is accepted and frozen
     upstream_service: str
     strip_path: bool = True
     auth_required: bool = True
@@ -163,10 +307,25 @@ class Route:
     circuit_breaker_timeout_sec: int = 60
     tracing_enabled: bool = True
     documentation: str = ""
-    created_at: datetime = field(default_factory=datetime.utcnow)
+    created_at: datetime = field(default_factory=_utcnow)
+
+    # Retry sleep in seconds before attempt i + 1; see refresh_backoff_schedule()
+    backoff_schedule: Tuple[float, ...] = field(init=False, default=(), repr=False)
 
+    def __post_init__(self):
+        # Interned so per-request dict lookups compare by identity first
+        self.methods = frozenset(sys.intern(method.upper()) for method in self.methods)
+        self.refresh_backoff_schedule()
 
-@dataclass
+    def refresh_backoff_schedule(self):
+        """Precompute the exponential retry backoff from the retry settings"""
+        self.backoff_schedule = tuple(
+            self.retry_backoff_ms * (1 << attempt) / 1000.0
+            for attempt in range(self.retry_attempts)
+        )
+
+
+@dataclass(slots=True)
 class ServiceRequest:
     """Incoming service request"""
     request_id: str
@@ -189,7 +348,7 @@ class ServiceRequest:
     span_id: str = field(default_factory=lambda: str(uuid.uuid4()))
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceResponse:
     """Service response"""
     request_id: str
@@ -198,7 +357,7 @@ class ServiceResponse:
     body: Optional[bytes] = None
     error: Optional[str] = None
     response_time_ms: float = 0.0
-    timestamp: datetime = field(default_factory=datetime.utcnow)
+    timestamp: datetime = field(default_factory=_utcnow)
 
     # Tracing
     trace_id: str = ""
@@ -212,12 +371,31 @@ class ServiceResponse:
 class RateLimiter:
     """Sliding window rate limiter"""
 
-    def __init__(self, strategy: RateLimitStrategy = RateLimitStrategy.SLIDING_WINDOW):
-        """Initialize rate limiter"""
+    __slots__ = ("strategy", "max_clients", "buckets", "tokens", "_check")
+
+    def __init__(self, strategy: RateLimitStrategy = RateLimitStrategy.SLIDING_WINDOW,
+                 max_clients: int = 100_000):
+        """
+        Initialize rate limiter
+
+        Args:
+            strategy: Rate limiting strategy
+            max_clients: Clients tracked at once; least recently seen are evicted
+        """
         self.strategy = strategy
-        self.request_history: Dict[str, List[float]] = {}
-        self.tokens: Dict[str, float] = {}
-        self.last_refill: Dict[str, float] = {}
+        self.max_clients = max_clients
+
+        # Per-client state in least-recently-used order (oldest first)
+        # client_id -> (previous minute count, current minute count, current minute index)
+        self.buckets: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+        # client_id -> [tokens, last refill time], updated in place
+        self.tokens: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        # Resolve the strategy once instead of comparing enums per request
+        self._check = {
+            RateLimitStrategy.SLIDING_WINDOW: self._sliding_window_check,
+            RateLimitStrategy.TOKEN_BUCKET: self._token_bucket_check,
+        }.get(strategy, self._allow_all)
 
     def is_allowed(self, client_id: str, limit: RateLimit) -> Tuple[bool, int]:
         """
@@ -226,62 +404,188 @@ class RateLimiter:
         Returns:
             Tuple of (allowed, remaining_requests)
         """
-        now = time.time()
+        return self._check(client_id, limit, time.time())
 
-        if self.strategy == RateLimitStrategy.SLIDING_WINDOW:
-            return self._sliding_window_check(client_id, limit, now)
-        elif self.strategy == RateLimitStrategy.TOKEN_BUCKET:
-            return self._token_bucket_check(client_id, limit, now)
-        else:
-            # Default: allow
-            return True, limit.default_limit
+    def _allow_all(self, client_id: str, limit: RateLimit, now: float) -> Tuple[bool, int]:
+        """Strategies without an implementation allow every request"""
+        return True, limit.default_limit
 
     def _sliding_window_check(self, client_id: str, limit: RateLimit, now: float) -> Tuple[bool, int]:
-        """Sliding window rate limiting"""
-        if client_id not in self.request_history:
-            self.request_history[client_id] = []
+        """
+        Sliding window rate limiting
+
+        Approximates the last 60 seconds from two fixed one-minute counters:
+        the previous minute's count is weighted by how much of it still
+        overlaps the window, plus everything seen in the current minute.
+        """
+        window = int(now // 60)
+        prev_count, curr_count, curr_window = self.buckets.get(client_id, (0, 0, window))
+
+        # Roll the counters forward when a new minute has started
+        if curr_window != window:
+            prev_count = curr_count if window - curr_window == 1 else 0
+            curr_count = 0
 
-        # Remove old requests (outside 1-minute window)
-        window_start = now - 60
-        self.request_history[client_id] = [
-            req_time for req_time in self.request_history[client_id]
-            if req_time > window_start
-        ]
+        elapsed_fraction = (now % 60) / 60.0
+        estimated = prev_count * (1.0 - elapsed_fraction) + curr_count
 
         # Check limit
-        requests_in_window = len(self.request_history[client_id])
-        allowed = requests_in_window < limit.requests_per_minute
+        allowed = estimated < limit.requests_per_minute
 
         if allowed:
-            self.request_history[client_id].append(now)
+            curr_count += 1
+            estimated += 1
+
+        self.buckets[client_id] = (prev_count, curr_count, window)
+        self.buckets.move_to_end(client_id)
 
-        remaining = max(0, limit.requests_per_minute - len(self.request_history[client_id]))
+        while len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+
+        remaining = max(0, limit.requests_per_minute - int(estimated))
 
         return allowed, remaining
 
     def _token_bucket_check(self, client_id: str, limit: RateLimit, now: float) -> Tuple[bool, int]:
         """Token bucket rate limiting"""
-        if client_id not in self.tokens:
-            self.tokens[client_id] = float(limit.default_limit)
-            self.last_refill[client_id] = now
-
-        # Refill tokens
-        time_passed = now - self.last_refill[client_id]
-        refill_rate = limit.default_limit / 60.0  # Per second
-        tokens_to_add = time_passed * refill_rate
-
-        self.tokens[client_id] = min(
-            self.tokens[client_id] + tokens_to_add,
-            float(limit.default_limit + limit.burst_allowed)
-        )
-        self.last_refill[client_id] = now
+        rate = limit.default_limit
+        tokens = self.tokens
+        bucket = tokens.get(client_id)
+        if bucket is None:
+            bucket = tokens[client_id] = [float(rate), now]
+
+            while len(tokens) > self.max_clients:
+                tokens.popitem(last=False)
+        else:
+            tokens.move_to_end(client_id)
+
+        # Refill tokens at default_limit per minute, capped at limit + burst
+        capacity = rate + limit.burst_allowed
+        available = bucket[0] + (now - bucket[1]) * (rate / 60.0)
+        if available > capacity:
+            available = float(capacity)
+        bucket[1] = now
 
         # Check if can consume
-        if self.tokens[client_id] >= 1.0:
-            self.tokens[client_id] -= 1.0
-            return True, int(self.tokens[client_id])
-        else:
-            return False, 0
+        if available >= 1.0:
+            available -= 1.0
+            bucket[0] = available
+            return True, int(available)
+        bucket[0] = available
+        return False, 0
+
+    def sweep_expired(self, now: Optional[float] = None) -> int:
+        """
+        Drop clients idle for two full windows
+
+        Walks each map from its least recently used end and stops at the
+        first client that is still active.
+
+        Returns:
+            Number of client entries removed
+        """
+        now = time.time() if now is None else now
+        window = int(now // 60)
+        removed = 0
+
+        # Both sliding-window counters are zero once two minutes have passed
+        while self.buckets:
+            _, (_, _, client_window) = next(iter(self.buckets.items()))
+            if window - client_window < 2:
+                break
+            self.buckets.popitem(last=False)
+            removed += 1
+
+        # An idle token bucket has refilled; a fresh one starts at default_limit
+        while self.tokens:
+            _, (_, last_refill) = next(iter(self.tokens.items()))
+            if now - last_refill < 120:
+                break
+            self.tokens.popitem(last=False)
+            removed += 1
+
+        return removed
+
+
+class RateLimitBackend(Protocol):
+    """Per-client rate limit check used by the gateway"""
+
+    def is_allowed(self, client_id: str, limit: RateLimit) -> Tuple[bool, int]:
+        ...
+
+
+# Two-counter sliding window, same estimate as RateLimiter._sliding_window_check.
+# KEYS: previous minute counter, current minute counter
+# ARGV: requests per minute, weight of the previous minute
+_REDIS_SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local weight = tonumber(ARGV[2])
+local prev = tonumber(redis.call('GET', KEYS[1]) or 0)
+local curr = tonumber(redis.call('GET', KEYS[2]) or 0)
+local estimated = prev * weight + curr
+if estimated >= limit then
+    return {0, math.max(0, limit - math.floor(estimated))}
+end
+if redis.call('INCR', KEYS[2]) == 1 then
+    redis.call('EXPIRE', KEYS[2], 120)
+end
+return {1, math.max(0, limit - math.floor(estimated + 1))}
+"""
+
+
+class RedisRateLimiter:
+    """
+    Sliding window rate limiter shared by every gateway process
+
+    Counters live in Redis and are checked and incremented by one Lua
+    script, so each request costs a single round trip. If Redis is
+    unreachable, requests are limited per process instead.
+    """
+
+    __slots__ = ("redis", "key_prefix", "fallback", "_script", "_using_fallback")
+
+    def __init__(self, redis_client, key_prefix: str = "gateway:ratelimit:"):
+        """
+        Initialize Redis rate limiter
+
+        Args:
+            redis_client: Synchronous redis-py client
+            key_prefix: Prefix for the per-client counter keys
+        """
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+        self.fallback = RateLimiter()
+        self._script = redis_client.register_script(_REDIS_SLIDING_WINDOW_LUA)
+        # Outages are logged once on entry and once on recovery, not per request
+        self._using_fallback = False
+
+    def is_allowed(self, client_id: str, limit: RateLimit) -> Tuple[bool, int]:
+        """
+        Check if request is allowed
+
+        Returns:
+            Tuple of (allowed, remaining_requests)
+        """
+        now = time.time()
+        window = int(now // 60)
+        # Hash tag keeps both counters on the same cluster slot
+        prefix = f"{self.key_prefix}{{{client_id}}}:"
+
+        try:
+            allowed, remaining = self._script(
+                keys=[f"{prefix}{window - 1}", f"{prefix}{window}"],
+                args=[limit.requests_per_minute, 1.0 - (now % 60) / 60.0],
+            )
+        except Exception as e:
+            if not self._using_fallback:
+                self._using_fallback = True
+                logger.warning(f"Redis rate limit check failed, using local limiter: {e}")
+            return self.fallback.is_allowed(client_id, limit)
+
+        if self._using_fallback:
+            self._using_fallback = False
+            logger.info("Redis rate limit check recovered, leaving local limiter")
+        return bool(allowed), int(remaining)
 
 
 # ============================================================================
@@ -291,9 +595,32 @@ class RateLimiter:
 class AuthenticationManager:
     """Manages authentication for API gateway"""
 
-    def __init__(self, config: AuthConfig):
-        """Initialize authentication manager"""
+    # Validated JWTs without an "exp" claim are trusted from cache this long
+    JWT_CACHE_TTL_SEC = 300
+
+    def __init__(self, config: AuthConfig, jwt_cache_size: int = 50_000):
+        """
+        Initialize authentication manager
+
+        Args:
+            config: Authentication configuration
+            jwt_cache_size: Validated JWTs kept in the LRU cache
+        """
         self.config = config
+        self.jwt_cache_size = jwt_cache_size
+        self._authenticate = {
+            AuthType.API_KEY: self._auth_api_key,
+            AuthType.JWT: self._auth_jwt,
+            AuthType.OAUTH2: self._auth_oauth2,
+            AuthType.MTLS: self._auth_mtls,
+        }.get(config.auth_type, self._auth_reject)
+        # blake2b(token) -> (expires_at, user_id), least recently used first
+        self._jwt_cache: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+        # SHA-256 digests of accepted API keys; raw keys are never compared
+        self._api_key_hashes: FrozenSet[bytes] = frozenset(
+            [hashlib.sha256(key.encode()).digest() for key in config.api_keys]
+            + [bytes.fromhex(digest) for digest in config.api_key_hashes]
+        )
 
     def authenticate(self, request: ServiceRequest) -> Tuple[bool, Optional[str]]:
         """
@@ -305,16 +632,11 @@ class AuthenticationManager:
         if not self.config.enabled:
             return True, None
 
-        if self.config.auth_type == AuthType.API_KEY:
-            return self._auth_api_key(request)
-        elif self.config.auth_type == AuthType.JWT:
-            return self._auth_jwt(request)
-        elif self.config.auth_type == AuthType.OAUTH2:
-            return self._auth_oauth2(request)
-        elif self.config.auth_type == AuthType.MTLS:
-            return self._auth_mtls(request)
-        else:
-            return False, None
+        return self._authenticate(request)
+
+    def _auth_reject(self, request: ServiceRequest) -> Tuple[bool, Optional[str]]:
+        """Auth types without a handler (e.g. NONE on a protected route) reject"""
+        return False, None
 
     def _auth_api_key(self, request: ServiceRequest) -> Tuple[bool, Optional[str]]:
         """API Key authentication"""
@@ -323,7 +645,8 @@ class AuthenticationManager:
         if not api_key:
             return False, None
 
-        if api_key in self.config.api_keys:
+        # Set lookup on the digest: O(1) and independent of where a key matches
+        if hashlib.sha256(api_key.encode()).digest() in self._api_key_hashes:
             return True, api_key[:8] + "*" * 4
 
         return False, None
@@ -336,25 +659,49 @@ class AuthenticationManager:
             return False, None
 
         token = auth_header[7:]
+        now = time.time()
+
+        token_bytes = token.encode()
+        cache_key = hashlib.blake2b(token_bytes, digest_size=16).digest()
+        cached = self._jwt_cache.get(cache_key)
+        if cached is not None:
+            expires_at, user_id = cached
+            if now < expires_at:
+                self._jwt_cache.move_to_end(cache_key)
+                return True, user_id
+            del self._jwt_cache[cache_key]
 
         try:
             # Simplified JWT validation
-            parts = token.split(".")
+            parts = token_bytes.split(b".")
             if len(parts) != 3:
                 return False, None
 
-            payload = json.loads(
-                base64.urlsafe_b64decode(parts[1] + "==")
+            segment = parts[1]
+            payload = _json_loads(
+                base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
             )
 
             # Verify signature would be done here
             if "sub" in payload:
+                self._cache_jwt(cache_key, payload, now)
                 return True, payload["sub"]
 
             return False, None
         except Exception:
             return False, None
 
+    def _cache_jwt(self, cache_key: bytes, payload: Dict[str, Any], now: float):
+        """Remember a validated token until its expiry or the cache TTL"""
+        expires_at = now + self.JWT_CACHE_TTL_SEC
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, float(payload["exp"]))
+
+        self._jwt_cache[cache_key] = (expires_at, payload["sub"])
+
+        while len(self._jwt_cache) > self.jwt_cache_size:
+            self._jwt_cache.popitem(last=False)
+
     def _auth_oauth2(self, request: ServiceRequest) -> Tuple[bool, Optional[str]]:
         """OAuth2 authentication"""
         auth_header = request.headers.get("Authorization", "")
@@ -391,6 +738,11 @@ class AuthenticationManager:
 class CircuitBreaker:
     """Circuit breaker for service resilience"""
 
+    __slots__ = (
+        "state", "failure_count", "failure_threshold", "timeout_sec",
+        "last_failure_ns", "_timeout_ns"
+    )
+
     def __init__(self, failure_threshold: int = 5, timeout_sec: int = 60):
         """
         Initialize circuit breaker
@@ -403,38 +755,44 @@ class CircuitBreaker:
         self.failure_count = 0
         self.failure_threshold = failure_threshold
         self.timeout_sec = timeout_sec
-        self.last_failure_time = None
+        # Monotonic nanoseconds: integer compares, immune to wall-clock jumps
+        self.last_failure_ns = 0
+        self._timeout_ns = int(timeout_sec * 1_000_000_000)
 
     def record_success(self):
         """Record successful request"""
-        if self.state == CircuitBreakerState.HALF_OPEN:
+        state = self.state
+        if state is CircuitBreakerState.CLOSED:
+            # Healthy steady state: nothing to write
+            if self.failure_count:
+                self.failure_count -= 1
+        elif state is CircuitBreakerState.HALF_OPEN:
             self.state = CircuitBreakerState.CLOSED
             self.failure_count = 0
-        elif self.state == CircuitBreakerState.CLOSED:
-            self.failure_count = max(0, self.failure_count - 1)
 
     def record_failure(self):
         """Record failed request"""
         self.failure_count += 1
-        self.last_failure_time = time.time()
+        self.last_failure_ns = time.monotonic_ns()
 
         if self.failure_count >= self.failure_threshold:
             self.state = CircuitBreakerState.OPEN
 
     def can_execute(self) -> bool:
         """Check if request can be executed"""
-        if self.state == CircuitBreakerState.CLOSED:
+        state = self.state
+        if state is CircuitBreakerState.CLOSED:
             return True
 
-        if self.state == CircuitBreakerState.OPEN:
+        if state is CircuitBreakerState.OPEN:
             # Check if timeout has passed
-            if time.time() - self.last_failure_time > self.timeout_sec:
+            if time.monotonic_ns() - self.last_failure_ns > self._timeout_ns:
                 self.state = CircuitBreakerState.HALF_OPEN
                 return True
             return False
 
         # HALF_OPEN: allow request to test recovery
-        return self.state == CircuitBreakerState.HALF_OPEN
+        return state is CircuitBreakerState.HALF_OPEN
 
     @property
     def is_open(self) -> bool:
@@ -446,9 +804,23 @@ class CircuitBreaker:
 # Service Discovery & Load Balancing
 # ============================================================================
 
+class _VersionCounter:
+    """Health version of the endpoints served by one LoadBalancer"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
 class LoadBalancer:
     """Load balancer for service endpoints"""
 
+    __slots__ = (
+        "strategy", "round_robin_index", "connection_count",
+        "_version", "_healthy_cache", "_connection_heap", "_heap_positions"
+    )
+
     def __init__(self, strategy: str = "round_robin"):
         """
         Initialize load balancer
@@ -459,15 +831,95 @@ class LoadBalancer:
         self.strategy = strategy
         self.round_robin_index = 0
         self.connection_count: Dict[str, int] = {}
+        # Attached to each endpoint served; endpoints bump it on health changes
+        self._version = _VersionCounter()
+        # (endpoint list, its length, version, healthy endpoints, cumulative health scores)
+        self._healthy_cache: Optional[Tuple[List[ServiceEndpoint], int, int, List[ServiceEndpoint], List[float]]] = None
+        # Min-heap of (connection count, index into the cached healthy list).
+        # Entries are checked against connection_count when they reach the top.
+        self._connection_heap: Optional[List[Tuple[int, int]]] = None
+        self._heap_positions: Dict[str, List[int]] = {}
+
+    def invalidate(self):
+        """
+        Drop cached health data. Health changes on the endpoints are picked up
+        without it; call it after replacing entries of the endpoint list in place.
+        """
+        self._version.value += 1
+        self._healthy_cache = None
+        self._connection_heap = None
+
+    def acquire(self, endpoint: ServiceEndpoint):
+        """Count a connection opened to endpoint"""
+        self.connection_count[endpoint.name] = self.connection_count.get(endpoint.name, 0) + 1
+
+    def release(self, endpoint: ServiceEndpoint):
+        """Count a connection to endpoint as closed"""
+        count = max(0, self.connection_count.get(endpoint.name, 0) - 1)
+        self.connection_count[endpoint.name] = count
+
+        # A lower count would otherwise stay hidden behind the stale entry
+        heap = self._connection_heap
+        if heap is not None:
+            for index in self._heap_positions.get(endpoint.name, ()):
+                heapq.heappush(heap, (count, index))
+
+    def _least_connections(self, healthy_endpoints: List[ServiceEndpoint]) -> ServiceEndpoint:
+        """Pop stale heap entries until the top matches connection_count"""
+        counts = self.connection_count
+        heap = self._connection_heap
+
+        if heap is None or len(heap) > 2 * len(healthy_endpoints):
+            heap = [(counts.get(e.name, 0), i) for i, e in enumerate(healthy_endpoints)]
+            heapq.heapify(heap)
+            self._connection_heap = heap
+            self._heap_positions = {}
+            for i, e in enumerate(healthy_endpoints):
+                self._heap_positions.setdefault(e.name, []).append(i)
+
+        while True:
+            count, index = heap[0]
+            current = counts.get(healthy_endpoints[index].name, 0)
+            if current == count:
+                return healthy_endpoints[index]
+            heapq.heapreplace(heap, (current, index))
+
+    def _healthy_endpoints(self, endpoints: List[ServiceEndpoint]) -> Tuple[List[ServiceEndpoint], List[float]]:
+        """Return healthy endpoints and their cumulative health-score weights"""
+        version = self._version
+        cache = self._healthy_cache
+        if (cache is not None and cache[2] == version.value
+                and cache[0] is endpoints and cache[1] == len(endpoints)):
+            return cache[3], cache[4]
+
+        healthy_endpoints = []
+        weights = []
+        for e in endpoints:
+            # Health changes on e now bump this balancer's version
+            e._version = version
+            if e.healthy and e.health_state < HEALTH_STATE_UNHEALTHY:
+                healthy_endpoints.append(e)
+                weights.append(e.health_score)
+
+        cumulative = list(itertools.accumulate(weights))
+        # Holding the list keeps its identity from being reused by another list
+        self._healthy_cache = (endpoints, len(endpoints), version.value, healthy_endpoints, cumulative)
+        self._connection_heap = None
+        return healthy_endpoints, cumulative
 
     def select_endpoint(self, endpoints: List[ServiceEndpoint]) -> Optional[ServiceEndpoint]:
         """
         Select endpoint based on strategy
 
+        Health filtering and weights are cached until a different list is
+        passed, the list grows or shrinks, or an endpoint's health flag or
+        score changes. An endpoint reports health changes to the balancer
+        that last served it, so don't share endpoint objects between balancers.
+
         Returns:
             Selected endpoint or None if all unhealthy
         """
-        healthy_endpoints = [e for e in endpoints if e.healthy and e.health_score > 50]
+        healthy_endpoints, cumulative = self._healthy_endpoints(endpoints)
 
         if not healthy_endpoints:
             return None
@@ -478,32 +930,19 @@ class LoadBalancer:
             return endpoint
 
         elif self.strategy == "weighted":
-            # Weighted by health score
-            total_weight = sum(e.health_score for e in healthy_endpoints)
+            # Weighted by health score: binary search the cumulative weights
+            total_weight = cumulative[-1]
             if total_weight == 0:
                 return healthy_endpoints[0]
 
-            import random
             pick = random.uniform(0, total_weight)
-            current = 0
-            for endpoint in healthy_endpoints:
-                current += endpoint.health_score
-                if pick <= current:
-                    return endpoint
-
-            return healthy_endpoints[-1]
+            index = bisect.bisect_left(cumulative, pick)
+            return healthy_endpoints[min(index, len(healthy_endpoints) - 1)]
 
         elif self.strategy == "least_connections":
-            min_connections = min(
-                self.connection_count.get(e.name, 0) for e in healthy_endpoints
-            )
-            return next(
-                e for e in healthy_endpoints
-                if self.connection_count.get(e.name, 0) == min_connections
-            )
+            return self._least_connections(healthy_endpoints)
 
         else:  # random
-            import random
             return random.choice(healthy_endpoints)
 
 
@@ -511,6 +950,31 @@ class LoadBalancer:
 # Main API Gateway
 # ============================================================================
 
+# Slots in APIGateway._metrics
+_METRIC_REQUESTS, _METRIC_SUCCESSES, _METRIC_ERRORS, _METRIC_RESPONSE_TIME_NS = range(4)
+
+
+def _metric_property(index: int, doc: str) -> property:
+    """Expose one APIGateway._metrics slot as a read/write attribute"""
+    def getter(self) -> int:
+        return self._metrics[index]
+
+    def setter(self, value: int):
+        self._metrics[index] = value
+
+    return property(getter, setter, doc=doc)
+
+
+def _path_segments(path: str) -> List[str]:
+    """Split a URL path into its non-empty segments"""
+    return [segment for segment in path.split("/") if segment]
+
+
+def _new_route_node() -> Dict[str, Dict]:
+    """Create a route trie node"""
+    return {"children": {}, "methods": {}}
+
+
 class APIGateway:
     """
     Production-grade API Gateway
@@ -526,23 +990,36 @@ class APIGateway:
     - Automatic request routing
     """
 
-    def __init__(self):
-        """Initialize API gateway"""
+    def __init__(self, rate_limit_backend: Optional[RateLimitBackend] = None):
+        """
+        Initialize API gateway
+
+        Args:
+            rate_limit_backend: Shared limiter such as RedisRateLimiter;
+                defaults to an in-process RateLimiter
+        """
         self.routes: Dict[str, Route] = {}
+        # Path-segment trie; ":param" segments share the "*" child
+        self._route_trie = _new_route_node()
+        # method -> canonical literal path -> route, checked before the trie
+        self._routes_by_method: Dict[str, Dict[str, Route]] = {}
         self.services: Dict[str, List[ServiceEndpoint]] = {}
         self.auth_config: Dict[str, AuthConfig] = {}
+        self.auth_managers: Dict[str, AuthenticationManager] = {}
         self.rate_limiters: Dict[str, RateLimiter] = {}
         self.circuit_breakers: Dict[str, CircuitBreaker] = {}
         self.load_balancers: Dict[str, LoadBalancer] = {}
 
-        # Metrics
-        self.request_count = 0
-        self.success_count = 0
-        self.error_count = 0
-        self.total_response_time = 0.0
+        # Metrics: one contiguous int64 block indexed by the _METRIC_* slots
+        self._metrics = array.array("q", [0, 0, 0, 0])
 
         # Default rate limiter
-        self.default_rate_limiter = RateLimiter()
+        self.default_rate_limiter: RateLimitBackend = rate_limit_backend or RateLimiter()
+
+        # Used for services without an explicit auth config
+        self.default_auth_manager = AuthenticationManager(
+            AuthConfig(auth_type=AuthType.API_KEY, enabled=True)
+        )
 
         logger.info("API Gateway initialized")
 
@@ -553,17 +1030,81 @@ class APIGateway:
         self.load_balancers[name] = LoadBalancer("weighted")
         logger.info(f"Registered service: {name} with {len(endpoints)} endpoints")
 
+    def register_endpoint(self, service: str, endpoint: ServiceEndpoint):
+        """Add an endpoint to a registered service"""
+        self.services[service].append(endpoint)
+        self.load_balancers[service].invalidate()
+
+    def deregister_endpoint(self, service: str, index: int) -> ServiceEndpoint:
+        """Remove an endpoint from a registered service and return it"""
+        endpoint = self.services[service].pop(index)
+        endpoint._version = None
+        self.load_balancers[service].invalidate()
+        return endpoint
+
     def register_route(self, route: Route):
         """Register API route"""
         route_key = f"{route.path}:{','.join(sorted(route.methods))}"
         self.routes[route_key] = route
+        # Retry settings may have been edited since the route was built
+        route.refresh_backoff_schedule()
+
+        segments = _path_segments(route.path)
+        node = self._route_trie
+        for segment in segments:
+            key = "*" if segment.startswith(":") else segment
+            node = node["children"].setdefault(key, _new_route_node())
+
+        for method in route.methods:
+            node["methods"][method] = route
+
+        # Paths without parameters can also be matched with a plain dict lookup
+        if not any(segment.startswith(":") for segment in segments):
+            path = "/" + "/".join(segments)
+            for method in route.methods:
+                self._routes_by_method.setdefault(method, {})[path] = route
+
         logger.info(f"Registered route: {route_key} -> {route.upstream_service}")
 
+    def mark_endpoint_unhealthy(self, service: str, index: int):
+        """Take a service endpoint out of load balancing"""
+        self.services[service][index].healthy = False
+
+    def mark_endpoint_healthy(self, service: str, index: int):
+        """Return a service endpoint to load balancing"""
+        self.services[service][index].healthy = True
+
+    def update_endpoint_metrics(self, service: str, index: int,
+                                response_time_ms: float, error_rate: float) -> bool:
+        """
+        Feed observed metrics to a service endpoint
+
+        Returns:
+            True if the endpoint's health state changed
+        """
+        return self.services[service][index].update_metrics(response_time_ms, error_rate)
+
     def set_auth_config(self, service: str, config: AuthConfig):
         """Set authentication configuration for service"""
         self.auth_config[service] = config
+        self.auth_managers[service] = AuthenticationManager(config)
         logger.info(f"Set auth config for service: {service} ({config.auth_type.value})")
 
+    async def handle_requests(self, requests: List[ServiceRequest]) -> List[ServiceResponse]:
+        """
+        Handle a batch of requests concurrently
+
+        handle_request turns every failure into an error response, so one
+        failing request never cancels the rest of the group.
+
+        Returns:
+            Responses in the same order as requests
+        """
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(self.handle_request(request)) for request in requests]
+
+        return [task.result() for task in tasks]
+
     async def handle_request(self, request: ServiceRequest) -> ServiceResponse:
         """
         Handle incoming request
@@ -571,8 +1112,9 @@ class APIGateway:
         Returns:
             ServiceResponse with routing and processing results
         """
-        start_time = time.time()
-        self.request_count += 1
+        start_ns = time.perf_counter_ns()
+        metrics = self._metrics
+        metrics[_METRIC_REQUESTS] += 1
 
         try:
             # Find matching route
@@ -584,11 +1126,9 @@ class APIGateway:
 
             # Authenticate if required
             if route.auth_required:
-                auth_config = self.auth_config.get(
-                    route.upstream_service,
-                    AuthConfig(auth_type=AuthType.API_KEY, enabled=True)
+                auth_mgr = self.auth_managers.get(
+                    route.upstream_service, self.default_auth_manager
                 )
-                auth_mgr = AuthenticationManager(auth_config)
                 authenticated, user_id = auth_mgr.authenticate(request)
 
                 if not authenticated:
@@ -621,16 +1161,16 @@ class APIGateway:
             response = await self._route_request(request, route)
 
             # Record metrics
-            response_time = (time.time() - start_time) * 1000
-            response.response_time_ms = response_time
-            self.total_response_time += response_time
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            response.response_time_ms = elapsed_ns / 1_000_000
+            metrics[_METRIC_RESPONSE_TIME_NS] += elapsed_ns
 
             if response.status_code < 400:
-                self.success_count += 1
+                metrics[_METRIC_SUCCESSES] += 1
                 if service_cb:
                     service_cb.record_success()
             else:
-                self.error_count += 1
+                metrics[_METRIC_ERRORS] += 1
                 if service_cb:
                     service_cb.record_failure()
 
@@ -641,21 +1181,36 @@ class APIGateway:
             return self._create_error_response(request, 500, str(e))
 
     def _find_route(self, request: ServiceRequest) -> Optional[Route]:
-        """Find matching route for request"""
-        path = request.path
-        method = request.method
+        """
+        Find matching route for request
 
-        # Exact match
-        exact_key = f"{path}:{method}"
-        if exact_key in self.routes:
-            return self.routes[exact_key]
+        Walks the route trie one path segment at a time and returns the
+        deepest (longest-prefix) route registered for the request method.
+        Literal segments take precedence over ":param" segments.
+        """
+        method = request.method
 
-        # Prefix match
-        for route in self.routes.values():
-            if path.startswith(route.path) and method in route.methods:
+        # Exact match on a registered literal path skips the trie walk
+        by_path = self._routes_by_method.get(method)
+        if by_path is not None:
+            route = by_path.get(request.path)
+            if route is not None:
                 return route
 
-        return None
+        node = self._route_trie
+        match = node["methods"].get(method)
+
+        for segment in _path_segments(request.path):
+            children = node["children"]
+            node = children.get(segment) or children.get("*")
+            if node is None:
+                break
+
+            route = node["methods"].get(method)
+            if route is not None:
+                match = route
+
+        return match
 
     async def _route_request(self, request: ServiceRequest, route: Route) -> ServiceResponse:
         """Route request to upstream service with retries"""
@@ -678,17 +1233,22 @@ class APIGateway:
                     return self._create_error_response(request, 503, "No healthy endpoints")
 
                 # Send request (simulated)
-                response = await self._send_to_endpoint(request, endpoint, route)
+                load_balancer.acquire(endpoint)
+                try:
+                    response = await self._send_to_endpoint(request, endpoint, route)
+                finally:
+                    load_balancer.release(endpoint)
 
                 if response.status_code < 500:
                     return response
 
                 last_error = response.error
 
-                # Exponential backoff before retry
+                # Exponential backoff before retry; sub-millisecond waits
+                # just yield to the event loop instead of arming a timer
                 if attempt < route.retry_attempts - 1:
-                    backoff = route.retry_backoff_ms * (2 ** attempt)
-                    await asyncio.sleep(backoff / 1000.0)
+                    backoff = route.backoff_schedule[attempt]
+                    await asyncio.sleep(backoff if backoff >= 0.001 else 0)
 
             except Exception as e:
                 last_error = str(e)
@@ -708,7 +1268,6 @@ class APIGateway:
             await asyncio.sleep(endpoint.response_time_ms / 1000.0)
 
             if endpoint.error_rate > 0:
-                import random
                 if random.random() < endpoint.error_rate:
                     return self._create_error_response(
                         request, 500, "Simulated endpoint error"
@@ -717,7 +1276,7 @@ class APIGateway:
             return ServiceResponse(
                 request_id=request.request_id,
                 status_code=200,
-                body=b'{"status":"ok"}',
+                body=_OK_BODY,
                 trace_id=request.trace_id,
                 span_id=request.span_id
             )
@@ -727,31 +1286,48 @@ class APIGateway:
 
     def _create_error_response(self, request: ServiceRequest,
                                status_code: int, error_msg: str) -> ServiceResponse:
-        """Create error response"""
+        """Create error response (detail in error, shared pre-encoded body)"""
         return ServiceResponse(
             request_id=request.request_id,
             status_code=status_code,
+            body=_ERROR_BODIES.get(status_code),
             error=error_msg,
             trace_id=request.trace_id,
             span_id=request.span_id
         )
 
+    request_count = _metric_property(_METRIC_REQUESTS, "Requests handled")
+    success_count = _metric_property(_METRIC_SUCCESSES, "Requests answered below 400")
+    error_count = _metric_property(_METRIC_ERRORS, "Requests answered with 400 or above")
+    total_response_time_ns = _metric_property(_METRIC_RESPONSE_TIME_NS, "Total response time in nanoseconds")
+
+    @property
+    def total_response_time(self) -> float:
+        """Total response time in milliseconds"""
+        return self.total_response_time_ns / 1_000_000
+
+    @total_response_time.setter
+    def total_response_time(self, value_ms: float):
+        self.total_response_time_ns = int(value_ms * 1_000_000)
+
     def get_metrics(self) -> Dict[str, Any]:
         """Get gateway metrics"""
+        request_count, success_count, error_count, response_time_ns = self._metrics
+
         avg_response_time = (
-            self.total_response_time / self.request_count
-            if self.request_count > 0 else 0
+            response_time_ns / 1_000_000 / request_count
+            if request_count > 0 else 0
         )
 
         success_rate = (
-            (self.success_count / self.request_count * 100)
-            if self.request_count > 0 else 0
+            (success_count / request_count * 100)
+            if request_count > 0 else 0
         )
 
         return {
-            "request_count": self.request_count,
-            "success_count": self.success_count,
-            "error_count": self.error_count,
+            "request_count": request_count,
+            "success_count": success_count,
+            "error_count": error_count,
             "success_rate": success_rate,
             "average_response_time_ms": avg_response_time,
             "services_count": len(self.services),
@@ -766,7 +1342,7 @@ class APIGateway:
         """Health check endpoint"""
         return {
             "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _utcnow().isoformat(),
             "services": {
                 name: {
                     "endpoints_count": len(endpoints),
@@ -781,6 +1357,25 @@ class APIGateway:
         }
 
 
-def create_api_gateway() -> APIGateway:
+def create_api_gateway(rate_limit_backend: Optional[RateLimitBackend] = None) -> APIGateway:
     """Factory function to create API gateway"""
-    return APIGateway()
+    return APIGateway(rate_limit_backend)
+
+
+def install_uvloop() -> bool:
+    """
+    Use uvloop for new asyncio event loops if it is installed
+
+    Call once at process start, before the gateway's event loop is created.
+
+    Returns:
+        True if the uvloop policy was installed
+    """
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop")
+        return False
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
@@ -8,13 +8,76 @@ Date: November 21, 2024
 import logging
 import numpy as np
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+from joblib import Parallel, delayed
+from scipy.special import expit
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble._forest import BaseForest
 from sklearn.preprocessing import StandardScaler
-from scipy.stats import entropy
+
+try:
+    import faiss
+except ImportError:  # optional: exact sklearn k-NN is used instead
+    faiss = None
 
 logger = logging.getLogger(__name__)
 
+# Below this many samples an exact k-NN search is cheaper than building an HNSW index
+FAISS_MIN_SAMPLES = 10_000
+
+
+def _topk_indices(scores: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """
+    Indices of the k largest (or smallest) scores, in no particular order.
+    O(n) selection instead of a full sort; k is clamped to len(scores).
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    if largest:
+        return np.argpartition(scores, -k)[-k:]
+    return np.argpartition(scores, k - 1)[:k]
+
+
+def _entropy(proba: np.ndarray) -> np.ndarray:
+    """Shannon entropy (nats) of each row of a probability matrix"""
+    return -np.einsum('ij,ij->i', proba, np.log(np.clip(proba, 1e-12, 1.0)))
+
+
+def _binary_entropy(p: np.ndarray) -> np.ndarray:
+    """Entropy (nats) of Bernoulli(p), without building the two-column matrix"""
+    q = 1.0 - p
+    return -(p * np.log(np.maximum(p, 1e-12)) + q * np.log(np.maximum(q, 1e-12)))
+
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    """Zero-mean, unit-variance copy of a 1-D array (StandardScaler semantics)"""
+    std = values.std()
+    return (values - values.mean()) / (std if std > np.finfo(values.dtype).eps else 1.0)
+
+
+def _knn_distances(X: np.ndarray, k: int) -> np.ndarray:
+    """
+    Euclidean distances from each row of X to its k nearest rows.
+    The first column is the row itself (distance ~0).
+    """
+    if faiss is not None and len(X) >= FAISS_MIN_SAMPLES:
+        data = np.ascontiguousarray(X, dtype=np.float32)
+        index = faiss.IndexHNSWFlat(data.shape[1], 32)
+        index.hnsw.efConstruction = 40
+        index.add(data)
+        squared, _ = index.search(data, k)
+        # FAISS reports squared L2 distances
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    # sklearn already uses a KD-tree or a chunked GEMM + top-k reduction;
+    # spread the query chunks over all cores
+    from sklearn.neighbors import NearestNeighbors
+    nbrs = NearestNeighbors(n_neighbors=k, n_jobs=-1)
+    nbrs.fit(X)
+    distances, _ = nbrs.kneighbors(X)
+    return distances
+
 
 class ActiveLearningSelector:
     """Select hard cases from unlabeled data for efficient labeling"""
@@ -23,10 +86,28 @@ class ActiveLearningSelector:
         self.model = model
         self.scaler = scaler
         self.selection_strategy = 'uncertainty'
+        # (X, shape, model, proba) of the last predict_proba call
+        self._proba_cache: Optional[Tuple] = None
 
     def set_model(self, model):
         """Set the base model for uncertainty estimation"""
         self.model = model
+        self._proba_cache = None
+
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        predict_proba, reused while the same array and model are passed again.
+        Arrays are matched by identity, so don't modify X in place between calls.
+        """
+        cache = self._proba_cache
+        if (cache is not None and cache[0] is X and cache[1] == X.shape
+                and cache[2] is self.model):
+            return cache[3]
+
+        proba = self.model.predict_proba(X)
+        # Holding X keeps its identity from being reused by another array
+        self._proba_cache = (X, X.shape, self.model, proba)
+        return proba
 
     def set_scaler(self, scaler):
         """Set the feature scaler"""
@@ -43,21 +124,16 @@ class ActiveLearningSelector:
 
         logger.info(f"Uncertainty sampling: selecting {n_select} samples...")
 
-        # Get prediction probabilities
+        # Calculate entropy of the predicted distribution for each sample
         if hasattr(self.model, 'predict_proba'):
-            proba = self.model.predict_proba(X_unlabeled)
+            uncertainties = _entropy(self._predict_proba(X_unlabeled))
         else:
             logger.warning("Model does not support predict_proba. Using decision_function.")
-            decision = self.model.decision_function(X_unlabeled)
-            # Convert to probability-like scores
-            proba = 1 / (1 + np.exp(-decision))
-            proba = np.column_stack([1 - proba, proba])
-
-        # Calculate entropy for each sample
-        uncertainties = entropy(proba.T)
+            # Binary decision scores -> P(y=1)
+            uncertainties = _binary_entropy(expit(self.model.decision_function(X_unlabeled)))
 
         # Select top n samples with highest uncertainty
-        top_indices = np.argsort(uncertainties)[-n_select:]
+        top_indices = _topk_indices(uncertainties, n_select)
 
         logger.info(f"Selected {len(top_indices)} samples with highest uncertainty")
         return top_indices.tolist()
@@ -71,13 +147,16 @@ class ActiveLearningSelector:
         """
         logger.info(f"Margin sampling: selecting {n_select} samples...")
 
-        proba = self.model.predict_proba(X_unlabeled)
-
         # Calculate margin for binary classification
-        margins = np.abs(proba[:, 0] - proba[:, 1])
+        if hasattr(self.model, 'predict_proba'):
+            proba = self._predict_proba(X_unlabeled)
+            margins = np.abs(proba[:, 0] - proba[:, 1])
+        else:
+            logger.warning("Model does not support predict_proba. Using decision_function.")
+            margins = np.abs(2.0 * expit(self.model.decision_function(X_unlabeled)) - 1.0)
 
         # Select samples with smallest margins (lowest confidence)
-        top_indices = np.argsort(margins)[:n_select]
+        top_indices = _topk_indices(margins, n_select, largest=False)
 
         logger.info(f"Selected {len(top_indices)} samples with smallest margin")
         return top_indices.tolist()
@@ -86,22 +165,29 @@ class ActiveLearningSelector:
                           models: List, n_select: int = 100) -> List[int]:
         """
         Ensemble-based active learning.
-        Select samples where committee models disagree the most.
+        Select samples where committee models disagree the most,
+        measured as the entropy of the committee's votes.
         """
         logger.info(f"Query by committee: selecting {n_select} samples...")
 
-        predictions = []
-        for model in models:
-            pred = model.predict(X_unlabeled)
-            predictions.append(pred)
+        # Members predict concurrently; sklearn's tree traversal releases the GIL
+        predictions = np.stack(Parallel(n_jobs=-1, prefer='threads')(
+            delayed(model.predict)(X_unlabeled) for model in models
+        ))
 
-        predictions = np.array(predictions)
+        # Vote share of each predicted class per sample
+        _, codes = np.unique(predictions, return_inverse=True)
+        codes = codes.reshape(predictions.shape)
+        n_samples = codes.shape[1]
+        votes = np.zeros((n_samples, codes.max() + 1))
+        rows = np.arange(n_samples)
+        for member_codes in codes:
+            votes[rows, member_codes] += 1
 
-        # Calculate disagreement (variance across predictions)
-        disagreement = np.var(predictions, axis=0)
+        disagreement = _entropy(votes / len(models))
 
         # Select samples with highest disagreement
-        top_indices = np.argsort(disagreement)[-n_select:]
+        top_indices = _topk_indices(disagreement, n_select)
 
         logger.info(f"Selected {len(top_indices)} samples with highest disagreement")
         return top_indices.tolist()
@@ -112,32 +198,44 @@ class ActiveLearningSelector:
                              n_select: int = 100) -> List[int]:
         """
         Select samples that would most change the model if labeled.
-        For each candidate sample, estimate model parameters with/without it.
+        Approximates refitting with each candidate added: in every tree the
+        candidate joins one leaf, shifting that leaf's class distribution by
+        (onehot(label) - p_leaf) / (leaf_size + 1). The score is the largest
+        resulting change in the forest's prediction over all candidate labels.
         """
         logger.info(f"Expected model change: selecting {n_select} samples...")
 
-        current_weights = self.model.feature_importances_ if hasattr(self.model, 'feature_importances_') else None
+        # Only forests have one (n_samples, n_trees) leaf matrix from apply();
+        # boosted ensembles return one column per class and stage
+        estimators = getattr(self.model, 'estimators_', None)
 
-        if current_weights is None:
-            logger.warning("Model does not have feature_importances. Falling back to uncertainty.")
+        if not isinstance(self.model, BaseForest) or estimators is None:
+            logger.warning("Model is not a fitted random forest. Falling back to uncertainty.")
             return self.uncertainty_sampling(X_unlabeled, n_select)
 
-        changes = []
-        for i in range(min(1000, len(X_unlabeled))):  # Sample for efficiency
-            # Add this sample to labeled set
-            X_temp = np.vstack([X_labeled, X_unlabeled[i:i+1]])
-            y_temp = np.append(y_labeled, np.random.randint(0, 2))
-
-            # Train temporary model
-            temp_model = RandomForestClassifier(n_estimators=10, random_state=42)
-            temp_model.fit(X_temp, y_temp)
-
-            # Calculate change in model
-            weight_change = np.sum(np.abs(current_weights - temp_model.feature_importances_))
-            changes.append(weight_change)
-
-        changes = np.array(changes)
-        top_indices = np.argsort(changes)[-n_select:]
+        leaves = self.model.apply(X_unlabeled)  # (n_samples, n_trees)
+        n_samples, n_trees = leaves.shape
+
+        # weights[i, t] = 1 / (size of the leaf candidate i reaches in tree t + 1)
+        # shifted[i] = sum over trees of weights * leaf class distribution
+        weights = np.empty((n_samples, n_trees))
+        shifted = 0.0
+        for t, estimator in enumerate(estimators):
+            tree = estimator.tree_
+            leaf_values = tree.value[:, 0, :]
+            leaf_dist = leaf_values / leaf_values.sum(axis=1, keepdims=True)
+            weights[:, t] = 1.0 / (tree.n_node_samples[leaves[:, t]] + 1)
+            shifted = shifted + weights[:, t, None] * leaf_dist[leaves[:, t]]
+
+        # ||W * onehot(c) - shifted||^2 = ||shifted||^2 + W^2 - 2 W shifted[c],
+        # largest for the class the forest currently finds least likely
+        total_weight = weights.sum(axis=1)
+        sq_change = (np.einsum('ij,ij->i', shifted, shifted)
+                     + total_weight ** 2
+                     - 2 * total_weight * shifted.min(axis=1))
+        changes = np.sqrt(np.maximum(sq_change, 0.0)) / n_trees
+
+        top_indices = _topk_indices(changes, n_select)
 
         logger.info(f"Selected {len(top_indices)} samples with highest expected model change")
         return top_indices.tolist()
@@ -152,26 +250,28 @@ class ActiveLearningSelector:
         logger.info(f"Density-based sampling: selecting {n_select} samples...")
 
         # Get uncertainties
-        proba = self.model.predict_proba(X_unlabeled)
-        uncertainties = entropy(proba.T)
+        proba = self._predict_proba(X_unlabeled)
+        uncertainties = _entropy(proba)
 
         # Calculate density (inverse of average distance to k nearest neighbors)
-        from sklearn.neighbors import NearestNeighbors
         k = min(10, len(X_unlabeled) - 1)
-        nbrs = NearestNeighbors(n_neighbors=k)
-        nbrs.fit(X_unlabeled)
-        distances, _ = nbrs.kneighbors(X_unlabeled)
+        distances = _knn_distances(X_unlabeled, k)
         densities = 1 / (np.mean(distances[:, 1:], axis=1) + 1e-10)
 
         # Combine uncertainty and density
-        if self.scaler:
+        if isinstance(self.scaler, StandardScaler):
+            # Same result without refitting (and overwriting) the feature scaler
+            uncertainties = _standardize(uncertainties)
+            densities = _standardize(densities)
+        elif self.scaler:
             uncertainties = self.scaler.fit_transform(uncertainties.reshape(-1, 1)).flatten()
             densities = self.scaler.fit_transform(densities.reshape(-1, 1)).flatten()
 
-        scores = (1 - diversity_weight) * uncertainties + diversity_weight * densities
+        scores = uncertainties * (1 - diversity_weight)
+        scores += diversity_weight * densities
 
         # Select top samples
-        top_indices = np.argsort(scores)[-n_select:]
+        top_indices = _topk_indices(scores, n_select)
 
         logger.info(f"Selected {len(top_indices)} samples using density-based approach")
         return top_indices.tolist()
@@ -217,41 +317,44 @@ class ActiveLearningOracle:
                               sample_data: pd.DataFrame) -> Dict[int, str]:
         """
         Get labels for samples from oracle (human or automated).
+        Row i of sample_data holds the features of sample_indices[i].
         Returns: {sample_index: label}
         """
         logger.info(f"Getting labels for {len(sample_indices)} samples...")
 
-        labels = {}
-        for idx in sample_indices:
-            sample = sample_data.iloc[idx]
-            # In production, this would prompt human or use weak labels
-            label = self._oracle_predict(sample)
-            labels[idx] = label
-            self.labeling_history.append({
-                'index': idx,
-                'label': label,
-                'timestamp': pd.Timestamp.now()
-            })
+        # In production, this would prompt human or use weak labels
+        predicted = self._oracle_predict(sample_data.iloc[:len(sample_indices)])
+        labels = dict(zip(sample_indices, predicted))
+
+        timestamp = pd.Timestamp.now()
+        self.labeling_history.extend(
+            {'index': idx, 'label': label, 'timestamp': timestamp}
+            for idx, label in zip(sample_indices, predicted)
+        )
 
         logger.info(f"Obtained labels for {len(labels)} samples")
         return labels
 
-    def _oracle_predict(self, sample: pd.Series) -> str:
-        """Simulate oracle prediction or query database"""
+    def _oracle_predict(self, samples: pd.DataFrame) -> List[str]:
+        """Simulate oracle prediction or query database for each row"""
         # In production, this would:
         # 1. Query incident database for root cause
         # 2. Prompt human labeler
         # 3. Use weak labels (automated heuristics)
 
-        # For now, use a simple heuristic
-        if sample.get('cpu_usage', 0) > 0.9:
-            return 'cpu_saturation'
-        elif sample.get('memory_usage', 0) > 0.85:
-            return 'memory_leak'
-        elif sample.get('disk_io', 0) > 0.8:
-            return 'disk_full'
-        else:
-            return 'unknown'
+        # For now, use a simple heuristic; missing columns count as 0
+        def column(name: str) -> np.ndarray:
+            if name in samples.columns:
+                return samples[name].to_numpy()
+            return np.zeros(len(samples))
+
+        return np.select(
+            [column('cpu_usage') > 0.9,
+             column('memory_usage') > 0.85,
+             column('disk_io') > 0.8],
+            ['cpu_saturation', 'memory_leak', 'disk_full'],
+            default='unknown'
+        ).tolist()
 
     def save_labels(self, labels: Dict[int, str]):
         """Save labels to database"""
@@ -266,10 +369,12 @@ class ActiveLearningPipeline:
 
     def __init__(self, initial_labeled_size: int = 100,
                  target_labeled_size: int = 1500,
-                 batch_size: int = 100):
+                 batch_size: int = 100,
+                 trees_per_iteration: int = 10):
         self.initial_labeled_size = initial_labeled_size
         self.target_labeled_size = target_labeled_size
         self.batch_size = batch_size
+        self.trees_per_iteration = trees_per_iteration
         self.selector = ActiveLearningSelector()
         self.oracle = ActiveLearningOracle()
         self.training_history = []
@@ -283,27 +388,50 @@ class ActiveLearningPipeline:
         logger.info(f"Starting active learning pipeline...")
         logger.info(f"Initial labeled: {self.initial_labeled_size}, Target: {self.target_labeled_size}")
 
+        # RandomForest trains on float32 internally; convert once so neither the
+        # buffers nor each fit carry a float64 copy
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
         # Initial training set
         indices = np.random.choice(len(X), self.initial_labeled_size, replace=False)
-        X_labeled = X[indices]
-        y_labeled = y[indices]
-
-        unlabeled_indices = np.setdiff1d(np.arange(len(X)), indices)
 
+        # Labeled rows and labels are written into buffers sized for the last
+        # batch that can overshoot the target; X_labeled/y_labeled are views
+        capacity = min(len(X), max(self.initial_labeled_size,
+                                   self.target_labeled_size + self.batch_size - 1))
+        X_buffer = np.empty((capacity,) + X.shape[1:], dtype=X.dtype)
+        y_buffer = np.empty(capacity, dtype=y.dtype)
+        n_labeled = len(indices)
+        X_buffer[:n_labeled] = X[indices]
+        y_buffer[:n_labeled] = y[indices]
+        X_labeled = X_buffer[:n_labeled]
+        y_labeled = y_buffer[:n_labeled]
+
+        # Unlabeled rows are tracked with a mask; no per-iteration sort or realloc
+        unlabeled_mask = np.ones(len(X), dtype=bool)
+        unlabeled_mask[indices] = False
+
+        model = None
         iteration = 0
-        while len(y_labeled) < self.target_labeled_size:
+        while n_labeled < self.target_labeled_size:
             iteration += 1
             logger.info(f"\n=== Iteration {iteration} ===")
-            logger.info(f"Labeled: {len(y_labeled)}/{self.target_labeled_size}")
-
-            # Train model on labeled data
-            model = RandomForestClassifier(n_estimators=50, max_depth=15, random_state=42)
+            logger.info(f"Labeled: {n_labeled}/{self.target_labeled_size}")
+
+            # Train model on labeled data. Trees from earlier iterations are kept
+            # and only the new ones are fit; a new label set needs a fresh forest.
+            if model is None or not np.array_equal(np.unique(y_labeled), model.classes_):
+                model = RandomForestClassifier(n_estimators=50, max_depth=15,
+                                               random_state=42, warm_start=True)
+            else:
+                model.n_estimators += self.trees_per_iteration
             model.fit(X_labeled, y_labeled)
 
             # Set model for active learning
             self.selector.set_model(model)
 
             # Select samples for labeling
+            unlabeled_indices = np.flatnonzero(unlabeled_mask)
             X_unlabeled_subset = X[unlabeled_indices]
             selected_indices = self.selector.select_samples(
                 X_unlabeled_subset,
@@ -319,18 +447,30 @@ class ActiveLearningPipeline:
             labels = self.oracle.get_labels_for_samples(selected_absolute_indices, selected_samples)
 
             # Add to labeled set
-            X_labeled = np.vstack([X_labeled, X[selected_absolute_indices]])
             y_labeled_new = np.array([labels.get(idx, 'unknown') for idx in selected_absolute_indices])
-            y_labeled = np.append(y_labeled, y_labeled_new)
+
+            # Widen the buffer once if the new labels need a larger dtype (e.g. int -> str)
+            label_dtype = np.result_type(y_buffer.dtype, y_labeled_new.dtype)
+            if label_dtype != y_buffer.dtype:
+                y_buffer = y_buffer.astype(label_dtype)
+
+            end = n_labeled + len(selected_absolute_indices)
+            X_buffer[n_labeled:end] = X[selected_absolute_indices]
+            y_buffer[n_labeled:end] = y_labeled_new
+            n_labeled = end
+            X_labeled = X_buffer[:n_labeled]
+            y_labeled = y_buffer[:n_labeled]
 
             # Remove from unlabeled
-            unlabeled_indices = np.setdiff1d(unlabeled_indices, selected_absolute_indices)
+            unlabeled_mask[selected_absolute_indices] = False
 
             # Log progress
-            accuracy = model.score(X_labeled, y_labeled)
+            # The model was fit before labels may have been widened to strings
+            # above, so compare its predictions in the current label dtype
+            accuracy = float(np.mean(model.predict(X_labeled).astype(y_labeled.dtype) == y_labeled))
             self.training_history.append({
                 'iteration': iteration,
-                'labeled_count': len(y_labeled),
+                'labeled_count': n_labeled,
                 'selected_count': len(selected_indices),
                 'accuracy': accuracy
             })
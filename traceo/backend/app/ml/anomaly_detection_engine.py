@@ -8,16 +8,98 @@ Date: November 21, 2024
 """
 
 import logging
+import os
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
+import joblib
+from sklearn.base import clone
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
+from scipy.special import expit
+
+try:
+    from numba import njit
+except ImportError:  # optional: plain NumPy reductions are used instead
+    njit = None
 
 logger = logging.getLogger(__name__)
 
 
+def _to_float_array(data) -> np.ndarray:
+    """Convert a list of numbers to a float64 array without an intermediate copy"""
+    if isinstance(data, np.ndarray):
+        return np.ascontiguousarray(data, dtype=np.float64)
+    return np.fromiter(data, dtype=np.float64, count=len(data))
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _mean_std(values):
+        """Mean and population standard deviation in one pass (Welford)"""
+        mean = 0.0
+        m2 = 0.0
+        for i in range(values.shape[0]):
+            delta = values[i] - mean
+            mean += delta / (i + 1)
+            m2 += delta * (values[i] - mean)
+        return mean, np.sqrt(m2 / values.shape[0])
+
+    @njit(cache=True)
+    def _zscore_batch(values, mean, std, threshold, warning, critical):
+        """Z-scores, severity codes, confidences and the |z| > threshold mask in one loop"""
+        n = values.shape[0]
+        z_scores = np.empty(n)
+        severity_codes = np.empty(n, dtype=np.uint8)
+        confidences = np.empty(n)
+        mask = np.empty(n, dtype=np.bool_)
+        for i in range(n):
+            z = (values[i] - mean) / std
+            magnitude = abs(z)
+            z_scores[i] = z
+            if magnitude > critical:
+                severity_codes[i] = 2
+                confidences[i] = min(magnitude / 5.0, 1.0)
+            elif magnitude > warning:
+                severity_codes[i] = 1
+                confidences[i] = min(magnitude / 3.0, 1.0)
+            else:
+                severity_codes[i] = 0
+                confidences[i] = magnitude / 2.0
+            mask[i] = magnitude > threshold
+        return z_scores, severity_codes, confidences, mask
+else:
+    def _mean_std(values):
+        """Mean and population standard deviation"""
+        return values.mean(), values.std()
+
+    def _zscore_batch(values, mean, std, threshold, warning, critical):
+        """Z-scores, severity codes, confidences and the |z| > threshold mask"""
+        z_scores = (values - mean) / std
+        magnitude = np.abs(z_scores)
+        severity_codes = np.where(magnitude > critical, 2,
+                                  np.where(magnitude > warning, 1, 0)).astype(np.uint8)
+        confidences = np.select(
+            [severity_codes == 2, severity_codes == 1],
+            [np.minimum(magnitude / 5.0, 1.0), np.minimum(magnitude / 3.0, 1.0)],
+            default=magnitude / 2.0
+        )
+        return z_scores, severity_codes, confidences, magnitude > threshold
+
+
+# Severity names indexed by the codes _zscore_batch emits
+_SEVERITY_NAMES = ("low", "medium", "high")
+
+# Per-value batch output; severity holds an index into _SEVERITY_NAMES
+_ANOMALY_DTYPE = np.dtype([
+    ('is_anomaly', np.bool_),
+    ('z_score', np.float64),
+    ('severity', np.uint8),
+    ('confidence', np.float64),
+])
+
+
 class AnomalySeverity(Enum):
     """Anomaly severity levels"""
     LOW = "low"
@@ -65,9 +147,12 @@ class ZScoreAnomalyDetector:
                 f"Insufficient data: need {ZScoreAnomalyDetector.MIN_DATA_POINTS}+ points"
             )
 
-        values = np.array(data, dtype=float)
-        mean = np.mean(values)
-        std = np.std(values)
+        return ZScoreAnomalyDetector._array_statistics(_to_float_array(data))
+
+    @staticmethod
+    def _array_statistics(values: np.ndarray) -> Tuple[float, float]:
+        """Mean and standard deviation of a float64 array, never returning std == 0"""
+        mean, std = _mean_std(values)
 
         # Avoid division by zero
         if std == 0:
@@ -75,6 +160,60 @@ class ZScoreAnomalyDetector:
 
         return float(mean), float(std)
 
+    @staticmethod
+    def _classify(z_score: float) -> Tuple[str, float]:
+        """Severity and 0-1 confidence for a z-score
+
+        Returns:
+            Tuple of (severity, confidence)
+        """
+        # Determine severity based on z-score
+        if abs(z_score) > ZScoreAnomalyDetector.THRESHOLD_CRITICAL:
+            return "high", min(abs(z_score) / 5.0, 1.0)  # Normalized to 0-1
+        elif abs(z_score) > ZScoreAnomalyDetector.THRESHOLD_WARNING:
+            return "medium", min(abs(z_score) / 3.0, 1.0)
+        else:
+            return "low", abs(z_score) / 2.0
+
+    @staticmethod
+    def _build_result(
+        value: float,
+        z_score: float,
+        mean: float,
+        threshold: float,
+        severity: str,
+        confidence: float
+    ) -> AnomalyResult:
+        """Build an AnomalyResult from an already classified z-score
+
+        Args:
+            value: Value that was checked
+            z_score: Its z-score against the baseline
+            mean: Baseline mean
+            threshold: Z-score threshold
+            severity: Severity from _classify
+            confidence: Confidence from _classify
+
+        Returns:
+            AnomalyResult with message filled in
+        """
+        is_anomaly = abs(z_score) > threshold
+
+        # Calculate percentage deviation
+        deviation_pct = ((value - mean) / max(mean, 1)) * 100
+
+        message = f"Z-score: {z_score:.2f}σ, Deviation: {deviation_pct:+.1f}%"
+
+        return AnomalyResult(
+            is_anomaly=is_anomaly,
+            score=float(abs(z_score)),
+            z_score=float(z_score),
+            severity=severity,
+            confidence=float(confidence),
+            threshold=threshold,
+            message=message
+        )
+
     @staticmethod
     def detect_anomaly(
         current_value: float,
@@ -104,32 +243,11 @@ class ZScoreAnomalyDetector:
 
             mean, std = ZScoreAnomalyDetector.calculate_statistics(historical_data)
             z_score = (current_value - mean) / std if std != 0 else 0
-            is_anomaly = abs(z_score) > threshold
-
-            # Calculate percentage deviation
-            deviation_pct = ((current_value - mean) / max(mean, 1)) * 100
-
-            # Determine severity based on z-score
-            if abs(z_score) > ZScoreAnomalyDetector.THRESHOLD_CRITICAL:
-                severity = "high"
-                confidence = min(abs(z_score) / 5.0, 1.0)  # Normalized to 0-1
-            elif abs(z_score) > ZScoreAnomalyDetector.THRESHOLD_WARNING:
-                severity = "medium"
-                confidence = min(abs(z_score) / 3.0, 1.0)
-            else:
-                severity = "low"
-                confidence = abs(z_score) / 2.0
 
-            message = f"Z-score: {z_score:.2f}σ, Deviation: {deviation_pct:+.1f}%"
+            severity, confidence = ZScoreAnomalyDetector._classify(z_score)
 
-            return AnomalyResult(
-                is_anomaly=is_anomaly,
-                score=float(abs(z_score)),
-                z_score=float(z_score),
-                severity=severity,
-                confidence=float(confidence),
-                threshold=threshold,
-                message=message
+            return ZScoreAnomalyDetector._build_result(
+                current_value, z_score, mean, threshold, severity, confidence
             )
 
         except Exception as e:
@@ -161,21 +279,66 @@ class ZScoreAnomalyDetector:
             return anomalies
 
         try:
-            mean, std = ZScoreAnomalyDetector.calculate_statistics(data)
+            values = _to_float_array(data)
+            mean, records = ZScoreAnomalyDetector._score_batch(values, threshold)
+
+            # Objects are only built for the flagged values
+            for idx in np.flatnonzero(records['is_anomaly']):
+                record = records[idx]
+                result = ZScoreAnomalyDetector._build_result(
+                    float(values[idx]), float(record['z_score']), mean, threshold,
+                    _SEVERITY_NAMES[record['severity']], float(record['confidence'])
+                )
+                anomalies.append((int(idx), result))
 
-            for idx, value in enumerate(data):
-                z_score = (value - mean) / std if std != 0 else 0
+        except Exception as e:
+            logger.error(f"Batch anomaly detection failed: {str(e)}")
+
+        return anomalies
 
-                if abs(z_score) > threshold:
-                    result = ZScoreAnomalyDetector.detect_anomaly(
-                        value, data, threshold
-                    )
-                    anomalies.append((idx, result))
+    @staticmethod
+    def detect_batch_anomalies_np(
+        data: List[float],
+        threshold: float = THRESHOLD_WARNING
+    ) -> np.ndarray:
+        """Detect anomalies in batch of values without building result objects
+
+        Args:
+            data: List or array of values to check
+            threshold: Z-score threshold
+
+        Returns:
+            Structured array of _ANOMALY_DTYPE with one record per value;
+            empty if there are too few values or detection fails
+        """
+        if len(data) < ZScoreAnomalyDetector.MIN_DATA_POINTS:
+            return np.empty(0, dtype=_ANOMALY_DTYPE)
+
+        try:
+            _, records = ZScoreAnomalyDetector._score_batch(_to_float_array(data), threshold)
+            return records
 
         except Exception as e:
             logger.error(f"Batch anomaly detection failed: {str(e)}")
+            return np.empty(0, dtype=_ANOMALY_DTYPE)
 
-        return anomalies
+    @staticmethod
+    def _score_batch(values: np.ndarray, threshold: float) -> Tuple[float, np.ndarray]:
+        """Baseline mean and per-value _ANOMALY_DTYPE records for a float64 array"""
+        # Baseline statistics and all z-scores are computed once for the batch
+        mean, std = ZScoreAnomalyDetector._array_statistics(values)
+        z_scores, severity_codes, confidences, mask = _zscore_batch(
+            values, mean, std, threshold,
+            ZScoreAnomalyDetector.THRESHOLD_WARNING,
+            ZScoreAnomalyDetector.THRESHOLD_CRITICAL
+        )
+
+        records = np.empty(len(values), dtype=_ANOMALY_DTYPE)
+        records['is_anomaly'] = mask
+        records['z_score'] = z_scores
+        records['severity'] = severity_codes
+        records['confidence'] = confidences
+        return mean, records
 
     @staticmethod
     def get_normal_range(
@@ -210,6 +373,27 @@ class ZScoreAnomalyDetector:
             return 0, float('inf')
 
 
+def _normalize_scores(scores: np.ndarray) -> np.ndarray:
+    """Map IsolationForest score_samples output to 0-1 (1 = most anomalous)
+
+    Equivalent to 1 / (1 + exp(scores)) in a single float32 kernel.
+    """
+    return expit(-scores, out=np.empty(scores.shape, dtype=np.float32))
+
+
+def _fit_isolation_forest(
+    model: IsolationForest,
+    data: np.ndarray
+) -> Tuple[IsolationForest, StandardScaler]:
+    """Fit a scaler and the model on data
+
+    Module-level so joblib.Memory can cache it by (model params, data).
+    """
+    scaler = StandardScaler()
+    model.fit(scaler.fit_transform(data))
+    return model, scaler
+
+
 class IsolationForestAnomalyDetector:
     """Unified IsolationForest-based anomaly detection
 
@@ -217,12 +401,15 @@ class IsolationForestAnomalyDetector:
     Works well for multivariate data and complex patterns.
     """
 
-    def __init__(self, contamination: float = 0.1, random_state: int = 42):
+    def __init__(self, contamination: float = 0.1, random_state: int = 42,
+                 cache_dir: Optional[str] = None):
         """Initialize detector
 
         Args:
             contamination: Expected proportion of anomalies (0.0-0.5)
             random_state: Random seed for reproducibility
+            cache_dir: Directory for persisting fitted models; refitting the
+                same data with the same parameters then loads from disk
         """
         self.model = IsolationForest(
             contamination=contamination,
@@ -233,6 +420,12 @@ class IsolationForestAnomalyDetector:
         self.is_fitted = False
         self.contamination = contamination
 
+        if cache_dir is not None:
+            memory = joblib.Memory(os.path.expanduser(cache_dir), verbose=0)
+            self._fit_model = memory.cache(_fit_isolation_forest)
+        else:
+            self._fit_model = _fit_isolation_forest
+
     def fit(self, data: np.ndarray):
         """Fit the Isolation Forest model
 
@@ -247,9 +440,8 @@ class IsolationForestAnomalyDetector:
         if data.ndim == 1:
             data = data.reshape(-1, 1)
 
-        # Fit scaler and model
-        data_scaled = self.scaler.fit_transform(data)
-        self.model.fit(data_scaled)
+        # Fit scaler and model; an unfitted clone keeps the cache key stable
+        self.model, self.scaler = self._fit_model(clone(self.model), data)
         self.is_fitted = True
 
         logger.info(f"IsolationForest fitted on {len(data)} samples")
@@ -267,18 +459,31 @@ class IsolationForestAnomalyDetector:
             logger.warning("Model not fitted. Call fit() first.")
             return []
 
+        return np.flatnonzero(self.detect_anomalies_mask(data)).tolist()
+
+    def detect_anomalies_mask(self, data: np.ndarray) -> np.ndarray:
+        """Detect anomalies in data as a boolean mask
+
+        Args:
+            data: Data to check (samples x features)
+
+        Returns:
+            Boolean array, True where the sample is anomalous
+        """
+        if not self.is_fitted:
+            logger.warning("Model not fitted. Call fit() first.")
+            return np.zeros(len(data), dtype=bool)
+
         # Handle 1D data
         if data.ndim == 1:
             data = data.reshape(-1, 1)
 
         try:
             data_scaled = self.scaler.transform(data)
-            predictions = self.model.predict(data_scaled)
-            anomaly_indices = [i for i, pred in enumerate(predictions) if pred == -1]
-            return anomaly_indices
+            return self.model.predict(data_scaled) == -1
         except Exception as e:
             logger.error(f"Anomaly detection failed: {str(e)}")
-            return []
+            return np.zeros(len(data), dtype=bool)
 
     def get_anomaly_scores(self, data: np.ndarray) -> np.ndarray:
         """Get anomaly scores (0-1) for each sample
@@ -298,16 +503,40 @@ class IsolationForestAnomalyDetector:
             data = data.reshape(-1, 1)
 
         try:
-            data_scaled = self.scaler.transform(data)
+            # Scale in float64 so large-magnitude features keep their
+            # precision; the trees compare in float32 anyway
+            data_scaled = self.scaler.transform(data).astype(np.float32, copy=False)
             # Get decision function scores
             scores = self.model.score_samples(data_scaled)
             # Convert to 0-1 range (more negative = more anomalous)
-            normalized_scores = 1 / (1 + np.exp(scores))
-            return normalized_scores
+            return _normalize_scores(scores)
         except Exception as e:
             logger.error(f"Score calculation failed: {str(e)}")
             return np.array([])
 
+    def detect_batch(self, data: np.ndarray) -> List[AnomalyResult]:
+        """Detect anomalies for every sample in one pass
+
+        Args:
+            data: Samples to check (samples x features)
+
+        Returns:
+            One AnomalyResult per sample
+        """
+        if not self.is_fitted:
+            logger.warning("Model not fitted. Call fit() first.")
+            return []
+
+        # Handle 1D data
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+
+        try:
+            return self._score_results(data)
+        except Exception as e:
+            logger.error(f"Batch detection failed: {str(e)}")
+            return []
+
     def detect_single(self, sample: np.ndarray) -> AnomalyResult:
         """Detect anomaly for single sample
 
@@ -331,19 +560,7 @@ class IsolationForestAnomalyDetector:
             if sample.ndim == 1:
                 sample = sample.reshape(1, -1)
 
-            sample_scaled = self.scaler.transform(sample)
-            prediction = self.model.predict(sample_scaled)[0]
-            score = self.model.score_samples(sample_scaled)[0]
-
-            # Normalize score to 0-1
-            normalized_score = 1 / (1 + np.exp(score))
-
-            return AnomalyResult(
-                is_anomaly=(prediction == -1),
-                score=float(normalized_score),
-                severity="high" if normalized_score > 0.7 else "medium" if normalized_score > 0.5 else "low",
-                confidence=float(normalized_score)
-            )
+            return self._score_results(sample)[0]
 
         except Exception as e:
             logger.error(f"Single sample detection failed: {str(e)}")
@@ -353,6 +570,29 @@ class IsolationForestAnomalyDetector:
                 message=f"Detection error: {str(e)}"
             )
 
+    def _score_results(self, data: np.ndarray) -> List[AnomalyResult]:
+        """Scale, score and wrap a 2D batch of samples"""
+        # Scale in float64 so large-magnitude features keep their precision;
+        # the trees compare in float32 anyway
+        data_scaled = self.scaler.transform(data).astype(np.float32, copy=False)
+        scores = self.model.score_samples(data_scaled)
+
+        # Same rule as IsolationForest.predict, without scoring the trees twice
+        is_anomaly = scores < self.model.offset_
+
+        # Normalize score to 0-1
+        normalized_scores = _normalize_scores(scores)
+
+        return [
+            AnomalyResult(
+                is_anomaly=bool(anomalous),
+                score=float(score),
+                severity="high" if score > 0.7 else "medium" if score > 0.5 else "low",
+                confidence=float(score)
+            )
+            for anomalous, score in zip(is_anomaly, normalized_scores)
+        ]
+
 
 class AnomalyDetectionFactory:
     """Factory for creating domain-specific anomaly detectors
@@ -469,6 +709,20 @@ class CostAnomalyDetector:
         # Convert z-score to 0-1 scale
         return min(z_score / 3.0, 1.0)
 
+    def calculate_anomaly_scores(self, costs: np.ndarray) -> np.ndarray:
+        """Vectorized calculate_anomaly_score for a batch of costs
+
+        Returns anomaly scores 0-1, one per cost
+        """
+        costs = np.asarray(costs, dtype=np.float64)
+
+        if not self.is_fitted or self.baseline_std == 0:
+            return np.zeros(costs.shape)
+
+        scores = np.abs((costs - self.baseline_mean) / self.baseline_std)
+        scores /= 3.0
+        return np.minimum(scores, 1.0, out=scores)
+
 
 # Export public API
 __all__ = [
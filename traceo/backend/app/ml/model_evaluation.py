@@ -6,18 +6,44 @@ Date: November 21, 2024
 
 import logging
 import hashlib
+import itertools
+import time
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Tuple, List
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from enum import Enum
+from functools import lru_cache
 from scipy import stats
 import json
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4096)
+def _t_ppf(q: float, df: int) -> float:
+    """Student t quantile, cached; scipy's ppf dispatch dwarfs the math"""
+    return float(stats.t.ppf(q, df))
+
+
+@lru_cache(maxsize=4096)
+def _achieved_power(sample_size: int, effect_size: float) -> float:
+    """Two-sided t-test power at alpha 0.05, cached by (sample_size, effect_size)"""
+    from statsmodels.stats.power import tt_solve_power
+
+    try:
+        power = tt_solve_power(
+            effect_size=effect_size,
+            nobs=sample_size / 2,
+            alpha=0.05,
+            alternative='two-sided'
+        )
+        return float(power)
+    except:
+        return 0.0
+
+
 class ExperimentStatus(Enum):
     """A/B test experiment status"""
     PLANNING = 'planning'
@@ -39,6 +65,54 @@ class ExperimentConfig:
     runtime_days: int = 14
 
 
+# Variant column encoding in SampleStore
+_VARIANT_BITS = {'control': 0, 'treatment': 1}
+
+# Naive UTC epoch for converting collect_metric timestamps
+_EPOCH = datetime(1970, 1, 1)
+
+
+class SampleStore:
+    """Columnar storage for the metric samples of all experiments
+
+    One row per collected sample across four parallel arrays, grown by
+    doubling, instead of a separate buffer per experiment and variant.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.experiment = np.empty(capacity, dtype=np.int32)
+        self.variant = np.empty(capacity, dtype=np.uint8)
+        self.value = np.empty(capacity, dtype=np.float64)
+        self.timestamp_ns = np.empty(capacity, dtype=np.int64)
+
+    def append(self, experiment: int, variant: int, value: float, timestamp_ns: int):
+        """Write one sample row"""
+        if self.size == len(self.value):
+            self._grow()
+        i = self.size
+        self.experiment[i] = experiment
+        self.variant[i] = variant
+        self.value[i] = value
+        self.timestamp_ns[i] = timestamp_ns
+        self.size = i + 1
+
+    def values(self, experiment: int, variant: int) -> np.ndarray:
+        """Metric values of one experiment variant, in collection order"""
+        n = self.size
+        mask = (self.experiment[:n] == experiment) & (self.variant[:n] == variant)
+        return self.value[:n][mask]
+
+    def _grow(self):
+        """Double the capacity of every column"""
+        capacity = max(2 * len(self.value), 1)
+        for name in ('experiment', 'variant', 'value', 'timestamp_ns'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+
 class ABTestingFramework:
     """End-to-end A/B testing framework for ML models"""
 
@@ -46,6 +120,10 @@ class ABTestingFramework:
         self.db_connection = db_connection
         self.experiments = {}
         self.results = {}
+        self.samples = SampleStore()
+        self._experiment_codes = itertools.count()
+        # experiment_id -> ((control_n, treatment_n), statistics)
+        self._stats_cache = {}
 
     def create_experiment(self, config: ExperimentConfig) -> str:
         """Create new A/B test experiment"""
@@ -58,10 +136,11 @@ class ABTestingFramework:
             'target_metric': config.target_metric,
             'status': ExperimentStatus.PLANNING.value,
             'created_at': datetime.utcnow(),
-            'config': config.__dict__,
+            'config': asdict(config),
+            'sample_code': next(self._experiment_codes),
             'variants': {
-                'control': {'samples': 0, 'metric_values': []},
-                'treatment': {'samples': 0, 'metric_values': []}
+                'control': self._new_variant(),
+                'treatment': self._new_variant()
             },
             'power_analysis': self._calculate_power(config),
             'results': None
@@ -73,10 +152,28 @@ class ABTestingFramework:
     def assign_user_to_variant(self, user_id: str, experiment_id: str) -> str:
         """Consistently assign user to control (0) or treatment (1)"""
         hash_input = f"{user_id}{experiment_id}".encode()
-        hash_value = int(hashlib.md5(hash_input).hexdigest(), 16)
-        variant = 'control' if (hash_value % 2) == 0 else 'treatment'
+        # Parity of the digest as an integer is the low bit of its last byte
+        hash_value = hashlib.md5(hash_input).digest()[-1]
+        variant = 'control' if (hash_value & 1) == 0 else 'treatment'
         return variant
 
+    def assign_batch(self, user_ids, experiment_id: str) -> np.ndarray:
+        """Assign many users at once, consistently with assign_user_to_variant
+
+        Args:
+            user_ids: Sequence or array of user ids
+            experiment_id: Experiment the users are assigned in
+
+        Returns:
+            Boolean array, True where the user is in the treatment variant
+        """
+        suffix = experiment_id.encode()
+        last_bytes = np.fromiter(
+            (hashlib.md5(f"{user_id}".encode() + suffix).digest()[-1] for user_id in user_ids),
+            dtype=np.uint8, count=len(user_ids)
+        )
+        return (last_bytes & 1).astype(bool)
+
     def start_experiment(self, experiment_id: str):
         """Start experiment (move from PLANNING to RUNNING)"""
         if experiment_id in self.experiments:
@@ -87,63 +184,108 @@ class ABTestingFramework:
     def collect_metric(self, experiment_id: str, variant: str,
                       user_id: str, metric_value: float, timestamp: datetime = None):
         """Collect metric for A/B test"""
+        # Stored as int64 ns since the epoch; naive datetimes are taken as UTC
         if timestamp is None:
-            timestamp = datetime.utcnow()
+            timestamp_ns = time.time_ns()
+        else:
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            timestamp_ns = (timestamp - _EPOCH) // timedelta(microseconds=1) * 1000
 
         if experiment_id in self.experiments:
-            self.experiments[experiment_id]['variants'][variant]['samples'] += 1
-            self.experiments[experiment_id]['variants'][variant]['metric_values'].append(metric_value)
+            experiment = self.experiments[experiment_id]
+            v = experiment['variants'][variant]
+            self.samples.append(experiment['sample_code'], _VARIANT_BITS[variant],
+                                metric_value, timestamp_ns)
+            v['n'] += 1
+
+            # Running mean and sum of squared deviations (Welford)
+            delta = metric_value - v['mean']
+            v['mean'] += delta / v['n']
+            v['m2'] += delta * (metric_value - v['mean'])
+
+    def get_metric_values(self, experiment_id: str, variant: str) -> np.ndarray:
+        """Metric values collected for one variant of an experiment"""
+        if experiment_id not in self.experiments:
+            return np.empty(0, dtype=np.float64)
+
+        code = self.experiments[experiment_id]['sample_code']
+        return self.samples.values(code, _VARIANT_BITS[variant])
 
-    def calculate_statistics(self, experiment_id: str) -> Dict:
-        """Calculate statistical significance"""
+    def calculate_statistics(self, experiment_id: str, permutation_test: bool = False) -> Dict:
+        """Calculate statistical significance
+
+        Args:
+            experiment_id: Experiment to analyse
+            permutation_test: Take the p-value from a permutation test on the
+                samples instead of the t-test; suits small or skewed samples
+        """
         if experiment_id not in self.experiments:
             logger.error(f"Experiment {experiment_id} not found")
             return {}
 
         experiment = self.experiments[experiment_id]
-        control_values = np.array(experiment['variants']['control']['metric_values'])
-        treatment_values = np.array(experiment['variants']['treatment']['metric_values'])
+        control = experiment['variants']['control']
+        treatment = experiment['variants']['treatment']
+        control_n, treatment_n = control['n'], treatment['n']
 
-        if len(control_values) == 0 or len(treatment_values) == 0:
+        if control_n == 0 or treatment_n == 0:
             logger.warning(f"Insufficient data for {experiment_id}")
             return {'status': 'insufficient_data'}
 
-        # T-test
-        t_stat, p_value = stats.ttest_ind(treatment_values, control_values)
+        # Samples are append-only, so unchanged counts mean unchanged statistics
+        cache_key = (control_n, treatment_n, permutation_test)
+        cached = self._stats_cache.get(experiment_id)
+        if cached is not None and cached[0] == cache_key:
+            return dict(cached[1])
+
+        # Everything below is O(1) arithmetic on the running moments
+        control_mean = np.float64(control['mean'])
+        treatment_mean = np.float64(treatment['mean'])
 
-        # Effect size (Cohen's d)
-        cohens_d = self._cohens_d(treatment_values, control_values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # T-test
+            t_stat, p_value = self._pooled_t_test(treatment, control)
 
-        # Confidence intervals (95%)
-        control_ci = self._confidence_interval(control_values, confidence=0.95)
-        treatment_ci = self._confidence_interval(treatment_values, confidence=0.95)
+            # Effect size (Cohen's d)
+            cohens_d = self._cohens_d(treatment, control)
 
-        # Relative improvement
-        control_mean = control_values.mean()
-        treatment_mean = treatment_values.mean()
-        improvement_percentage = ((treatment_mean - control_mean) / control_mean) * 100
+            # Confidence intervals (95%)
+            control_ci = self._confidence_interval(control, confidence=0.95)
+            treatment_ci = self._confidence_interval(treatment, confidence=0.95)
+
+            # Relative improvement
+            improvement_percentage = ((treatment_mean - control_mean) / control_mean) * 100
+
+        if permutation_test:
+            p_value = self._perm_pvalue(
+                self.get_metric_values(experiment_id, 'control'),
+                self.get_metric_values(experiment_id, 'treatment')
+            )
 
         results = {
             'experiment_id': experiment_id,
             'control_mean': float(control_mean),
             'treatment_mean': float(treatment_mean),
-            'control_std': float(control_values.std()),
-            'treatment_std': float(treatment_values.std()),
+            'control_std': float(np.sqrt(control['m2'] / control_n)),
+            'treatment_std': float(np.sqrt(treatment['m2'] / treatment_n)),
             'difference': float(treatment_mean - control_mean),
             'improvement_percentage': float(improvement_percentage),
             'control_ci': [float(x) for x in control_ci],
             'treatment_ci': [float(x) for x in treatment_ci],
             't_statistic': float(t_stat),
             'p_value': float(p_value),
+            'test': 'permutation' if permutation_test else 't_test',
             'cohens_d': float(cohens_d),
             'is_significant': p_value < 0.05,
-            'control_samples': len(control_values),
-            'treatment_samples': len(treatment_values),
-            'total_samples': len(control_values) + len(treatment_values),
-            'power': self._calculate_achieved_power(len(control_values), cohens_d)
+            'control_samples': control_n,
+            'treatment_samples': treatment_n,
+            'total_samples': control_n + treatment_n,
+            'power': self._calculate_achieved_power(control_n, cohens_d)
         }
 
-        return results
+        self._stats_cache[experiment_id] = (cache_key, results)
+        return dict(results)
 
     def recommend_action(self, stats: Dict) -> str:
         """Recommend whether to deploy treatment model"""
@@ -171,8 +313,8 @@ class ABTestingFramework:
         config = experiment['config']
 
         # Check sample size
-        control_n = experiment['variants']['control']['samples']
-        treatment_n = experiment['variants']['treatment']['samples']
+        control_n = experiment['variants']['control']['n']
+        treatment_n = experiment['variants']['treatment']['n']
         total_n = control_n + treatment_n
 
         if total_n < config['sample_size']:
@@ -221,36 +363,78 @@ class ABTestingFramework:
             return {}
 
         experiment = self.experiments[experiment_id]
-        control_values = np.array(experiment['variants']['control']['metric_values'])
-        treatment_values = np.array(experiment['variants']['treatment']['metric_values'])
+        control = experiment['variants']['control']
+        treatment = experiment['variants']['treatment']
 
         return {
             'experiment_id': experiment_id,
             'status': experiment['status'],
-            'control_samples': len(control_values),
-            'treatment_samples': len(treatment_values),
-            'control_mean': float(control_values.mean()) if len(control_values) > 0 else None,
-            'treatment_mean': float(treatment_values.mean()) if len(treatment_values) > 0 else None,
+            'control_samples': control['n'],
+            'treatment_samples': treatment['n'],
+            'control_mean': float(control['mean']) if control['n'] > 0 else None,
+            'treatment_mean': float(treatment['mean']) if treatment['n'] > 0 else None,
             'is_complete': self.is_experiment_complete(experiment_id),
             'recommendation': experiment.get('recommendation', 'Pending')
         }
 
     # Helper methods
     @staticmethod
-    def _cohens_d(group1: np.ndarray, group2: np.ndarray) -> float:
+    def _new_variant() -> Dict:
+        """Empty variant: running count, mean and sum of squared deviations"""
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0}
+
+    @staticmethod
+    def _pooled_t_test(group1: Dict, group2: Dict) -> Tuple[float, float]:
+        """Two-sided equal-variance t-test from running moments (as stats.ttest_ind)"""
+        n1, n2 = group1['n'], group2['n']
+        # ttest_ind_from_stats expects sample (ddof=1) standard deviations
+        std1 = np.sqrt(np.float64(group1['m2']) / (n1 - 1))
+        std2 = np.sqrt(np.float64(group2['m2']) / (n2 - 1))
+        return stats.ttest_ind_from_stats(group1['mean'], std1, n1, group2['mean'], std2, n2)
+
+    @staticmethod
+    def _perm_pvalue(control: np.ndarray, treatment: np.ndarray, n_permutations: int = 10000,
+                     rng: np.random.Generator = None) -> float:
+        """Two-sided permutation-test p-value for the difference in means
+
+        All permutations of a chunk are drawn as one matrix, so the mean
+        differences come from a single row reduction instead of a Python loop.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        combined = np.concatenate([treatment, control])
+        n, n1 = len(combined), len(treatment)
+        total = combined.sum()
+        observed = abs(treatment.mean() - control.mean())
+
+        # Bound each chunk's permutation matrix to ~16 MB
+        chunk = max(1, min(n_permutations, 2_000_000 // n))
+        extreme = 0
+        for start in range(0, n_permutations, chunk):
+            rows = min(chunk, n_permutations - start)
+            permuted = rng.permuted(np.broadcast_to(combined, (rows, n)), axis=1)
+            first = permuted[:, :n1].sum(axis=1)
+            diffs = first / n1 - (total - first) / (n - n1)
+            # Tolerance keeps ties with the observed split from being lost to rounding
+            extreme += np.count_nonzero(np.abs(diffs) >= observed - 1e-12 * max(abs(observed), 1.0))
+
+        # Counting the observed split itself keeps the estimate away from zero
+        return (extreme + 1) / (n_permutations + 1)
+
+    @staticmethod
+    def _cohens_d(group1: Dict, group2: Dict) -> float:
         """Calculate Cohen's d effect size"""
-        n1, n2 = len(group1), len(group2)
-        var1, var2 = group1.var(), group2.var()
-        pooled_std = np.sqrt(((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
-        return (group1.mean() - group2.mean()) / pooled_std if pooled_std > 0 else 0
+        n1, n2 = group1['n'], group2['n']
+        var1, var2 = group1['m2'] / n1, group2['m2'] / n2
+        pooled_std = np.sqrt(np.float64((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
+        return (group1['mean'] - group2['mean']) / pooled_std if pooled_std > 0 else 0
 
     @staticmethod
-    def _confidence_interval(data: np.ndarray, confidence: float = 0.95) -> Tuple[float, float]:
+    def _confidence_interval(group: Dict, confidence: float = 0.95) -> Tuple[float, float]:
         """Calculate confidence interval"""
-        mean = data.mean()
-        sem = stats.sem(data)
-        ci = sem * stats.t.ppf((1 + confidence) / 2, len(data) - 1)
-        return mean - ci, mean + ci
+        n = group['n']
+        sem = np.sqrt(np.float64(group['m2']) / (n - 1) / n)
+        ci = sem * _t_ppf((1 + confidence) / 2, n - 1)
+        return group['mean'] - ci, group['mean'] + ci
 
     @staticmethod
     def _calculate_power(config: ExperimentConfig) -> Dict:
@@ -271,18 +455,8 @@ class ABTestingFramework:
     @staticmethod
     def _calculate_achieved_power(sample_size: int, effect_size: float) -> float:
         """Calculate achieved statistical power"""
-        from statsmodels.stats.power import tt_solve_power
-
-        try:
-            power = tt_solve_power(
-                effect_size=effect_size,
-                nobs=sample_size / 2,
-                alpha=0.05,
-                alternative='two-sided'
-            )
-            return float(power)
-        except:
-            return 0.0
+        # Power varies smoothly with the effect size; 4 decimals keeps the cache hot
+        return _achieved_power(sample_size, round(float(effect_size), 4))
 
 
 class ModelEvaluator:
@@ -292,6 +466,9 @@ class ModelEvaluator:
     def evaluate_classification(y_true: np.ndarray, y_pred: np.ndarray,
                                y_pred_proba: np.ndarray = None) -> Dict:
         """Evaluate classification model"""
+        if ModelEvaluator._is_binary(y_true) and ModelEvaluator._is_binary(y_pred):
+            return ModelEvaluator.evaluate_binary_classification(y_true, y_pred, y_pred_proba)
+
         from sklearn.metrics import (
             accuracy_score, precision_score, recall_score, f1_score,
             roc_auc_score, confusion_matrix, classification_report
@@ -313,22 +490,118 @@ class ModelEvaluator:
         return results
 
     @staticmethod
-    def evaluate_anomaly_detection(y_true: np.ndarray, y_pred: np.ndarray) -> Dict:
-        """Evaluate anomaly detection model"""
-        from sklearn.metrics import (
-            precision_recall_curve, f1_score, roc_auc_score
-        )
+    def evaluate_binary_classification(y_true: np.ndarray, y_pred: np.ndarray,
+                                       y_pred_proba: np.ndarray = None) -> Dict:
+        """Evaluate a 0/1 classifier from one confusion-matrix pass
+
+        Same results as evaluate_classification (support-weighted metrics),
+        without sklearn's per-metric label inference.
+        """
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        cm = np.bincount(y_true.astype(np.intp) * 2 + y_pred.astype(np.intp),
+                         minlength=4).reshape(2, 2)
+        results = {name: float(score) for name, score in ModelEvaluator._weighted_scores(cm).items()}
 
-        # Assuming 1 = anomaly, 0 = normal
-        results = {
-            'precision': float(np.sum((y_pred == 1) & (y_true == 1)) / np.sum(y_pred == 1) + 1e-10),
-            'recall': float(np.sum((y_pred == 1) & (y_true == 1)) / np.sum(y_true == 1) + 1e-10),
-        }
+        if y_pred_proba is not None:
+            # Mann-Whitney form of the ROC AUC: one ranking instead of a threshold sweep
+            positive = y_true == 1
+            n_pos = np.count_nonzero(positive)
+            n_neg = len(y_true) - n_pos
+            if n_pos == 0 or n_neg == 0:
+                raise ValueError("Only one class present in y_true. ROC AUC score is not defined in that case.")
+            ranks = stats.rankdata(y_pred_proba[:, 1])
+            results['auc'] = float((ranks[positive].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+        # Only labels that occur, as sklearn's confusion_matrix reports them
+        present = np.flatnonzero(cm.sum(axis=1) + cm.sum(axis=0))
+        results['confusion_matrix'] = cm[np.ix_(present, present)].tolist()
+
+        return results
 
-        results['f1_score'] = 2 * (results['precision'] * results['recall']) / (results['precision'] + results['recall'] + 1e-10)
+    @staticmethod
+    def evaluate_classification_batch(y_true: np.ndarray,
+                                      preds: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        """Evaluate several models' predictions on the same labels
+
+        For 0/1 labels all confusion matrices come from one pass over the
+        (models x samples) prediction matrix; other labels fall back to
+        evaluate_classification per model.
+
+        Returns:
+            Dict mapping model name to its evaluate_classification results
+        """
+        y_true = np.asarray(y_true)
+        names = list(preds)
+        if not names:
+            return {}
 
+        P = np.stack([np.asarray(preds[name]) for name in names])
+        if not (ModelEvaluator._is_binary(y_true) and ModelEvaluator._is_binary(P)):
+            return {name: ModelEvaluator.evaluate_classification(y_true, preds[name])
+                    for name in names}
+
+        # Per-model TP and predicted positives from byte-wide boolean reductions;
+        # the rest of each confusion matrix follows from the shared label counts
+        actual = y_true.astype(bool)
+        predicted = P.astype(bool)
+        tp = np.count_nonzero(predicted & actual, axis=1)
+        fp = np.count_nonzero(predicted, axis=1) - tp
+        fn = np.count_nonzero(actual) - tp
+        tn = len(actual) - tp - fp - fn
+        cms = np.stack([tn, fp, fn, tp], axis=1).reshape(-1, 2, 2)
+
+        scores = ModelEvaluator._weighted_scores(cms)
+        results = {}
+        for i, name in enumerate(names):
+            cm = cms[i]
+            present = np.flatnonzero(cm.sum(axis=1) + cm.sum(axis=0))
+            results[name] = {metric: float(values[i]) for metric, values in scores.items()}
+            results[name]['confusion_matrix'] = cm[np.ix_(present, present)].tolist()
         return results
 
+    @staticmethod
+    def _weighted_scores(cm: np.ndarray) -> Dict[str, np.ndarray]:
+        """Accuracy and support-weighted precision/recall/F1 of (..., 2, 2) confusion matrices"""
+        n = cm.sum(axis=(-2, -1))
+        correct = np.diagonal(cm, axis1=-2, axis2=-1)
+        support = cm.sum(axis=-1)
+        predicted = cm.sum(axis=-2)
+
+        # Per-class scores, zero where undefined (zero_division=0)
+        precision = correct / np.maximum(predicted, 1)
+        recall = correct / np.maximum(support, 1)
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+
+        return {
+            'accuracy': correct.sum(axis=-1) / n,
+            'precision': (support * precision).sum(axis=-1) / n,
+            'recall': (support * recall).sum(axis=-1) / n,
+            'f1_score': (support * f1).sum(axis=-1) / n,
+        }
+
+    @staticmethod
+    def _is_binary(y: np.ndarray) -> bool:
+        """True for a non-empty integer or boolean array holding only 0 and 1"""
+        y = np.asarray(y)
+        return y.size > 0 and y.dtype.kind in 'biu' and y.min() >= 0 and y.max() <= 1
+
+    @staticmethod
+    def evaluate_anomaly_detection(y_true: np.ndarray, y_pred: np.ndarray) -> Dict:
+        """Evaluate anomaly detection model"""
+        # Assuming 1 = anomaly, 0 = normal; one pass counts TN/FP/FN/TP as codes 0..3
+        codes = (np.asarray(y_true) == 1).astype(np.intp) * 2 + (np.asarray(y_pred) == 1)
+        tn, fp, fn, tp = np.bincount(codes, minlength=4)
+
+        precision = tp / max(tp + fp, 1)
+        recall = tp / max(tp + fn, 1)
+
+        return {
+            'precision': float(precision),
+            'recall': float(recall),
+            'f1_score': float(2 * precision * recall / max(precision + recall, 1e-12)),
+        }
+
     @staticmethod
     def compare_models(model_results: Dict[str, Dict]) -> Dict:
         """Compare multiple models"""
@@ -363,14 +636,16 @@ if __name__ == '__main__':
 
     # Simulate data collection
     np.random.seed(42)
-    for i in range(500):
-        variant = framework.assign_user_to_variant(f'user_{i}', exp_id)
+    user_ids = [f'user_{i}' for i in range(500)]
+    in_treatment = framework.assign_batch(user_ids, exp_id)
+    for i, user_id in enumerate(user_ids):
+        variant = 'treatment' if in_treatment[i] else 'control'
         if variant == 'control':
             metric_value = np.random.normal(0.85, 0.05)
         else:
             metric_value = np.random.normal(0.88, 0.05)
 
-        framework.collect_metric(exp_id, variant, f'user_{i}', metric_value)
+        framework.collect_metric(exp_id, variant, user_id, metric_value)
 
     # Get results
     summary = framework.get_experiment_summary(exp_id)
@@ -7,17 +7,33 @@ Date: November 21, 2024
 
 import logging
 import asyncio
+import math
 import time
 import json
-from datetime import datetime, timedelta
+from collections import Counter, deque
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
 import aiohttp
 import random
 
+try:
+    from prometheus_client import Histogram
+except ImportError:  # optional: check durations are only logged at debug level
+    Histogram = None
+
+try:
+    import uvloop
+except ImportError:  # optional: the default asyncio event loop is used instead
+    uvloop = None
+
 logger = logging.getLogger(__name__)
 
+CHECK_DURATION = Histogram(
+    'synthetic_check_duration_ms', 'Synthetic check duration in milliseconds',
+    ['check', 'status'], buckets=(50, 100, 250, 500, 1000, 2500, 5000)
+) if Histogram is not None else None
+
 
 class CheckType(Enum):
     """Types of synthetic checks"""
@@ -28,14 +44,14 @@ class CheckType(Enum):
     USER_FLOW = 'user_flow'
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CheckResult:
     """Result of synthetic check"""
     check_name: str
     check_type: CheckType
     status: str  # success, failure, timeout
     response_time_ms: float
-    timestamp: datetime
+    timestamp: int  # ns since the epoch (time.time_ns())
     error_message: Optional[str] = None
     location: str = 'primary'  # For multi-region checks
 
@@ -50,55 +66,63 @@ class HTTPCheck:
         self.method = method
         self.timeout = timeout
         self.expected_status = expected_status
+        self._client_timeout = aiohttp.ClientTimeout(total=timeout)
 
-    async def run(self) -> CheckResult:
-        """Execute HTTP check"""
-        start_time = time.time()
-        try:
+    async def run(self, session: Optional[aiohttp.ClientSession] = None) -> CheckResult:
+        """Execute HTTP check
+
+        Args:
+            session: Shared client session; a private one is opened if omitted
+        """
+        if session is None:
             async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    self.method, self.url,
-                    timeout=aiohttp.ClientTimeout(total=self.timeout)
-                ) as response:
-                    response_time = (time.time() - start_time) * 1000
-
-                    if response.status == self.expected_status:
-                        return CheckResult(
-                            check_name=self.name,
-                            check_type=CheckType.HTTP,
-                            status='success',
-                            response_time_ms=response_time,
-                            timestamp=datetime.utcnow()
-                        )
-                    else:
-                        return CheckResult(
-                            check_name=self.name,
-                            check_type=CheckType.HTTP,
-                            status='failure',
-                            response_time_ms=response_time,
-                            timestamp=datetime.utcnow(),
-                            error_message=f"Expected {self.expected_status}, got {response.status}"
-                        )
+                return await self.run(session)
+
+        start_ns = time.monotonic_ns()
+        try:
+            async with session.request(
+                self.method, self.url,
+                timeout=self._client_timeout
+            ) as response:
+                response_time = (time.monotonic_ns() - start_ns) / 1e6
+
+                if response.status == self.expected_status:
+                    return CheckResult(
+                        check_name=self.name,
+                        check_type=CheckType.HTTP,
+                        status='success',
+                        response_time_ms=response_time,
+                        timestamp=time.time_ns()
+                    )
+                else:
+                    return CheckResult(
+                        check_name=self.name,
+                        check_type=CheckType.HTTP,
+                        status='failure',
+                        response_time_ms=response_time,
+                        timestamp=time.time_ns(),
+                        error_message=f"Expected {self.expected_status}, got {response.status}"
+                    )
 
         except asyncio.TimeoutError:
-            response_time = (time.time() - start_time) * 1000
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
             return CheckResult(
                 check_name=self.name,
                 check_type=CheckType.HTTP,
                 status='timeout',
                 response_time_ms=response_time,
-                timestamp=datetime.utcnow(),
+                timestamp=time.time_ns(),
                 error_message=f"Request timeout after {self.timeout}s"
             )
 
         except Exception as e:
-            response_time = (time.time() - start_time) * 1000
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
             return CheckResult(
                 check_name=self.name,
                 check_type=CheckType.HTTP,
                 status='failure',
                 response_time_ms=response_time,
-                timestamp=datetime.utcnow(),
+                timestamp=time.time_ns(),
                 error_message=str(e)
             )
 
@@ -106,53 +130,101 @@ class HTTPCheck:
 class APITransactionCheck:
     """End-to-end API transaction synthetic check"""
 
+    STEP_TIMEOUT = aiohttp.ClientTimeout(total=30)
+    JSON_HEADERS = {'Content-Type': 'application/json'}
+
     def __init__(self, name: str, base_url: str, steps: List[Dict]):
         self.name = name
         self.base_url = base_url
-        self.steps = steps  # List of {method, path, payload, expected_response}
+        # List of {method, path, payload, expected_response, depends_on}; a step
+        # without depends_on (list of step indices) depends on the previous step
+        self.steps = steps
+        self._waves = self._group_steps(steps)
+        # Payloads are serialized once instead of on every run
+        self._bodies = [
+            json.dumps(step['payload']).encode() if step.get('payload') is not None else None
+            for step in steps
+        ]
 
-    async def run(self) -> CheckResult:
-        """Execute multi-step API transaction"""
-        start_time = time.time()
-        try:
+    @staticmethod
+    def _group_steps(steps: List[Dict]) -> List[List[int]]:
+        """Split steps into waves of consecutive steps that can run concurrently"""
+        waves = []
+        current = []
+        for i, step in enumerate(steps):
+            depends_on = step.get('depends_on', [i - 1] if i else [])
+            if any(dep in current for dep in depends_on):
+                waves.append(current)
+                current = []
+            current.append(i)
+        if current:
+            waves.append(current)
+        return waves
+
+    async def _run_step(self, session: aiohttp.ClientSession, i: int) -> Optional[str]:
+        """Execute one step; returns an error message if it failed"""
+        step = self.steps[i]
+        body = self._bodies[i]
+        async with session.request(
+            step.get('method', 'GET'), f"{self.base_url}{step['path']}",
+            data=body, headers=self.JSON_HEADERS if body is not None else None,
+            timeout=self.STEP_TIMEOUT
+        ) as response:
+            if response.status not in [200, 201, 204]:
+                return f"Step {i} failed with {response.status}"
+
+            # The body is only read when there is something to check in it
+            expected = step.get('expected_response')
+            if expected is not None:
+                body = await response.json()
+                if any(body.get(key) != value for key, value in expected.items()):
+                    return f"Step {i} returned unexpected response"
+
+        return None
+
+    async def run(self, session: Optional[aiohttp.ClientSession] = None) -> CheckResult:
+        """Execute multi-step API transaction
+
+        Args:
+            session: Shared client session; a private one is opened if omitted
+        """
+        if session is None:
             async with aiohttp.ClientSession() as session:
-                for i, step in enumerate(self.steps):
-                    url = f"{self.base_url}{step['path']}"
-                    method = step.get('method', 'GET')
-                    payload = step.get('payload')
-
-                    async with session.request(
-                        method, url, json=payload,
-                        timeout=aiohttp.ClientTimeout(total=30)
-                    ) as response:
-                        if response.status not in [200, 201, 204]:
-                            response_time = (time.time() - start_time) * 1000
-                            return CheckResult(
-                                check_name=self.name,
-                                check_type=CheckType.API_TRANSACTION,
-                                status='failure',
-                                response_time_ms=response_time,
-                                timestamp=datetime.utcnow(),
-                                error_message=f"Step {i} failed with {response.status}"
-                            )
-
-                response_time = (time.time() - start_time) * 1000
-                return CheckResult(
-                    check_name=self.name,
-                    check_type=CheckType.API_TRANSACTION,
-                    status='success',
-                    response_time_ms=response_time,
-                    timestamp=datetime.utcnow()
-                )
+                return await self.run(session)
+
+        start_ns = time.monotonic_ns()
+        try:
+            for wave in self._waves:
+                errors = await asyncio.gather(*(self._run_step(session, i) for i in wave))
+                error = next((e for e in errors if e is not None), None)
+                if error is not None:
+                    response_time = (time.monotonic_ns() - start_ns) / 1e6
+                    return CheckResult(
+                        check_name=self.name,
+                        check_type=CheckType.API_TRANSACTION,
+                        status='failure',
+                        response_time_ms=response_time,
+                        timestamp=time.time_ns(),
+                        error_message=error
+                    )
+
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
+            return CheckResult(
+                check_name=self.name,
+                check_type=CheckType.API_TRANSACTION,
+                status='success',
+                response_time_ms=response_time,
+                timestamp=time.time_ns()
+            )
 
         except Exception as e:
-            response_time = (time.time() - start_time) * 1000
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
             return CheckResult(
                 check_name=self.name,
                 check_type=CheckType.API_TRANSACTION,
                 status='failure',
                 response_time_ms=response_time,
-                timestamp=datetime.utcnow(),
+                timestamp=time.time_ns(),
                 error_message=str(e)
             )
 
@@ -164,64 +236,71 @@ class UserFlowCheck:
         self.name = name
         self.base_url = base_url
 
-    async def run(self) -> CheckResult:
-        """Execute simulated user flow"""
-        start_time = time.time()
-        try:
+    async def run(self, session: Optional[aiohttp.ClientSession] = None) -> CheckResult:
+        """Execute simulated user flow
+
+        Args:
+            session: Shared client session; a private one is opened if omitted
+        """
+        if session is None:
             async with aiohttp.ClientSession() as session:
-                # Step 1: Login
-                async with session.post(
-                    f"{self.base_url}/api/auth/login",
-                    json={'email': 'test@example.com', 'password': 'test123'}
-                ) as response:
-                    if response.status != 200:
-                        raise Exception(f"Login failed: {response.status}")
-                    data = await response.json()
-                    token = data.get('token')
-
-                # Step 2: Get dashboard
-                headers = {'Authorization': f'Bearer {token}'}
-                async with session.get(
-                    f"{self.base_url}/api/dashboard",
-                    headers=headers
-                ) as response:
-                    if response.status != 200:
-                        raise Exception(f"Dashboard failed: {response.status}")
-
-                # Step 3: Create alert
-                async with session.post(
-                    f"{self.base_url}/api/alerts",
-                    json={'title': 'Test Alert', 'severity': 'warning'},
-                    headers=headers
-                ) as response:
-                    if response.status not in [200, 201]:
-                        raise Exception(f"Alert creation failed: {response.status}")
-
-                # Step 4: Logout
-                async with session.post(
-                    f"{self.base_url}/api/auth/logout",
-                    headers=headers
-                ) as response:
-                    if response.status != 200:
-                        raise Exception(f"Logout failed: {response.status}")
-
-                response_time = (time.time() - start_time) * 1000
-                return CheckResult(
-                    check_name=self.name,
-                    check_type=CheckType.USER_FLOW,
-                    status='success',
-                    response_time_ms=response_time,
-                    timestamp=datetime.utcnow()
-                )
+                return await self.run(session)
+
+        start_ns = time.monotonic_ns()
+        try:
+            # Step 1: Login
+            async with session.post(
+                f"{self.base_url}/api/auth/login",
+                json={'email': 'test@example.com', 'password': 'test123'}
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"Login failed: {response.status}")
+                data = await response.json()
+                token = data.get('token')
+
+            # Step 2: Get dashboard
+            headers = {'Authorization': f'Bearer {token}'}
+            async with session.get(
+                f"{self.base_url}/api/dashboard",
+                headers=headers
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"Dashboard failed: {response.status}")
+
+            # Step 3: Create alert
+            async with session.post(
+                f"{self.base_url}/api/alerts",
+                json={'title': 'Test Alert', 'severity': 'warning'},
+                headers=headers
+            ) as response:
+                if response.status not in [200, 201]:
+                    raise Exception(f"Alert creation failed: {response.status}")
+
+            # Step 4: Logout
+            async with session.post(
+                f"{self.base_url}/api/auth/logout",
+                headers=headers
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"Logout failed: {response.status}")
+
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
+            return CheckResult(
+                check_name=self.name,
+                check_type=CheckType.USER_FLOW,
+                status='success',
+                response_time_ms=response_time,
+                timestamp=time.time_ns()
+            )
 
         except Exception as e:
-            response_time = (time.time() - start_time) * 1000
+            response_time = (time.monotonic_ns() - start_ns) / 1e6
             return CheckResult(
                 check_name=self.name,
                 check_type=CheckType.USER_FLOW,
                 status='failure',
                 response_time_ms=response_time,
-                timestamp=datetime.utcnow(),
+                timestamp=time.time_ns(),
                 error_message=str(e)
             )
 
@@ -229,40 +308,87 @@ class UserFlowCheck:
 class SyntheticMonitoringScheduler:
     """Schedule and execute synthetic checks"""
 
-    def __init__(self, check_interval_seconds: int = 60):
+    # Results kept for availability reporting
+    RESULTS_RETENTION_HOURS = 24
+
+    def __init__(self, check_interval_seconds: int = 60, max_concurrent_checks: int = 20):
         self.check_interval = check_interval_seconds
+        # Caps simultaneous checks so DNS/TLS bursts don't skew measured latency
+        self._semaphore = asyncio.Semaphore(max_concurrent_checks)
         self.checks: List = []
-        self.results: List[CheckResult] = []
+        self.results: deque = deque(maxlen=self._results_capacity())
         self.running = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Counts over everything currently in self.results
+        self._success_count = 0
+        self._total_count = 0
 
     def add_check(self, check):
         """Add a synthetic check"""
         self.checks.append(check)
+        self.results = deque(self.results, maxlen=self._results_capacity())
         logger.info(f"Added check: {check.name}")
 
+    def _results_capacity(self) -> int:
+        """Results produced by all checks over the retention window"""
+        runs = math.ceil(self.RESULTS_RETENTION_HOURS * 3600 / self.check_interval)
+        return runs * max(1, len(self.checks))
+
     async def run_all_checks(self) -> List[CheckResult]:
         """Run all checks concurrently"""
         logger.info(f"Running {len(self.checks)} synthetic checks...")
-        tasks = [check.run() for check in self.checks]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
-        self.results.extend(results)
+        session = self._get_session()
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(self._run_check(check, session)) for check in self.checks]
+        results = [task.result() for task in tasks]
+
+        for result in results:
+            if len(self.results) == self.results.maxlen:
+                evicted = self.results[0]
+                self._total_count -= 1
+                self._success_count -= evicted.status == 'success'
+            self.results.append(result)
+            self._total_count += 1
+            self._success_count += result.status == 'success'
         return results
 
+    async def _run_check(self, check, session: aiohttp.ClientSession) -> CheckResult:
+        """Run one check once a concurrency slot is free"""
+        async with self._semaphore:
+            return await check.run(session)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Session shared by all checks, so connections are kept alive between runs"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def start_scheduler(self):
         """Start continuous monitoring"""
         self.running = True
         logger.info(f"Starting synthetic monitoring scheduler (interval: {self.check_interval}s)")
 
-        while self.running:
-            try:
-                results = await self.run_all_checks()
-                self._log_results(results)
-                self._update_metrics(results)
-                await asyncio.sleep(self.check_interval)
-
-            except Exception as e:
-                logger.error(f"Scheduler error: {e}")
-                await asyncio.sleep(self.check_interval)
+        try:
+            while self.running:
+                try:
+                    results = await self.run_all_checks()
+                    self._log_results(results)
+                    self._update_metrics(results)
+                    await asyncio.sleep(self.check_interval)
+
+                except Exception as e:
+                    logger.error(f"Scheduler error: {e}")
+                    await asyncio.sleep(self.check_interval)
+        finally:
+            await self.close()
 
     def stop_scheduler(self):
         """Stop scheduler"""
@@ -271,11 +397,12 @@ class SyntheticMonitoringScheduler:
 
     def _log_results(self, results: List[CheckResult]):
         """Log check results"""
-        success_count = sum(1 for r in results if r.status == 'success')
-        failure_count = sum(1 for r in results if r.status == 'failure')
-        timeout_count = sum(1 for r in results if r.status == 'timeout')
+        status_counts = Counter(r.status for r in results)
 
-        logger.info(f"Check Results: Success={success_count}, Failure={failure_count}, Timeout={timeout_count}")
+        logger.info(
+            f"Check Results: Success={status_counts['success']}, "
+            f"Failure={status_counts['failure']}, Timeout={status_counts['timeout']}"
+        )
 
         for result in results:
             if result.status != 'success':
@@ -285,21 +412,39 @@ class SyntheticMonitoringScheduler:
 
     def _update_metrics(self, results: List[CheckResult]):
         """Update Prometheus metrics"""
-        # In production, export to Prometheus
-        for result in results:
-            logger.debug(f"Metric: synthetic_check_duration_ms{{check='{result.check_name}'}} {result.response_time_ms}")
+        if CHECK_DURATION is not None:
+            for result in results:
+                CHECK_DURATION.labels(check=result.check_name, status=result.status).observe(
+                    result.response_time_ms
+                )
+        elif logger.isEnabledFor(logging.DEBUG):
+            for result in results:
+                logger.debug(f"Metric: synthetic_check_duration_ms{{check='{result.check_name}'}} {result.response_time_ms}")
 
     def get_availability(self, time_window_hours: int = 24) -> Dict:
-        """Calculate availability from synthetic checks"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=time_window_hours)
-        recent_results = [r for r in self.results if r.timestamp >= cutoff_time]
-
-        if not recent_results:
+        """Calculate availability from synthetic checks
+
+        Args:
+            time_window_hours: Window to report on; clamped to
+                RESULTS_RETENTION_HOURS, since older results are not kept.
+                The returned time_window_hours is the window actually used
+        """
+        time_window_hours = min(time_window_hours, self.RESULTS_RETENTION_HOURS)
+        cutoff_ns = time.time_ns() - time_window_hours * 3600 * 10**9
+
+        # Results are appended in run order, so only the oldest end can fall
+        # outside the window; discount those from the running counts
+        success_count = self._success_count
+        total_count = self._total_count
+        for result in self.results:
+            if result.timestamp >= cutoff_ns:
+                break
+            total_count -= 1
+            success_count -= result.status == 'success'
+
+        if total_count == 0:
             return {'availability': 0, 'uptime_percentage': 0}
 
-        success_count = sum(1 for r in recent_results if r.status == 'success')
-        total_count = len(recent_results)
-
         availability = (success_count / total_count) * 100 if total_count > 0 else 0
 
         return {
@@ -405,7 +550,13 @@ async def run_synthetic_monitoring():
     except KeyboardInterrupt:
         scheduler.stop_scheduler()
 
+    finally:
+        await scheduler.close()
+
 
 if __name__ == '__main__':
     # Run event loop
-    asyncio.run(run_synthetic_monitoring())
+    if uvloop is not None:
+        uvloop.run(run_synthetic_monitoring())
+    else:
+        asyncio.run(run_synthetic_monitoring())
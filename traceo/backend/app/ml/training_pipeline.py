@@ -8,19 +8,23 @@ Date: November 21, 2024
 
 import os
 import json
+import hashlib
 import logging
 from datetime import datetime
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 import mlflow
 import mlflow.sklearn
 import mlflow.pytorch
-from sklearn.model_selection import train_test_split, cross_validate
+from sklearn.model_selection import train_test_split, cross_validate, StratifiedShuffleSplit
 from sklearn.preprocessing import StandardScaler, RobustScaler
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import (
     precision_recall_fscore_support, roc_auc_score, confusion_matrix,
     classification_report, f1_score, accuracy_score
@@ -32,6 +36,16 @@ import boto3
 import warnings
 from app.ml.anomaly_detection_engine import IsolationForestAnomalyDetector
 
+try:
+    import connectorx
+except ImportError:  # optional: metrics are streamed through a server-side cursor instead
+    connectorx = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # optional: pandas rolling reductions are used instead
+    njit = None
+
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
@@ -43,6 +57,123 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Up to this window size, rolling min/max rescan the window with branch-free
+# min/max instead of maintaining monotonic deques, whose pops mispredict on
+# noisy data
+_SCAN_MAX_WINDOW = 16
+
+if njit is not None:
+    @njit(parallel=True, nogil=True, cache=True)
+    def _rolling_stats(x, window):
+        """Rolling mean, std (ddof=1), min and max of each column in one pass
+
+        x is (rows, columns); returns (4, rows, columns). Like pandas
+        rolling(window), a window holding any NaN yields NaN.
+        """
+        n, m = x.shape
+        out = np.full((4, n, m), np.nan)
+        scan = window <= _SCAN_MAX_WINDOW
+        for j in prange(m):
+            nobs = 0
+            mean = 0.0
+            ssqdm = 0.0
+            # Run length of equal values, so constant windows get a std of
+            # exactly 0 rather than the Welford residue (as pandas does)
+            prev = x[0, j]
+            same = 0
+            # Monotonic deques of row indices: increasing values for min, decreasing for max
+            q_min = np.empty(0 if scan else n, dtype=np.int64)
+            q_max = np.empty(0 if scan else n, dtype=np.int64)
+            h_min = t_min = h_max = t_max = 0
+            for i in range(n):
+                v = x[i, j]
+                if v == v:
+                    nobs += 1
+                    delta = v - mean
+                    mean += delta / nobs
+                    ssqdm += delta * (v - mean)
+                    same = same + 1 if v == prev else 1
+                    prev = v
+                if v == v and not scan:
+                    while t_min > h_min and x[q_min[t_min - 1], j] >= v:
+                        t_min -= 1
+                    q_min[t_min] = i
+                    t_min += 1
+                    while t_max > h_max and x[q_max[t_max - 1], j] <= v:
+                        t_max -= 1
+                    q_max[t_max] = i
+                    t_max += 1
+
+                if i >= window:
+                    old = x[i - window, j]
+                    if old == old:
+                        nobs -= 1
+                        if nobs > 0:
+                            delta = old - mean
+                            mean -= delta / nobs
+                            ssqdm -= delta * (old - mean)
+                        else:
+                            mean = 0.0
+                            ssqdm = 0.0
+                    while h_min < t_min and q_min[h_min] <= i - window:
+                        h_min += 1
+                    while h_max < t_max and q_max[h_max] <= i - window:
+                        h_max += 1
+
+                if nobs == window:
+                    out[0, i, j] = mean
+                    if nobs > 1:
+                        out[1, i, j] = 0.0 if same >= nobs else np.sqrt(max(ssqdm, 0.0) / (nobs - 1))
+                    if scan:
+                        lo = hi = v
+                        for k in range(i - window + 1, i):
+                            lo = min(lo, x[k, j])
+                            hi = max(hi, x[k, j])
+                        out[2, i, j] = lo
+                        out[3, i, j] = hi
+                    else:
+                        out[2, i, j] = x[q_min[h_min], j]
+                        out[3, i, j] = x[q_max[h_max], j]
+        return out
+
+
+def _fit_estimator(estimator, X: np.ndarray, y: Optional[np.ndarray] = None):
+    """Fit and return estimator
+
+    Module-level so joblib.Memory can cache it by (estimator params, X, y).
+    """
+    return estimator.fit(X) if y is None else estimator.fit(X, y)
+
+
+def _estimator_fitter(cache_dir: Optional[str]):
+    """_fit_estimator, memoized on disk under cache_dir when one is given"""
+    if cache_dir is None:
+        return _fit_estimator
+    memory = joblib.Memory(os.path.expanduser(cache_dir), verbose=0)
+    return memory.cache(_fit_estimator)
+
+
+# Held-out rows sampled per permutation-importance repeat; each repeat costs
+# one prediction per feature over the sample
+IMPORTANCE_MAX_SAMPLES = 10_000
+
+
+def _boosting_model() -> HistGradientBoostingClassifier:
+    """Gradient Boosting model shared by the supervised trainers
+
+    Always unfitted: the fit cache already skips retraining on unchanged
+    data, and warm-starting on a new data window would keep the previous
+    run's early-stopping history.
+    """
+    return HistGradientBoostingClassifier(
+        max_iter=200,
+        max_depth=8,
+        early_stopping=True,
+        validation_fraction=0.1,
+        random_state=42
+    )
+
+
 class DataLoader:
     """Load training data from PostgreSQL and S3"""
 
@@ -71,8 +202,17 @@ class DataLoader:
             logger.error(f"Failed to connect to PostgreSQL: {e}")
             raise
 
-    def load_metrics(self, time_range_days: int = 30) -> pd.DataFrame:
-        """Load metrics from metric_collection table"""
+    def load_metrics(self, time_range_days: int = 30,
+                     feature_spec: Optional[Dict[str, List[int]]] = None) -> pd.DataFrame:
+        """Load metrics from metric_collection table
+
+        Args:
+            time_range_days: How far back to load
+            feature_spec: Optional {'lags': [...], 'windows': [...]}; when given,
+                the lag, rolling and change-rate features of value are computed
+                by PostgreSQL window functions and returned as extra columns
+                named like FeatureEngineer.create_metric_features output
+        """
         query = f"""
             SELECT
                 timestamp,
@@ -85,36 +225,135 @@ class DataLoader:
             ORDER BY timestamp DESC
             LIMIT 10000000
         """
+        if feature_spec is not None:
+            query = self._feature_query(query, 'value',
+                                        feature_spec.get('lags', [5, 10, 30]),
+                                        feature_spec.get('windows', [5, 10, 30]))
+        else:
+            # Newest rows are selected above; hand them over oldest first so
+            # FeatureEngineer can skip its sort
+            query = f"SELECT * FROM ({query}) AS m ORDER BY timestamp"
         try:
-            df = pd.read_sql_query(query, self.conn)
+            df = self._read_query(query)
             logger.info(f"Loaded {len(df)} metric records")
             return df
         except Exception as e:
             logger.error(f"Failed to load metrics: {e}")
             raise
 
-    def load_incidents(self) -> pd.DataFrame:
-        """Load labeled incidents from incident_records table"""
-        query = """
+    def _read_query(self, query: str, itersize: int = 100_000) -> pd.DataFrame:
+        """Read a large result set without boxing every row at once
+
+        connectorx reads straight into Arrow columns when installed;
+        otherwise a server-side cursor streams itersize rows at a time, so
+        only one batch of row tuples is alive while the frame is built.
+        """
+        if connectorx is not None:
+            uri = (f'postgresql://{quote(self.postgres_user, safe="")}:'
+                   f'{quote(self.postgres_password, safe="")}@'
+                   f'{self.postgres_host}:{self.postgres_port}/{self.postgres_db}')
+            table = connectorx.read_sql(uri, query, return_type='arrow')
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+
+        chunks = []
+        with self.conn.cursor(name='load_metrics') as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                columns = [col[0] for col in cursor.description]
+                chunks.append(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+            if not chunks:
+                return pd.DataFrame(columns=[col[0] for col in cursor.description or []])
+        # A batch whose column was all NULL stays object; re-infer over the whole result
+        return pd.concat(chunks, ignore_index=True).infer_objects()
+
+    @staticmethod
+    def _feature_query(base_query: str, metric: str,
+                       lags: List[int], windows: List[int]) -> str:
+        """Wrap base_query with window-function features of one metric column
+
+        Rows are ordered by timestamp across the whole result, as in
+        FeatureEngineer, and rolling values stay NULL until a full window
+        exists (pandas rolling(window) semantics).
+        """
+        columns = [f'LAG({metric}, {lag}) OVER w AS {metric}_lag_{lag}' for lag in lags]
+        for window in windows:
+            frame = f'(w ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW)'
+            for stat, func in (('mean', 'AVG'), ('std', 'STDDEV_SAMP'),
+                               ('min', 'MIN'), ('max', 'MAX')):
+                columns.append(
+                    f'CASE WHEN ROW_NUMBER() OVER w >= {window} '
+                    f'THEN {func}({metric}) OVER {frame} END AS {metric}_rolling_{stat}_{window}'
+                )
+        # Division by a zero previous value gives +/-inf (NULL for 0/0) like pandas
+        columns += [
+            f"CASE WHEN LAG({metric}) OVER w = 0 "
+            f"THEN CASE SIGN({metric}) WHEN 1 THEN 'Infinity'::float8 WHEN -1 THEN '-Infinity'::float8 END "
+            f"ELSE {metric} / LAG({metric}) OVER w - 1 END AS {metric}_pct_change",
+            f'{metric} - LAG({metric}) OVER w AS {metric}_diff',
+        ]
+        select = ',\n                '.join(columns)
+        return f"""
             SELECT
-                id,
-                incident_id,
-                timestamp,
-                title,
-                severity,
-                duration_minutes,
-                root_cause,
-                root_cause_component,
-                affected_services,
-                metrics_before,
-                metrics_during,
-                metrics_after
+                m.*,
+                {select}
+            FROM ({base_query}) AS m
+            WINDOW w AS (ORDER BY timestamp)
+            ORDER BY timestamp
+        """
+
+    def data_version(self, time_range_days: int = 30) -> Tuple:
+        """Cheap summary of the training data that changes whenever it does
+
+        Returns (row count, max timestamp) of the metrics in range and of the
+        labeled incidents, for keying cached feature matrices.
+        """
+        query = f"""
+            SELECT
+                (SELECT COUNT(*) FROM metric_collection
+                 WHERE created_at >= NOW() - INTERVAL '{time_range_days} days'),
+                (SELECT MAX(timestamp) FROM metric_collection
+                 WHERE created_at >= NOW() - INTERVAL '{time_range_days} days'),
+                (SELECT COUNT(*) FROM incident_records WHERE label_status = 'labeled'),
+                (SELECT MAX(timestamp) FROM incident_records WHERE label_status = 'labeled')
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(query)
+            return tuple(cursor.fetchone())
+
+    INCIDENT_COLUMNS = [
+        'id', 'incident_id', 'timestamp', 'title', 'severity', 'duration_minutes',
+        'root_cause', 'root_cause_component', 'affected_services',
+        'metrics_before', 'metrics_during', 'metrics_after'
+    ]
+    INCIDENT_CATEGORIES = ['severity', 'root_cause_component']
+
+    def load_incidents(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load labeled incidents from incident_records table
+
+        Args:
+            columns: Columns to select (from INCIDENT_COLUMNS); all of them
+                when omitted. Leaving out the JSON metrics_* snapshots avoids
+                transferring and boxing them when only labels are needed
+        """
+        columns = columns or self.INCIDENT_COLUMNS
+        unknown = set(columns) - set(self.INCIDENT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown incident columns: {sorted(unknown)}")
+        select = ',\n                '.join(columns)
+        query = f"""
+            SELECT
+                {select}
             FROM incident_records
             WHERE label_status = 'labeled'
             ORDER BY timestamp DESC
         """
+        dtype = {col: 'category' for col in self.INCIDENT_CATEGORIES if col in columns}
         try:
-            df = pd.read_sql_query(query, self.conn)
+            df = pd.read_sql_query(query, self.conn, dtype=dtype or None)
             logger.info(f"Loaded {len(df)} labeled incidents")
             return df
         except Exception as e:
@@ -157,6 +396,61 @@ class FeatureEngineer:
         df[f'{metric}_diff'] = df[metric].diff()
         return df
 
+    def create_metric_features(self, block: pd.DataFrame,
+                               lags: List[int] = [5, 10, 30],
+                               windows: List[int] = [5, 10, 30]) -> pd.DataFrame:
+        """Lag, rolling and change-rate features for every column of block
+
+        Each operation runs once over the whole block instead of once per
+        metric; columns come out grouped per metric, in the same order and
+        with the same names as the per-metric create_* methods.
+        """
+        frames = [block.shift(lag).add_suffix(f'_lag_{lag}') for lag in lags]
+        values = np.asfortranarray(block.to_numpy(dtype=np.float64))
+        for window in windows:
+            if njit is not None:
+                # All four statistics from a single pass per column
+                stats = _rolling_stats(values, window)
+                frames += [
+                    pd.DataFrame(stats[k], index=block.index, columns=block.columns, copy=False)
+                    .add_suffix(f'_rolling_{stat}_{window}')
+                    for k, stat in enumerate(('mean', 'std', 'min', 'max'))
+                ]
+            else:
+                rolling = block.rolling(window)
+                frames += [
+                    rolling.mean().add_suffix(f'_rolling_mean_{window}'),
+                    rolling.std().add_suffix(f'_rolling_std_{window}'),
+                    rolling.min().add_suffix(f'_rolling_min_{window}'),
+                    rolling.max().add_suffix(f'_rolling_max_{window}'),
+                ]
+
+        # Change rates straight from the array, with the same NaN/inf results
+        # as pct_change (x / previous - 1) and diff
+        change = np.full((2,) + values.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(values[1:], values[:-1], out=change[0, 1:])
+        change[0, 1:] -= 1
+        np.subtract(values[1:], values[:-1], out=change[1, 1:])
+        frames += [
+            pd.DataFrame(change[k], index=block.index, columns=block.columns,
+                         copy=False).add_suffix(suffix)
+            for k, suffix in enumerate(('_pct_change', '_diff'))
+        ]
+
+        suffixes = self.feature_suffixes(lags, windows)
+        ordered = [f'{metric}{suffix}' for metric in block.columns for suffix in suffixes]
+        return pd.concat(frames, axis=1)[ordered]
+
+    @staticmethod
+    def feature_suffixes(lags: List[int] = [5, 10, 30],
+                         windows: List[int] = [5, 10, 30]) -> List[str]:
+        """Column name suffixes produced per metric by create_metric_features"""
+        return ([f'_lag_{lag}' for lag in lags]
+                + [f'_rolling_{stat}_{window}' for window in windows
+                   for stat in ('mean', 'std', 'min', 'max')]
+                + ['_pct_change', '_diff'])
+
     def handle_missing_values(self, df: pd.DataFrame, strategy: str = 'forward_fill') -> pd.DataFrame:
         """Handle missing values"""
         if strategy == 'forward_fill':
@@ -177,64 +471,86 @@ class FeatureEngineer:
         """Create complete feature matrix"""
         logger.info("Creating feature matrix...")
 
-        # Pivot metrics table for time series features
-        df = raw_metrics.copy()
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-        df = df.set_index('timestamp').sort_index()
+        # Pivot metrics table for time series features; DataLoader returns
+        # rows in time order, so the sort is usually skipped
+        df = raw_metrics.assign(
+            timestamp=pd.to_datetime(raw_metrics['timestamp'], unit='s')
+        ).set_index('timestamp')
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+
+        # Features already computed in SQL (DataLoader.load_metrics feature_spec)
+        # keep their leading NULLs so the incomplete windows are dropped below
+        suffixes = self.feature_suffixes()
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        derived = {f'{col}{suffix}' for col in numeric_cols for suffix in suffixes}
+        precomputed = [col for col in df.columns if col in derived]
 
         # Handle missing values
-        df = self.handle_missing_values(df)
-
-        # For each metric, create lag and rolling features
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        for metric in numeric_cols[:20]:  # Limit to top 20 metrics for performance
-            df = self.create_lag_features(df, metric, lags=[5, 10, 30])
-            df = self.create_rolling_statistics(df, metric, windows=[5, 10, 30])
-            df = self.create_change_rate_features(df, metric)
-
-        # Drop rows with NaN
-        df = df.dropna()
-
-        # Create feature matrix
-        X = df.values
-        self.feature_names_ = df.columns.tolist()
-
-        # Create labels: 1 if within 1 hour before incident, 0 otherwise
-        y = np.zeros(len(df))
-        for _, incident in incidents.iterrows():
-            incident_time = pd.to_datetime(incident['timestamp'])
-            # Mark 1 hour window before incident as anomalous
-            mask = (df.index >= incident_time - pd.Timedelta(hours=1)) & (df.index < incident_time)
-            y[mask] = 1
-
-        logger.info(f"Created feature matrix: {X.shape}, Labels: {np.bincount(y.astype(int))}")
+        if precomputed:
+            df = pd.concat([self.handle_missing_values(df.drop(columns=precomputed)),
+                            df[precomputed]], axis=1)
+        else:
+            df = self.handle_missing_values(df)
+
+        # Lag, rolling and change-rate features for all metrics at once
+        metrics = [col for col in numeric_cols if col not in derived][:20]  # Limit to top 20 metrics for performance
+        pending = [m for m in metrics
+                   if not all(f'{m}{suffix}' in df.columns for suffix in suffixes)]
+        if pending:
+            df = pd.concat([df, self.create_metric_features(df[pending])], axis=1)
+
+        # Create feature matrix; the estimators work in float32 internally,
+        # so cast once here instead of on every fit. Rows with any missing
+        # value are then dropped from the float32 block directly rather than
+        # copying the whole frame through dropna first
+        features = df.select_dtypes(include=[np.number])
+        A = features.to_numpy(dtype=np.float32, na_value=np.nan)
+        valid = ~np.isnan(A).any(axis=1)
+        other = df.columns.difference(features.columns, sort=False)
+        if len(other):
+            valid &= df[other].notna().all(axis=1).to_numpy()
+        X = A[valid]
+        index = df.index[valid]
+        self.feature_names_ = features.columns.tolist()
+
+        # Create labels: 1 if within 1 hour before incident, 0 otherwise.
+        # A row at t is labeled when some incident falls in (t, t + 1h]; windows
+        # may overlap, so count incidents per row with two binary searches
+        incident_times = pd.DatetimeIndex(pd.to_datetime(incidents['timestamp'])).dropna().sort_values()
+        upcoming = (incident_times.searchsorted(index + pd.Timedelta(hours=1), side='right')
+                    - incident_times.searchsorted(index, side='right'))
+        y = (upcoming > 0).astype(np.int8)
+
+        logger.info(f"Created feature matrix: {X.shape}, Labels: {np.bincount(y, minlength=2)}")
         return X, y
 
 
 class FailurePredictionModel:
-    """Ensemble model for failure prediction (LSTM + Random Forest + Prophet)"""
+    """Ensemble model for failure prediction (LSTM + Gradient Boosting + Prophet)"""
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
+        """Initialize model
+
+        Args:
+            cache_dir: Directory for memoizing fits; retraining on the same
+                data with the same parameters then loads from disk
+        """
         self.models = {}
         self.metrics = {}
+        self._fit = _estimator_fitter(cache_dir)
 
-    def build_random_forest(self, X_train: np.ndarray, y_train: np.ndarray,
-                           X_test: np.ndarray, y_test: np.ndarray) -> Dict:
-        """Build Random Forest model"""
-        logger.info("Training Random Forest for failure prediction...")
+    def build_gradient_boosting(self, X_train: np.ndarray, y_train: np.ndarray,
+                                X_test: np.ndarray, y_test: np.ndarray) -> Dict:
+        """Build histogram-based Gradient Boosting model"""
+        logger.info("Training Gradient Boosting for failure prediction...")
 
-        rf_model = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=15,
-            min_samples_split=5,
-            random_state=42,
-            n_jobs=-1
-        )
-        rf_model.fit(X_train, y_train)
+        gb_model = _boosting_model()
+        gb_model = self._fit(gb_model, X_train, y_train)
 
         # Evaluate
-        y_pred = rf_model.predict(X_test)
-        y_pred_proba = rf_model.predict_proba(X_test)[:, 1]
+        y_pred = gb_model.predict(X_test)
+        y_pred_proba = gb_model.predict_proba(X_test)[:, 1]
 
         precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='binary')
         auc = roc_auc_score(y_test, y_pred_proba)
@@ -245,34 +561,47 @@ class FailurePredictionModel:
             'recall': float(recall),
             'f1_score': float(f1),
             'auc': float(auc),
-            'accuracy': float(accuracy)
+            'accuracy': float(accuracy),
+            'n_iter': int(gb_model.n_iter_)
         }
 
-        logger.info(f"Random Forest metrics: {metrics}")
+        logger.info(f"Gradient Boosting metrics: {metrics}")
 
         return {
-            'model': rf_model,
+            'model': gb_model,
             'metrics': metrics,
             'y_pred': y_pred,
             'y_pred_proba': y_pred_proba
         }
 
-    def train(self, X: np.ndarray, y: np.ndarray) -> Dict:
-        """Train failure prediction ensemble"""
+    def train(self, X: np.ndarray, y: np.ndarray,
+              split: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict:
+        """Train failure prediction ensemble
+
+        Args:
+            X: Feature matrix
+            y: Binary labels
+            split: Precomputed (train, test) row indices; a stratified 80/20
+                split is made when omitted
+        """
         # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
+        if split is None:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=0.2, random_state=42, stratify=y
+            )
+        else:
+            train_idx, test_idx = split
+            X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
 
-        # Train Random Forest (primary model)
-        rf_result = self.build_random_forest(X_train, y_train, X_test, y_test)
-        self.models['random_forest'] = rf_result['model']
-        self.metrics = rf_result['metrics']
+        # Train Gradient Boosting (primary model)
+        gb_result = self.build_gradient_boosting(X_train, y_train, X_test, y_test)
+        self.models['gradient_boosting'] = gb_result['model']
+        self.metrics = gb_result['metrics']
 
         return {
-            'model': rf_result['model'],
+            'model': gb_result['model'],
             'metrics': self.metrics,
-            'y_pred': rf_result['y_pred'],
+            'y_pred': gb_result['y_pred'],
             'y_test': y_test
         }
 
@@ -280,9 +609,17 @@ class FailurePredictionModel:
 class AnomalyDetectionModel:
     """Ensemble model for anomaly detection (Isolation Forest + Elliptic Envelope)"""
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
+        """Initialize model
+
+        Args:
+            cache_dir: Directory for memoizing fits; retraining on the same
+                data with the same parameters then loads from disk
+        """
         self.models = {}
         self.metrics = {}
+        self.cache_dir = cache_dir
+        self._fit = _estimator_fitter(cache_dir)
 
     def build_isolation_forest(self, X: np.ndarray) -> Dict:
         """Build Isolation Forest using unified detector"""
@@ -291,14 +628,13 @@ class AnomalyDetectionModel:
         # Use unified IsolationForest detector
         iso_detector = IsolationForestAnomalyDetector(
             contamination=0.1,
-            random_state=42
+            random_state=42,
+            cache_dir=self.cache_dir
         )
         iso_detector.fit(X)
 
         # Get predictions
-        anomaly_indices = iso_detector.detect_anomalies(X)
-        iso_pred = np.array([-1 if i in anomaly_indices else 1 for i in range(len(X))])
-        iso_score = (iso_pred == -1).astype(int)
+        iso_score = iso_detector.detect_anomalies_mask(X).astype(int)
 
         return {
             'model': iso_detector,
@@ -312,8 +648,8 @@ class AnomalyDetectionModel:
 
         from sklearn.covariance import EllipticEnvelope
 
-        elliptic = EllipticEnvelope(contamination=0.1, random_state=42)
-        elliptic_pred = elliptic.fit_predict(X)
+        elliptic = self._fit(EllipticEnvelope(contamination=0.1, random_state=42), X)
+        elliptic_pred = elliptic.predict(X)
         elliptic_score = (elliptic_pred == -1).astype(int)
 
         return {
@@ -353,15 +689,30 @@ class AnomalyDetectionModel:
 
 
 class RootCauseAnalysisModel:
-    """Random Forest model for root cause analysis"""
+    """Gradient Boosting model for root cause analysis"""
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
+        """Initialize model
+
+        Args:
+            cache_dir: Directory for memoizing fits; retraining on the same
+                data with the same parameters then loads from disk
+        """
         self.model = None
         self.metrics = {}
+        self._fit = _estimator_fitter(cache_dir)
 
-    def train(self, X: np.ndarray, y: np.ndarray) -> Dict:
-        """Train root cause analysis model"""
-        logger.info("Training Random Forest for root cause analysis...")
+    def train(self, X: np.ndarray, y: np.ndarray,
+              split: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict:
+        """Train root cause analysis model
+
+        Args:
+            X: Feature matrix
+            y: Root cause labels
+            split: Precomputed (train, test) row indices; a stratified 80/20
+                split is made when omitted
+        """
+        logger.info("Training Gradient Boosting for root cause analysis...")
 
         # Encode labels
         unique_causes = np.unique(y)
@@ -369,22 +720,21 @@ class RootCauseAnalysisModel:
         y_encoded = np.array([label_map.get(cause, 0) for cause in y])
 
         # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
-        )
+        if split is None:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
+            )
+        else:
+            train_idx, test_idx = split
+            X_train, X_test = X[train_idx], X[test_idx]
+            y_train, y_test = y_encoded[train_idx], y_encoded[test_idx]
 
         # Train model
-        rf_model = RandomForestClassifier(
-            n_estimators=200,
-            max_depth=20,
-            min_samples_split=5,
-            random_state=42,
-            n_jobs=-1
-        )
-        rf_model.fit(X_train, y_train)
+        gb_model = _boosting_model()
+        gb_model = self._fit(gb_model, X_train, y_train)
 
         # Evaluate
-        y_pred = rf_model.predict(X_test)
+        y_pred = gb_model.predict(X_test)
         precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='weighted')
         accuracy = accuracy_score(y_test, y_pred)
 
@@ -392,27 +742,62 @@ class RootCauseAnalysisModel:
             'precision': float(precision),
             'recall': float(recall),
             'f1_score': float(f1),
-            'accuracy': float(accuracy)
+            'accuracy': float(accuracy),
+            'n_iter': int(gb_model.n_iter_)
         }
 
         logger.info(f"Root Cause Analysis metrics: {self.metrics}")
 
+        # Boosted trees have no impurity importances; measure on a capped
+        # sample of held-out data
+        importance = permutation_importance(
+            gb_model, X_test, y_test, n_repeats=5, random_state=42, n_jobs=-1,
+            max_samples=min(IMPORTANCE_MAX_SAMPLES, len(X_test))
+        )
+
         return {
-            'model': rf_model,
+            'model': gb_model,
             'metrics': self.metrics,
-            'feature_importance': rf_model.feature_importances_,
+            'feature_importance': importance.importances_mean,
             'label_map': label_map
         }
 
 
+def _train_model(name: str, X: np.ndarray, y: np.ndarray,
+                 cache_dir: Optional[str] = None,
+                 split: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[object, Dict]:
+    """Train one of the pipeline's models and return (trainer, result)
+
+    Module-level so it can run in a worker process.
+    """
+    if name == 'failure':
+        trainer = FailurePredictionModel(cache_dir=cache_dir)
+        return trainer, trainer.train(X, y, split=split)
+    if name == 'anomaly':
+        trainer = AnomalyDetectionModel(cache_dir=cache_dir)
+        return trainer, trainer.train(X)
+    if name == 'root_cause':
+        trainer = RootCauseAnalysisModel(cache_dir=cache_dir)
+        return trainer, trainer.train(X, y, split=split)
+    raise ValueError(f"Unknown model: {name}")
+
+
 class MLTrainingPipeline:
     """Main training pipeline orchestrator"""
 
     def __init__(self, experiment_name: str):
         self.experiment_name = experiment_name
         self.mlflow_uri = os.getenv('MLFLOW_TRACKING_URI', 'http://mlflow-server:5000')
+        # Queue params/metrics in the background instead of one blocking
+        # request per call (MLflow >= 2.11; ignored by older clients)
+        os.environ.setdefault('MLFLOW_ENABLE_ASYNC_LOGGING', 'true')
         mlflow.set_tracking_uri(self.mlflow_uri)
         mlflow.set_experiment(experiment_name)
+        self.feature_cache_dir = Path(os.getenv('FEATURE_CACHE_DIR', '/tmp/feat_cache'))
+        self.feature_cache_size = int(os.getenv('FEATURE_CACHE_SIZE', 8))
+        self.model_cache_dir = os.getenv('MODEL_CACHE_DIR', '/tmp/sk_cache')
+        self.model_cache_bytes = int(os.getenv('MODEL_CACHE_BYTES', 2 ** 32))
+        self.model_dir = Path('/tmp/ml_models')
 
     def run(self):
         """Execute full training pipeline"""
@@ -430,11 +815,24 @@ class MLTrainingPipeline:
                 postgres_db=os.getenv('POSTGRESQL_DB', 'traceo')
             )
             loader.connect()
-            metrics_df = loader.load_metrics(time_range_days=30)
-            incidents_df = loader.load_incidents()
+            time_range_days = 30
+            feature_spec = {'lags': [5, 10, 30], 'windows': [5, 10, 30]}
+            cache_key = hashlib.blake2b(
+                repr((time_range_days, feature_spec, loader.data_version(time_range_days))).encode(),
+                digest_size=16
+            ).hexdigest()
+            cached = self._load_cached_features(cache_key)
+            if cached is None:
+                metrics_df = loader.load_metrics(time_range_days=time_range_days,
+                                                 feature_spec=feature_spec)
+                # Only the incident times are needed for labeling
+                incidents_df = loader.load_incidents(columns=['timestamp'])
             loader.close()
 
-            if len(metrics_df) == 0 or len(incidents_df) == 0:
+            if cached is not None:
+                logger.info(f"Using cached feature matrix {cache_key}")
+                X, y = cached
+            elif len(metrics_df) == 0 or len(incidents_df) == 0:
                 logger.warning("No data found. Using synthetic data for demo...")
                 X, y = self._create_synthetic_data()
             else:
@@ -442,6 +840,7 @@ class MLTrainingPipeline:
                 logger.info("Phase 2: Feature engineering...")
                 engineer = FeatureEngineer()
                 X, y = engineer.create_feature_matrix(metrics_df, incidents_df)
+                self._cache_features(cache_key, X, y, engineer.feature_names_)
 
             # 3. Train models
             logger.info("Phase 3: Training models...")
@@ -453,29 +852,44 @@ class MLTrainingPipeline:
                     'positive_samples': (y == 1).sum() if isinstance(y, np.ndarray) else 0
                 })
 
-                # Train failure prediction
-                failure_model = FailurePredictionModel()
-                failure_result = failure_model.train(X, y if isinstance(y, np.ndarray) else y.values)
-                mlflow.log_metrics({f'failure_{k}': v for k, v in failure_result['metrics'].items()})
-                mlflow.sklearn.log_model(failure_result['model'], 'failure_prediction')
-
-                # Train anomaly detection
-                anomaly_model = AnomalyDetectionModel()
-                anomaly_result = anomaly_model.train(X)
-                mlflow.log_metrics({f'anomaly_{k}': v for k, v in anomaly_result['metrics'].items()})
-
-                # Train root cause
-                root_cause_model = RootCauseAnalysisModel()
-                root_cause_result = root_cause_model.train(X, y if isinstance(y, np.ndarray) else y.values)
-                mlflow.log_metrics({f'root_cause_{k}': v for k, v in root_cause_result['metrics'].items()})
-                mlflow.sklearn.log_model(root_cause_result['model'], 'root_cause_analysis')
-
-                # Save models to disk
-                self._save_models(
-                    failure_result['model'],
-                    anomaly_model.models,
-                    root_cause_result['model']
-                )
+                # Train failure prediction, anomaly detection and root cause
+                # side by side; X is memory-mapped into the workers, and the
+                # cores are split between them for their own threads. With a
+                # single core this runs in-process, one model after another
+                names = ['failure', 'anomaly', 'root_cause']
+                labels = y if isinstance(y, np.ndarray) else y.values
+                # One stratified 80/20 split shared by the supervised models
+                # (the same rows train_test_split would pick for each)
+                split = next(StratifiedShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+                             .split(np.zeros((len(labels), 1)), labels))
+                cpus = os.cpu_count() or 1
+                n_workers = min(len(names), cpus)
+                with joblib.parallel_config(backend='loky',
+                                            inner_max_num_threads=max(1, cpus // n_workers)):
+                    trained = joblib.Parallel(n_jobs=n_workers, mmap_mode='r')(
+                        joblib.delayed(_train_model)(name, X, labels, self.model_cache_dir, split=split)
+                        for name in names
+                    )
+                (_, failure_result), (anomaly_model, anomaly_result), (_, root_cause_result) = trained
+
+                # One batch of metrics for all three models
+                mlflow.log_metrics({
+                    **{f'failure_{k}': v for k, v in failure_result['metrics'].items()},
+                    **{f'anomaly_{k}': v for k, v in anomaly_result['metrics'].items()},
+                    **{f'root_cause_{k}': v for k, v in root_cause_result['metrics'].items()}
+                })
+
+                # Save models to disk and trim the fit cache while the
+                # artifacts upload; uploads stay on this thread, which owns
+                # the active MLflow run
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    saved = executor.submit(self._save_models,
+                                            failure_result['model'],
+                                            anomaly_model.models,
+                                            root_cause_result['model'])
+                    mlflow.sklearn.log_model(failure_result['model'], 'failure_prediction')
+                    mlflow.sklearn.log_model(root_cause_result['model'], 'root_cause_analysis')
+                    saved.result()
 
                 logger.info("Training pipeline completed successfully!")
                 return {
@@ -489,6 +903,28 @@ class MLTrainingPipeline:
             logger.error(f"Training pipeline failed: {e}")
             raise
 
+    def _load_cached_features(self, cache_key: str):
+        """Return the cached (X, y) for cache_key, or None on a miss"""
+        path = self.feature_cache_dir / f'{cache_key}.joblib'
+        if not path.exists():
+            return None
+        cached = joblib.load(path)
+        os.utime(path)  # mark as recently used for eviction
+        return cached['X'], cached['y']
+
+    def _cache_features(self, cache_key: str, X: np.ndarray, y: np.ndarray,
+                        feature_names: List[str]):
+        """Store a feature matrix, evicting the least recently used entries"""
+        self.feature_cache_dir.mkdir(parents=True, exist_ok=True)
+        joblib.dump({'X': X, 'y': y, 'feature_names': feature_names},
+                    self.feature_cache_dir / f'{cache_key}.joblib')
+
+        entries = sorted(self.feature_cache_dir.glob('*.joblib'),
+                         key=lambda p: max(p.stat().st_atime, p.stat().st_mtime),
+                         reverse=True)
+        for stale in entries[self.feature_cache_size:]:
+            stale.unlink(missing_ok=True)
+
     def _create_synthetic_data(self) -> Tuple[np.ndarray, np.ndarray]:
         """Create synthetic data for testing"""
         logger.info("Creating synthetic training data...")
@@ -497,8 +933,8 @@ class MLTrainingPipeline:
         n_samples = 10000
         n_features = 100
 
-        X = np.random.randn(n_samples, n_features)
-        y = np.random.randint(0, 2, n_samples)
+        X = np.random.randn(n_samples, n_features).astype(np.float32)
+        y = np.random.randint(0, 2, n_samples).astype(np.int8)
 
         # Add some signal
         X[y == 1] += 1.0
@@ -506,8 +942,8 @@ class MLTrainingPipeline:
         return X, y
 
     def _save_models(self, failure_model, anomaly_models: Dict, root_cause_model):
-        """Save models to local filesystem"""
-        output_dir = Path('/tmp/ml_models')
+        """Save models to local filesystem and keep the fit cache bounded"""
+        output_dir = self.model_dir
         output_dir.mkdir(exist_ok=True)
 
         joblib.dump(failure_model, output_dir / 'failure_prediction.pkl')
@@ -516,6 +952,10 @@ class MLTrainingPipeline:
 
         logger.info(f"Models saved to {output_dir}")
 
+        joblib.Memory(self.model_cache_dir, verbose=0).reduce_size(
+            bytes_limit=self.model_cache_bytes
+        )
+
 
 if __name__ == '__main__':
     pipeline = MLTrainingPipeline(experiment_name='traceo-ml-phase7l')
@@ -14,8 +14,9 @@ import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from collections import Counter
 import json
 import logging
 from abc import ABC, abstractmethod
@@ -29,9 +30,23 @@ from tensorflow import keras
 from tensorflow.keras import layers
 from app.ml.anomaly_detection_engine import IsolationForestAnomalyDetector
 
+try:
+    from numba import njit
+except ImportError:  # optional: the feature kernel runs as plain Python instead
+    njit = None
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Order of the values written by _extract_features_kernel
+FEATURE_NAMES = (
+    'hour_deviation', 'day_deviation', 'location_deviation', 'data_volume_deviation',
+    'device_match', 'resource_frequency', 'login_hour', 'login_frequency',
+    'temporal_consistency', 'resource_diversity', 'geographic_velocity', 'session_duration',
+    'connection_confidence', 'behavioral_normality', 'timezone_consistency', 'cumulative_risk',
+)
+N_FEATURES = len(FEATURE_NAMES)
+
 
 class AnomalyType(Enum):
     """Types of detected anomalies"""
@@ -74,12 +89,28 @@ class UserBehaviorBaseline:
     created_at: datetime = None
     updated_at: datetime = None
 
+    # Lookup structures for feature extraction, derived from the fields above
+    hour_dist: np.ndarray = field(init=False, repr=False, compare=False)
+    day_dist: np.ndarray = field(init=False, repr=False, compare=False)
+    location_set: frozenset = field(init=False, repr=False, compare=False)
+    resource_set: frozenset = field(init=False, repr=False, compare=False)
+    device_set: frozenset = field(init=False, repr=False, compare=False)
+    resource_freq: Dict[str, float] = field(init=False, repr=False, compare=False)
+
     def __post_init__(self):
         if self.created_at is None:
             self.created_at = datetime.utcnow()
         if self.updated_at is None:
             self.updated_at = datetime.utcnow()
 
+        self.hour_dist = np.array([self.login_hours_distribution.get(h, 0) for h in range(24)], dtype=np.float64)
+        self.day_dist = np.array([self.day_of_week_pattern.get(d, 0) for d in range(7)], dtype=np.float64)
+        self.location_set = frozenset(self.typical_locations)
+        self.resource_set = frozenset(self.typical_resources)
+        self.device_set = frozenset(self.device_fingerprints)
+        n_resources = max(len(self.typical_resources), 1)
+        self.resource_freq = {r: c / n_resources for r, c in Counter(self.typical_resources).items()}
+
 
 @dataclass
 class UserActivity:
@@ -138,6 +169,66 @@ class ThreatScore:
     explanation: str
 
 
+def _extract_features_kernel(hour, day, latitude, longitude, prev_latitude, prev_longitude,
+                             time_diff_hours, data_volume, duration_seconds, hour_dist, day_dist,
+                             avg_data_volume, data_volume_std, avg_login_time, login_frequency,
+                             is_new_location, is_new_resource, is_known_device, resource_frequency,
+                             max_travel_speed, out):
+    """Write the feature vector of one activity into out (FEATURE_NAMES order)
+
+    time_diff_hours <= 0 means there is no earlier activity to measure
+    travel velocity against.
+    """
+    expected_hour_prob = hour_dist[hour]
+    expected_day_prob = day_dist[day]
+
+    out[0] = 1 - expected_hour_prob
+    out[1] = 1 - expected_day_prob
+    out[2] = 1.0 if is_new_location else 0.0
+
+    if data_volume_std > 0:
+        out[3] = min(abs(data_volume - avg_data_volume) / data_volume_std, 5.0) / 5.0
+    else:
+        out[3] = 0.5 if is_new_location else 0.0
+
+    out[4] = 1.0 if is_known_device else 0.2
+    out[5] = resource_frequency
+    out[6] = hour / 24.0
+    out[7] = min(login_frequency / 24.0, 1.0)
+    out[8] = (expected_hour_prob + expected_day_prob) / 2
+    out[9] = 1.0 if is_new_resource else 0.1
+
+    # Impossible travel check (flat-earth distance, roughly 111 km per degree)
+    velocity_risk = 0.0
+    if time_diff_hours > 0:
+        lat_diff = abs(latitude - prev_latitude)
+        lon_diff = abs(longitude - prev_longitude)
+        velocity_kmh = np.sqrt(lat_diff**2 + lon_diff**2) * 111 / time_diff_hours
+        if velocity_kmh > max_travel_speed:
+            velocity_risk = min(velocity_kmh / max_travel_speed, 5.0) / 5.0
+    out[10] = velocity_risk
+
+    out[11] = min(duration_seconds / 3600, 1.0)
+    out[12] = expected_hour_prob
+    out[13] = (expected_hour_prob + expected_day_prob + resource_frequency) / 3
+
+    hour_diff = abs(hour - avg_login_time)
+    if hour_diff > 12:
+        hour_diff = 24 - hour_diff
+    out[14] = 1 - (hour_diff / 12)
+
+    anomaly_count = 0
+    for i in range(15):
+        if out[i] > 0.5:
+            anomaly_count += 1
+    out[15] = min(anomaly_count / 16, 1.0)
+    return out
+
+
+if njit is not None:
+    _extract_features_kernel = njit(cache=True, nogil=True)(_extract_features_kernel)
+
+
 class IsolationForestDetector:
     """Real-time anomaly detection using Isolation Forest (unified engine wrapper)"""
 
@@ -155,11 +246,18 @@ class IsolationForestDetector:
             contamination=contamination,
             random_state=42
         )
+        # Range of the detector's scores on the training data
+        self._score_min = 0.0
+        self._score_max = 1.0
         self.is_trained = False
 
     def train(self, X: np.ndarray) -> None:
         """Train the detector on normal behavior data"""
         self.detector.fit(X)
+        train_scores = self.detector.get_anomaly_scores(X)
+        if train_scores.size:
+            self._score_min = float(train_scores.min())
+            self._score_max = float(train_scores.max())
         self.is_trained = True
         logger.info(f"IsolationForest (unified) trained on {X.shape[0]} samples")
 
@@ -179,10 +277,13 @@ class IsolationForestDetector:
         # Get anomaly scores from unified detector (0-1 scale)
         scores = self.detector.get_anomaly_scores(X)
 
-        # Scale from 0-1 to 0-100
-        scores_normalized = scores * 100
+        # Stretch the training score range over 0-100, in place
+        scores -= self._score_min
+        scores /= self._score_max - self._score_min + 1e-10
+        np.clip(scores, 0, 1, out=scores)
+        scores *= 100
 
-        return scores_normalized
+        return scores
 
 
 class LSTMAutoencoderBehavior:
@@ -209,7 +310,7 @@ class LSTMAutoencoderBehavior:
         """Build LSTM Autoencoder architecture"""
         # Encoder
         inputs = keras.Input(shape=(self.sequence_length, self.feature_dim))
-        encoded = layers.LSTM(64, activation='relu')(inputs)
+        encoded = layers.LSTM(64, activation='relu', return_sequences=True)(inputs)
         encoded = layers.LSTM(32, activation='relu')(encoded)
 
         # Decoder
@@ -253,12 +354,13 @@ class LSTMAutoencoderBehavior:
         self.is_trained = True
         logger.info(f"LSTM Autoencoder trained with threshold={self.threshold:.4f}")
 
-    def predict_anomaly_score(self, X_sequences: np.ndarray) -> np.ndarray:
+    def predict_anomaly_score(self, X_sequences: np.ndarray, batch_size: int = 32) -> np.ndarray:
         """
         Predict anomaly scores based on reconstruction error
 
         Args:
             X_sequences: Shape (n_samples, sequence_length, feature_dim)
+            batch_size: Sequences per forward pass
 
         Returns:
             Anomaly scores (0-100)
@@ -266,7 +368,7 @@ class LSTMAutoencoderBehavior:
         if not self.is_trained:
             raise ValueError("Model must be trained first")
 
-        predictions = self.model.predict(X_sequences, verbose=0)
+        predictions = self.model.predict(X_sequences, batch_size=batch_size, verbose=0)
         mse = np.mean(np.power(X_sequences - predictions, 2), axis=(1, 2))
 
         # Scale to 0-100 based on threshold
@@ -367,19 +469,14 @@ class HybridThreatDetector:
             logger.warning(f"Insufficient data for user {user_id}")
             return
 
-        # Calculate temporal patterns
-        hours = [a.timestamp.hour for a in relevant_activities]
-        days_of_week = [a.timestamp.weekday() for a in relevant_activities]
+        n = len(relevant_activities)
 
-        hour_counts = {}
-        for h in range(24):
-            count = sum(1 for hh in hours if hh == h)
-            hour_counts[h] = count / max(len(hours), 1)
+        # Calculate temporal patterns
+        hours = np.fromiter((a.timestamp.hour for a in relevant_activities), dtype=np.int8, count=n)
+        days_of_week = np.fromiter((a.timestamp.weekday() for a in relevant_activities), dtype=np.int8, count=n)
 
-        day_counts = {}
-        for d in range(7):
-            count = sum(1 for dd in days_of_week if dd == d)
-            day_counts[d] = count / max(len(days_of_week), 1)
+        hour_counts = dict(enumerate((np.bincount(hours, minlength=24) / n).tolist()))
+        day_counts = dict(enumerate((np.bincount(days_of_week, minlength=7) / n).tolist()))
 
         # Extract locations and resources
         locations = list(set(a.location for a in relevant_activities))
@@ -387,9 +484,9 @@ class HybridThreatDetector:
         device_fps = list(set(a.device_fingerprint for a in relevant_activities))
 
         # Calculate data volume statistics
-        volumes = np.array([a.data_transferred_gb for a in relevant_activities])
-        avg_volume = float(np.mean(volumes))
-        std_volume = float(np.std(volumes))
+        volumes = np.fromiter((a.data_transferred_gb for a in relevant_activities), dtype=np.float64, count=n)
+        avg_volume = float(volumes.mean())
+        std_volume = float(volumes.std())
 
         # Create baseline
         baseline = UserBehaviorBaseline(
@@ -434,92 +531,45 @@ class HybridThreatDetector:
         15. Time zone consistency (0-1)
         16. Cumulative anomaly risk (0-1)
         """
-        features = {}
-
-        # 1. Hour deviation
-        hour = activity.timestamp.hour
-        expected_hour_prob = baseline.login_hours_distribution.get(hour, 0)
-        features['hour_deviation'] = 1 - expected_hour_prob
-
-        # 2. Day-of-week deviation
-        day = activity.timestamp.weekday()
-        expected_day_prob = baseline.day_of_week_pattern.get(day, 0)
-        features['day_deviation'] = 1 - expected_day_prob
-
-        # 3. Location deviation
-        is_new_location = activity.location not in baseline.typical_locations
-        features['location_deviation'] = 1.0 if is_new_location else 0.0
+        return dict(zip(FEATURE_NAMES, self.feature_vector(activity, baseline).tolist()))
 
-        # 4. Data volume deviation
-        volume_deviation = abs(activity.data_transferred_gb - baseline.avg_data_volume)
-        if baseline.data_volume_std > 0:
-            features['data_volume_deviation'] = min(volume_deviation / baseline.data_volume_std, 5.0) / 5.0
-        else:
-            features['data_volume_deviation'] = 0.5 if is_new_location else 0.0
-
-        # 5. Device fingerprint match
-        is_known_device = activity.device_fingerprint in baseline.device_fingerprints
-        features['device_match'] = 1.0 if is_known_device else 0.2
-
-        # 6. Resource frequency
-        resource_frequency = baseline.typical_resources.count(activity.resource_accessed) / max(len(baseline.typical_resources), 1)
-        features['resource_frequency'] = resource_frequency
-
-        # 7. Login time hour (normalized)
-        features['login_hour'] = hour / 24.0
-
-        # 8. Login frequency
-        features['login_frequency'] = min(baseline.typical_login_frequency / 24.0, 1.0)
-
-        # 9. Temporal consistency
-        temporal_consistency = (expected_hour_prob + expected_day_prob) / 2
-        features['temporal_consistency'] = temporal_consistency
+    def feature_vector(self, activity: UserActivity, baseline: UserBehaviorBaseline,
+                       out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Extract the features of extract_features as an array
 
-        # 10. Resource diversity (new resource factor)
-        is_new_resource = activity.resource_accessed not in baseline.typical_resources
-        features['resource_diversity'] = 1.0 if is_new_resource else 0.1
+        Args:
+            activity: Activity to describe
+            baseline: Baseline of the activity's user
+            out: Optional float array of length N_FEATURES to write into
 
-        # 11. Geographic velocity (impossible travel check)
-        velocity_risk = 0.0
-        if len(self.user_activity_history.get(activity.user_id, [])) > 0:
-            prev_activity = self.user_activity_history[activity.user_id][-1]
+        Returns:
+            Feature array in FEATURE_NAMES order
+        """
+        if out is None:
+            out = np.empty(N_FEATURES, dtype=np.float64)
+
+        time_diff_hours = 0.0
+        prev_latitude = prev_longitude = 0.0
+        history = self.user_activity_history.get(activity.user_id)
+        if history:
+            prev_activity = history[-1]
             time_diff_hours = (activity.timestamp - prev_activity.timestamp).total_seconds() / 3600
-            if time_diff_hours > 0:
-                # Simplified distance calculation (Haversine would be more accurate)
-                lat_diff = abs(activity.latitude - prev_activity.latitude)
-                lon_diff = abs(activity.longitude - prev_activity.longitude)
-                distance_km = np.sqrt(lat_diff**2 + lon_diff**2) * 111  # Rough approximation
-                velocity_kmh = distance_km / time_diff_hours
-
-                if velocity_kmh > baseline.max_impossible_travel_speed:
-                    velocity_risk = min(velocity_kmh / baseline.max_impossible_travel_speed, 5.0) / 5.0
-
-        features['geographic_velocity'] = velocity_risk
-
-        # 12. Session duration deviation
-        features['session_duration'] = min(activity.duration_seconds / 3600, 1.0)  # Normalize to hours
-
-        # 13. Connection time confidence
-        hour_confidence = expected_hour_prob
-        features['connection_confidence'] = hour_confidence
-
-        # 14. Behavioral normality score
-        behavioral_normality = (expected_hour_prob + expected_day_prob + resource_frequency) / 3
-        features['behavioral_normality'] = behavioral_normality
-
-        # 15. Time zone consistency
-        # Simplified: check if hour matches typical login hours
-        avg_hour = baseline.avg_login_time
-        hour_diff = abs(hour - avg_hour)
-        if hour_diff > 12:
-            hour_diff = 24 - hour_diff
-        features['timezone_consistency'] = 1 - (hour_diff / 12)
-
-        # 16. Cumulative anomaly risk
-        anomaly_count = sum(1 for v in features.values() if v > 0.5)
-        features['cumulative_risk'] = min(anomaly_count / 16, 1.0)
-
-        return features
+            prev_latitude, prev_longitude = prev_activity.latitude, prev_activity.longitude
+
+        return _extract_features_kernel(
+            activity.timestamp.hour, activity.timestamp.weekday(),
+            float(activity.latitude), float(activity.longitude), float(prev_latitude), float(prev_longitude),
+            time_diff_hours, float(activity.data_transferred_gb), float(activity.duration_seconds),
+            baseline.hour_dist, baseline.day_dist,
+            float(baseline.avg_data_volume), float(baseline.data_volume_std), float(baseline.avg_login_time),
+            float(baseline.typical_login_frequency),
+            activity.location not in baseline.location_set,
+            activity.resource_accessed not in baseline.resource_set,
+            activity.device_fingerprint in baseline.device_set,
+            baseline.resource_freq.get(activity.resource_accessed, 0.0),
+            float(baseline.max_impossible_travel_speed), out
+        )
 
     def detect_anomalies(self, activity: UserActivity, baseline: UserBehaviorBaseline) -> Tuple[List[AnomalyType], float]:
         """
@@ -560,7 +610,7 @@ class HybridThreatDetector:
             confidence_scores.append(min(volume_deviation / (3 * baseline.data_volume_std), 1.0))
 
         # Check unusual resources
-        if activity.resource_accessed not in baseline.typical_resources:
+        if activity.resource_accessed not in baseline.resource_set:
             anomalies.append(AnomalyType.UNUSUAL_RESOURCES)
             confidence_scores.append(0.7)
 
@@ -575,85 +625,130 @@ class HybridThreatDetector:
         Returns:
             ThreatScore with detailed threat assessment
         """
-        if activity.user_id not in self.user_baselines:
-            logger.warning(f"No baseline for user {activity.user_id}")
-            return self._create_baseline_threat_score(activity)
-
-        baseline = self.user_baselines[activity.user_id]
-
-        # Extract features
-        features = self.extract_features(activity, baseline)
-        feature_array = np.array([list(features.values())])
-
-        # Detect specific anomalies
-        anomalies, anomaly_confidence = self.detect_anomalies(activity, baseline)
-
-        # Get scores from each detector
-        if_score = self.isolation_forest.predict_anomaly_score(feature_array)[0]
-        lstm_score = self.lstm_autoencoder.predict_anomaly_score(
-            self._create_sequence(activity, activity.user_id)
-        )[0] if len(self.user_activity_history.get(activity.user_id, [])) >= 24 else 0
-        xgb_score = self.xgboost_ensemble.predict_threat_probability(feature_array)[0] * 100
-
-        # Ensemble combination (weighted average)
-        threat_score = (if_score * 0.35 + lstm_score * 0.35 + xgb_score * 0.30)
-        threat_score = float(np.clip(threat_score, 0, 100))
-
-        # Determine threat level
-        if threat_score >= 80:
-            threat_level = ThreatLevel.CRITICAL
-        elif threat_score >= 50:
-            threat_level = ThreatLevel.HIGH
-        elif threat_score >= 20:
-            threat_level = ThreatLevel.MEDIUM
-        else:
-            threat_level = ThreatLevel.LOW
-
-        # Generate recommendations
-        recommendations = self._generate_recommendations(
-            threat_level, anomalies, threat_score
-        )
+        return self.predict_threats_batch([activity])[0]
 
-        # Create explanation
-        explanation = self._create_explanation(
-            threat_score, if_score, lstm_score, xgb_score, anomalies
-        )
+    def predict_threats_batch(self, activities: List[UserActivity]) -> List[ThreatScore]:
+        """
+        Threat detection for many activities with a single call per model
 
-        # Store activity
-        if activity.user_id not in self.user_activity_history:
-            self.user_activity_history[activity.user_id] = []
-        self.user_activity_history[activity.user_id].append(activity)
+        Activities are taken in order and each one sees the history left by
+        the ones before it, so the result matches calling predict_threat on
+        each of them in turn.
 
-        # Create threat score
-        result = ThreatScore(
-            user_id=activity.user_id,
-            timestamp=activity.timestamp,
-            threat_score=threat_score,
-            threat_level=threat_level,
-            primary_anomalies=anomalies,
-            confidence=float(np.clip(anomaly_confidence, 0, 1)),
-            isolation_forest_score=float(if_score),
-            lstm_autoencoder_score=float(lstm_score),
-            xgboost_ensemble_score=float(xgb_score),
-            impossible_travel_detected=AnomalyType.IMPOSSIBLE_TRAVEL in anomalies,
-            unusual_time_detected=AnomalyType.UNUSUAL_TIME in anomalies,
-            unusual_volume_detected=AnomalyType.UNUSUAL_VOLUME in anomalies,
-            unusual_resources_detected=AnomalyType.UNUSUAL_RESOURCES in anomalies,
-            behavioral_deviation_score=float(np.mean([
-                features.get('location_deviation', 0),
-                features.get('device_match', 1) - 1,
-                features.get('resource_diversity', 0)
-            ])),
-            recommended_actions=recommendations,
-            explanation=explanation
-        )
-
-        # Store in history
-        if activity.user_id not in self.threat_history:
-            self.threat_history[activity.user_id] = []
-        self.threat_history[activity.user_id].append(result)
+        Args:
+            activities: Activities to assess
 
-        return result
+        Returns:
+            ThreatScore per activity, in input order
+        """
+        results: List[Optional[ThreatScore]] = [None] * len(activities)
+        X = np.empty((len(activities), N_FEATURES), dtype=np.float64)
+        scored = []  # (position in activities, activity, anomalies, confidence)
+        sequence_rows = []
+        sequences = []
+        history_lengths = {}
+
+        for i, activity in enumerate(activities):
+            baseline = self.user_baselines.get(activity.user_id)
+            if baseline is None:
+                logger.warning(f"No baseline for user {activity.user_id}")
+                results[i] = self._create_baseline_threat_score(activity)
+                continue
+
+            row = len(scored)
+            self.feature_vector(activity, baseline, out=X[row])
+            anomalies, anomaly_confidence = self.detect_anomalies(activity, baseline)
+
+            history = self.user_activity_history.setdefault(activity.user_id, [])
+            history_lengths.setdefault(activity.user_id, len(history))
+            if len(history) >= 24:
+                sequence_rows.append(row)
+                sequences.append(self._create_sequence(activity, activity.user_id)[0])
+
+            # Store activity so later activities in the batch measure against it
+            history.append(activity)
+            scored.append((i, activity, anomalies, anomaly_confidence))
+
+        if not scored:
+            return results
+
+        X = X[:len(scored)]
+        try:
+            if_scores = self.isolation_forest.predict_anomaly_score(X)
+            xgb_scores = self.xgboost_ensemble.predict_threat_probability(X) * 100
+            lstm_scores = np.zeros(len(scored))
+            if sequences:
+                lstm_scores[sequence_rows] = self.lstm_autoencoder.predict_anomaly_score(
+                    np.stack(sequences), batch_size=256
+                )
+        except Exception:
+            # Leave the history as it was, as a failed predict_threat would
+            for user_id, length in history_lengths.items():
+                del self.user_activity_history[user_id][length:]
+            raise
+
+        location_idx = FEATURE_NAMES.index('location_deviation')
+        device_idx = FEATURE_NAMES.index('device_match')
+        resource_idx = FEATURE_NAMES.index('resource_diversity')
+
+        for row, (i, activity, anomalies, anomaly_confidence) in enumerate(scored):
+            if_score, lstm_score, xgb_score = if_scores[row], lstm_scores[row], xgb_scores[row]
+
+            # Ensemble combination (weighted average)
+            threat_score = (if_score * 0.35 + lstm_score * 0.35 + xgb_score * 0.30)
+            threat_score = float(np.clip(threat_score, 0, 100))
+
+            # Determine threat level
+            if threat_score >= 80:
+                threat_level = ThreatLevel.CRITICAL
+            elif threat_score >= 50:
+                threat_level = ThreatLevel.HIGH
+            elif threat_score >= 20:
+                threat_level = ThreatLevel.MEDIUM
+            else:
+                threat_level = ThreatLevel.LOW
+
+            # Generate recommendations
+            recommendations = self._generate_recommendations(
+                threat_level, anomalies, threat_score
+            )
+
+            # Create explanation
+            explanation = self._create_explanation(
+                threat_score, if_score, lstm_score, xgb_score, anomalies
+            )
+
+            # Create threat score
+            result = ThreatScore(
+                user_id=activity.user_id,
+                timestamp=activity.timestamp,
+                threat_score=threat_score,
+                threat_level=threat_level,
+                primary_anomalies=anomalies,
+                confidence=float(np.clip(anomaly_confidence, 0, 1)),
+                isolation_forest_score=float(if_score),
+                lstm_autoencoder_score=float(lstm_score),
+                xgboost_ensemble_score=float(xgb_score),
+                impossible_travel_detected=AnomalyType.IMPOSSIBLE_TRAVEL in anomalies,
+                unusual_time_detected=AnomalyType.UNUSUAL_TIME in anomalies,
+                unusual_volume_detected=AnomalyType.UNUSUAL_VOLUME in anomalies,
+                unusual_resources_detected=AnomalyType.UNUSUAL_RESOURCES in anomalies,
+                behavioral_deviation_score=float(np.mean([
+                    X[row, location_idx],
+                    X[row, device_idx] - 1,
+                    X[row, resource_idx]
+                ])),
+                recommended_actions=recommendations,
+                explanation=explanation
+            )
+
+            # Store in history
+            if activity.user_id not in self.threat_history:
+                self.threat_history[activity.user_id] = []
+            self.threat_history[activity.user_id].append(result)
+            results[i] = result
+
+        return results
 
     def _create_sequence(self, activity: UserActivity, user_id: str) -> np.ndarray:
         """Create activity sequence for LSTM input"""
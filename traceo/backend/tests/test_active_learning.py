@@ -0,0 +1,159 @@
+"""
+Test suite for the active learning selector and pipeline
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from app.ml.active_learning import (
+    ActiveLearningOracle,
+    ActiveLearningPipeline,
+    ActiveLearningSelector
+)
+
+
+# ============================================================================
+# Test Data Generators
+# ============================================================================
+
+def generate_labeled_data(n_samples: int = 300, n_features: int = 5, seed: int = 0):
+    """Generate a separable binary classification problem"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_samples, n_features))
+    y = (X[:, 0] + 0.5 * X[:, 1] > 0).astype(int)
+    return X, y
+
+
+# ============================================================================
+# Expected Model Change Tests
+# ============================================================================
+
+class TestExpectedModelChange:
+    """Test expected_model_change for forest and non-forest models"""
+
+    def test_random_forest_uses_leaf_statistics(self):
+        """A forest is scored from its leaves, not by uncertainty"""
+        X, y = generate_labeled_data()
+        X_unlabeled, _ = generate_labeled_data(200, seed=1)
+        model = RandomForestClassifier(n_estimators=20, random_state=42).fit(X, y)
+        selector = ActiveLearningSelector(model=model)
+
+        selected = selector.expected_model_change(X_unlabeled, X, y, n_select=10)
+
+        assert len(selected) == 10
+        assert len(set(selected)) == 10
+        assert all(0 <= i < len(X_unlabeled) for i in selected)
+
+    @pytest.mark.parametrize("model", [
+        GradientBoostingClassifier(n_estimators=20, random_state=42),
+        LogisticRegression(),
+    ])
+    def test_non_forest_falls_back_to_uncertainty(self, model):
+        """Boosted and linear models select the same samples as uncertainty sampling"""
+        X, y = generate_labeled_data()
+        X_unlabeled, _ = generate_labeled_data(200, seed=1)
+        selector = ActiveLearningSelector(model=model.fit(X, y))
+
+        selected = selector.expected_model_change(X_unlabeled, X, y, n_select=10)
+
+        assert sorted(selected) == sorted(selector.uncertainty_sampling(X_unlabeled, 10))
+
+    def test_multiclass_gradient_boosting(self):
+        """Boosting with a 2-D estimators_ grid does not reach the forest path"""
+        X, _ = generate_labeled_data()
+        y = np.digitize(X[:, 0], [-0.5, 0.5])
+        model = GradientBoostingClassifier(n_estimators=10, random_state=42).fit(X, y)
+        selector = ActiveLearningSelector(model=model)
+
+        selected = selector.select_samples(X, X, y, n_select=5, strategy='emuc')
+
+        assert len(selected) == 5
+
+
+# ============================================================================
+# Selection Strategy Tests
+# ============================================================================
+
+class TestSelectSamples:
+    """Test every strategy through select_samples"""
+
+    @pytest.mark.parametrize("strategy", ['uncertainty', 'margin', 'emuc', 'density'])
+    def test_strategy_returns_distinct_positions(self, strategy):
+        """Each strategy returns n distinct positions into X_unlabeled"""
+        X, y = generate_labeled_data()
+        X_unlabeled, _ = generate_labeled_data(200, seed=1)
+        model = RandomForestClassifier(n_estimators=20, random_state=42).fit(X, y)
+        selector = ActiveLearningSelector(model=model)
+
+        selected = selector.select_samples(X_unlabeled.astype(np.float32), X, y,
+                                           n_select=15, strategy=strategy)
+
+        assert len(set(selected)) == 15
+        assert all(0 <= i < len(X_unlabeled) for i in selected)
+
+
+# ============================================================================
+# Oracle and Pipeline Tests
+# ============================================================================
+
+class TestActiveLearningOracle:
+    """Test oracle labeling"""
+
+    def test_labels_rows_by_position(self):
+        """Row i of sample_data is labeled as sample_indices[i]"""
+        oracle = ActiveLearningOracle()
+        sample_data = pd.DataFrame({'cpu_usage': [0.95, 0.1, 0.2],
+                                    'memory_usage': [0.1, 0.9, 0.1]})
+
+        labels = oracle.get_labels_for_samples([500, 17, 42], sample_data)
+
+        assert labels == {500: 'cpu_saturation', 17: 'memory_leak', 42: 'unknown'}
+        assert [entry['index'] for entry in oracle.labeling_history] == [500, 17, 42]
+
+
+class TestActiveLearningPipeline:
+    """Test the end-to-end pipeline"""
+
+    def test_run_reaches_target(self):
+        """run() labels batches until the target size is reached"""
+        rng = np.random.default_rng(0)
+        X = rng.random((600, 8))
+        y = rng.integers(0, 2, 600)
+        np.random.seed(0)
+
+        pipeline = ActiveLearningPipeline(initial_labeled_size=50,
+                                          target_labeled_size=200,
+                                          batch_size=40)
+        result = pipeline.run(X, y, pd.DataFrame(X[:10]))
+
+        assert result['status'] == 'success'
+        assert result['final_labeled_count'] == 210
+        assert result['iterations'] == 4
+        assert [h['labeled_count'] for h in result['training_history']] == [90, 130, 170, 210]
+        assert all(0.0 <= h['accuracy'] <= 1.0 for h in result['training_history'])
+        assert len(pipeline.oracle.labeling_history) == 160
+        # Oracle labels are selected from rows not labeled before
+        labeled = [entry['index'] for entry in pipeline.oracle.labeling_history]
+        assert len(set(labeled)) == len(labeled)
+
+    def test_run_grows_forest_while_classes_are_unchanged(self):
+        """Iterations with the same label set add trees to the existing forest"""
+        rng = np.random.default_rng(1)
+        X = rng.random((400, 6))
+        y = rng.integers(0, 2, 400)
+        np.random.seed(1)
+
+        pipeline = ActiveLearningPipeline(initial_labeled_size=50,
+                                          target_labeled_size=170,
+                                          batch_size=30,
+                                          trees_per_iteration=5)
+        result = pipeline.run(X, y, pd.DataFrame(X[:10]))
+
+        # Iteration 1 is fit on int labels; the oracle's string labels force a
+        # fresh forest in iteration 2, which later iterations extend
+        assert result['iterations'] == 4
+        assert pipeline.selector.model.n_estimators == 50 + 2 * 5
+        assert list(pipeline.selector.model.classes_) == ['0', '1', 'unknown']
@@ -7,10 +7,12 @@ Tests: 40+ cases covering all components
 
 import pytest
 import asyncio
+import hashlib
 import json
+import logging
 import time
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 from app.microservices_gateway import (
     APIGateway,
@@ -26,9 +28,12 @@ from app.microservices_gateway import (
     CircuitBreaker,
     CircuitBreakerState,
     RateLimiter,
+    RedisRateLimiter,
     LoadBalancer,
     AuthenticationManager,
-    create_api_gateway
+    create_api_gateway,
+    HEALTH_STATE_HEALTHY,
+    HEALTH_STATE_UNHEALTHY
 )
 
 
@@ -110,7 +115,7 @@ def create_test_request(
 
 
 # ============================================================================
-# Rate Limiting Tests (8 tests)
+# Rate Limiting Tests (12 tests)
 # ============================================================================
 
 class TestRateLimiting:
@@ -220,11 +225,8 @@ class TestRateLimiting:
         blocked, _ = limiter.is_allowed(client_id, limit)
         assert not blocked
 
-        # Clear history (simulate time passing)
-        limiter.request_history[client_id] = []
-
-        # Should be allowed again
-        allowed, _ = limiter.is_allowed(client_id, limit)
+        # Two minutes later both window counters have expired
+        allowed, _ = limiter._sliding_window_check(client_id, limit, time.time() + 120)
         assert allowed
 
     def test_different_limit_strategies(self):
@@ -257,9 +259,105 @@ class TestRateLimiting:
             allowed, _ = limiter.is_allowed(client_id, limit)
             assert allowed
 
+    def test_rate_limiter_evicts_least_recently_used_clients(self):
+        """Test client state is capped at max_clients"""
+        limiter = RateLimiter(max_clients=2)
+        limit = RateLimit(
+            requests_per_second=10,
+            requests_per_minute=100,
+            requests_per_hour=1000
+        )
+
+        limiter.is_allowed("client_001", limit)
+        limiter.is_allowed("client_002", limit)
+        limiter.is_allowed("client_001", limit)
+        limiter.is_allowed("client_003", limit)
+
+        assert list(limiter.buckets) == ["client_001", "client_003"]
+
+    def test_rate_limiter_sweeps_idle_clients(self):
+        """Test idle clients are removed by sweep_expired"""
+        limiter = RateLimiter()
+        limit = RateLimit(
+            requests_per_second=10,
+            requests_per_minute=100,
+            requests_per_hour=1000
+        )
+
+        now = time.time()
+        limiter._sliding_window_check("idle_client", limit, now - 300)
+        limiter._sliding_window_check("active_client", limit, now)
+
+        assert limiter.sweep_expired(now) == 1
+        assert list(limiter.buckets) == ["active_client"]
+
+    def test_redis_rate_limiter_falls_back_when_redis_fails(self):
+        """Test the local limiter takes over when the Redis script errors"""
+        class UnavailableRedis:
+            def register_script(self, script):
+                def run(keys, args):
+                    raise ConnectionError("redis down")
+                return run
+
+        limiter = RedisRateLimiter(UnavailableRedis())
+        limit = RateLimit(
+            requests_per_second=10,
+            requests_per_minute=2,
+            requests_per_hour=1000
+        )
+
+        results = [limiter.is_allowed("client_001", limit)[0] for _ in range(3)]
+
+        assert results == [True, True, False]
+
+    def test_redis_rate_limiter_logs_outage_once(self, caplog):
+        """Test a Redis outage is logged on entry and recovery, not per request"""
+        class FlakyRedis:
+            down = True
+
+            def register_script(self, script):
+                def run(keys, args):
+                    if FlakyRedis.down:
+                        raise ConnectionError("redis down")
+                    return [1, 5]
+                return run
+
+        limiter = RedisRateLimiter(FlakyRedis())
+        limit = RateLimit(
+            requests_per_second=10,
+            requests_per_minute=100,
+            requests_per_hour=1000
+        )
+
+        with caplog.at_level(logging.INFO, logger="app.microservices_gateway"):
+            for _ in range(5):
+                limiter.is_allowed("client_001", limit)
+            FlakyRedis.down = False
+            for _ in range(5):
+                assert limiter.is_allowed("client_001", limit) == (True, 5)
+
+        messages = [r.getMessage() for r in caplog.records]
+        assert sum("using local limiter" in m for m in messages) == 1
+        assert sum("recovered" in m for m in messages) == 1
+
+    @pytest.mark.asyncio
+    async def test_gateway_uses_injected_rate_limit_backend(self):
+        """Test the gateway consults a custom rate limit backend"""
+        class DenyAll:
+            def is_allowed(self, client_id, limit):
+                return False, 0
+
+        gateway = APIGateway(rate_limit_backend=DenyAll())
+        gateway.register_service("user_service", [create_test_endpoint("user_service")])
+        gateway.register_route(create_test_route(auth_required=False))
+
+        response = await gateway.handle_request(create_test_request())
+
+        assert response.status_code == 429
+
 
 # ============================================================================
-# Authentication Tests (8 tests)
+# Authentication Tests (10 tests)
 # ============================================================================
 
 class TestAuthentication:
@@ -305,6 +403,23 @@ class TestAuthentication:
 
         assert not authenticated
 
+    def test_api_key_authentication_with_hashed_keys(self):
+        """Test API keys configured only as SHA-256 digests"""
+        config = AuthConfig(
+            auth_type=AuthType.API_KEY,
+            api_key_hashes=[hashlib.sha256(b"test_api_key_123").hexdigest()]
+        )
+        auth_mgr = AuthenticationManager(config)
+
+        authenticated, user_id = auth_mgr.authenticate(
+            create_test_request(api_key="test_api_key_123")
+        )
+        rejected, _ = auth_mgr.authenticate(create_test_request(api_key="wrong_key"))
+
+        assert authenticated
+        assert user_id == "test_api****"
+        assert not rejected
+
     def test_jwt_authentication_success(self):
         """Test successful JWT authentication"""
         import json
@@ -329,6 +444,28 @@ class TestAuthentication:
         authenticated, user_id = auth_mgr.authenticate(request)
         assert authenticated
 
+    def test_jwt_validation_is_cached(self):
+        """Test repeated JWTs are served from the validation cache"""
+        import json
+        import base64
+
+        payload = {"sub": "user_123", "exp": time.time() + 3600}
+        payload_b64 = base64.urlsafe_b64encode(
+            json.dumps(payload).encode()
+        ).decode().rstrip("=")
+
+        token = f"eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.{payload_b64}.signature"
+
+        auth_mgr = AuthenticationManager(AuthConfig(auth_type=AuthType.JWT))
+
+        request = create_test_request()
+        request.headers["Authorization"] = f"Bearer {token}"
+
+        assert auth_mgr.authenticate(request) == (True, "user_123")
+        assert len(auth_mgr._jwt_cache) == 1
+        assert auth_mgr.authenticate(request) == (True, "user_123")
+        assert len(auth_mgr._jwt_cache) == 1
+
     def test_jwt_missing_bearer(self):
         """Test JWT without Bearer prefix"""
         config = AuthConfig(
@@ -454,7 +591,7 @@ class TestCircuitBreaker:
 
 
 # ============================================================================
-# Load Balancing Tests (6 tests)
+# Load Balancing Tests (9 tests)
 # ============================================================================
 
 class TestLoadBalancer:
@@ -519,6 +656,27 @@ class TestLoadBalancer:
         next_ep = lb.select_endpoint(endpoints)
         assert next_ep.port == 8001
 
+    def test_least_connections_tracks_acquire_release(self):
+        """Test least-connections follows acquire/release counts"""
+        lb = LoadBalancer("least_connections")
+
+        endpoints = [
+            create_test_endpoint("ep1", port=8001),
+            create_test_endpoint("ep2", port=8002),
+            create_test_endpoint("ep3", port=8003)
+        ]
+
+        picked = []
+        for _ in range(3):
+            endpoint = lb.select_endpoint(endpoints)
+            lb.acquire(endpoint)
+            picked.append(endpoint.port)
+
+        assert picked == [8001, 8002, 8003]
+
+        lb.release(endpoints[1])
+        assert lb.select_endpoint(endpoints).port == 8002
+
     def test_unhealthy_endpoints_excluded(self):
         """Test unhealthy endpoints are excluded"""
         lb = LoadBalancer("round_robin")
@@ -545,6 +703,111 @@ class TestLoadBalancer:
         endpoint = lb.select_endpoint(endpoints)
         assert endpoint is None
 
+    def test_mark_endpoint_unhealthy_updates_selection(self):
+        """Test marking an endpoint unhealthy removes it from selection"""
+        gateway = APIGateway()
+
+        endpoints = [
+            create_test_endpoint("ep1", port=8001),
+            create_test_endpoint("ep2", port=8002)
+        ]
+        gateway.register_service("service", endpoints)
+        lb = gateway.load_balancers["service"]
+
+        assert lb.select_endpoint(endpoints) is not None
+
+        gateway.mark_endpoint_unhealthy("service", 0)
+        for _ in range(5):
+            assert lb.select_endpoint(endpoints).port == 8002
+
+        gateway.mark_endpoint_unhealthy("service", 1)
+        assert lb.select_endpoint(endpoints) is None
+
+        gateway.mark_endpoint_healthy("service", 0)
+        assert lb.select_endpoint(endpoints).port == 8001
+
+    def test_direct_unhealthy_flag_updates_selection(self):
+        """Test setting endpoint.healthy directly is honored"""
+        lb = LoadBalancer("round_robin")
+
+        endpoints = [
+            create_test_endpoint("ep1", port=8001),
+            create_test_endpoint("ep2", port=8002)
+        ]
+        assert lb.select_endpoint(endpoints) is not None
+
+        endpoints[0].healthy = False
+        for _ in range(5):
+            assert lb.select_endpoint(endpoints).port == 8002
+
+    def test_direct_metric_updates_update_selection(self):
+        """Test endpoint.update_metrics is honored without invalidate()"""
+        lb = LoadBalancer("weighted")
+
+        endpoints = [
+            create_test_endpoint("ep1", port=8001),
+            create_test_endpoint("ep2", port=8002)
+        ]
+        assert lb.select_endpoint(endpoints) is not None
+
+        for _ in range(3):
+            endpoints[0].update_metrics(response_time_ms=500.0, error_rate=0.1)
+        assert endpoints[0].health_state == HEALTH_STATE_UNHEALTHY
+        for _ in range(5):
+            assert lb.select_endpoint(endpoints).port == 8002
+
+    def test_different_endpoint_lists_not_mixed(self):
+        """Test a new list of the same length is not served from the cache"""
+        lb = LoadBalancer("round_robin")
+
+        first = [create_test_endpoint("ep1", port=8001), create_test_endpoint("ep2", port=8002)]
+        assert lb.select_endpoint(first).port in (8001, 8002)
+        del first
+
+        second = [create_test_endpoint("ep3", port=8003), create_test_endpoint("ep4", port=8004)]
+        for _ in range(4):
+            assert lb.select_endpoint(second).port in (8003, 8004)
+
+        # Replacing an entry in place is picked up after invalidate()
+        second[0] = create_test_endpoint("ep5", port=8005)
+        lb.invalidate()
+        assert {lb.select_endpoint(second).port for _ in range(4)} == {8004, 8005}
+
+    def test_register_and_deregister_endpoint_update_selection(self):
+        """Test endpoints added or removed through the gateway are picked up"""
+        gateway = APIGateway()
+
+        endpoints = [
+            create_test_endpoint("ep1", port=8001),
+            create_test_endpoint("ep2", port=8002)
+        ]
+        gateway.register_service("service", endpoints)
+        lb = gateway.load_balancers["service"]
+        assert lb.select_endpoint(endpoints) is not None
+
+        # Same length after swapping one endpoint for another
+        removed = gateway.deregister_endpoint("service", 0)
+        gateway.register_endpoint("service", create_test_endpoint("ep3", port=8003))
+        assert {lb.select_endpoint(endpoints).port for _ in range(50)} == {8002, 8003}
+
+        # A removed endpoint no longer affects the balancer's cache
+        version = lb._version.value
+        removed.healthy = False
+        assert lb._version.value == version
+
+    def test_health_changes_bump_one_version(self):
+        """Test cache validity is one integer comparison, not a scan of the list"""
+        lb = LoadBalancer("round_robin")
+
+        endpoints = [create_test_endpoint(f"ep{i}", port=8000 + i) for i in range(3)]
+        lb.select_endpoint(endpoints)
+        version = lb._version.value
+
+        endpoints[1].update_metrics(response_time_ms=5.0, error_rate=0.0)
+        endpoints[2].healthy = False
+        assert lb._version.value > version
+        assert {lb.select_endpoint(endpoints).port for _ in range(4)} == {8000, 8001}
+
     def test_endpoint_health_score_calculation(self):
         """Test endpoint health score calculation"""
         endpoint = create_test_endpoint(
@@ -556,9 +819,29 @@ class TestLoadBalancer:
         assert 0 <= health_score <= 100
         assert health_score > 50
 
+    def test_endpoint_health_state_hysteresis(self):
+        """Test health state changes only after consecutive observations"""
+        endpoint = create_test_endpoint(response_time_ms=5.0)
+        assert endpoint.health_state == HEALTH_STATE_HEALTHY
+
+        # Three consecutive bad observations are needed to go unhealthy
+        assert not endpoint.update_metrics(response_time_ms=500.0, error_rate=0.1)
+        assert not endpoint.update_metrics(response_time_ms=500.0, error_rate=0.1)
+        assert endpoint.health_state == HEALTH_STATE_HEALTHY
+        assert endpoint.update_metrics(response_time_ms=500.0, error_rate=0.1)
+        assert endpoint.health_state == HEALTH_STATE_UNHEALTHY
+
+        lb = LoadBalancer("round_robin")
+        assert lb.select_endpoint([endpoint]) is None
+
+        # A single good observation does not bring it back
+        assert not endpoint.update_metrics(response_time_ms=5.0, error_rate=0.0)
+        assert endpoint.update_metrics(response_time_ms=5.0, error_rate=0.0)
+        assert endpoint.health_state == HEALTH_STATE_HEALTHY
+
 
 # ============================================================================
-# Route Matching Tests (4 tests)
+# Route Matching Tests (7 tests)
 # ============================================================================
 
 class TestRouteMatching:
@@ -628,6 +911,45 @@ class TestRouteMatching:
         found_route = gateway._find_route(request)
         assert found_route is not None
 
+    @pytest.mark.asyncio
+    async def test_longest_prefix_route_wins(self):
+        """Test the most specific registered route is selected"""
+        gateway = APIGateway()
+
+        gateway.register_route(create_test_route(path="/api/", upstream_service="api"))
+        gateway.register_route(create_test_route(path="/api/users", upstream_service="users"))
+
+        found_route = gateway._find_route(create_test_request(path="/api/users/123"))
+        assert found_route.upstream_service == "users"
+
+        found_route = gateway._find_route(create_test_request(path="/api/orders"))
+        assert found_route.upstream_service == "api"
+
+    @pytest.mark.asyncio
+    async def test_path_parameter_route_match(self):
+        """Test :param segments match any value"""
+        gateway = APIGateway()
+
+        gateway.register_route(create_test_route(path="/api/users/:id/orders", upstream_service="orders"))
+        gateway.register_route(create_test_route(path="/api/users/me", upstream_service="profile"))
+
+        found_route = gateway._find_route(create_test_request(path="/api/users/42/orders"))
+        assert found_route.upstream_service == "orders"
+
+        found_route = gateway._find_route(create_test_request(path="/api/users/me"))
+        assert found_route.upstream_service == "profile"
+
+    def test_route_methods_normalized_to_uppercase(self):
+        """Test lowercase route methods match uppercase request methods"""
+        gateway = APIGateway()
+
+        route = create_test_route(path="/api/users", methods=["get"])
+        gateway.register_route(route)
+
+        assert route.methods == frozenset({"GET"})
+        assert gateway._find_route(create_test_request(method="GET")) is route
+        assert gateway._find_route(create_test_request(method="POST")) is None
+
 
 # ============================================================================
 # API Gateway Integration Tests (6 tests)
@@ -794,7 +1116,7 @@ class TestAuthConfiguration:
 
 
 # ============================================================================
-# Performance Tests (4 tests)
+# Performance Tests (5 tests)
 # ============================================================================
 
 class TestPerformance:
@@ -880,6 +1202,28 @@ class TestPerformance:
         assert len(responses) == 10
         assert all(isinstance(r, ServiceResponse) for r in responses)
 
+    @pytest.mark.asyncio
+    async def test_gateway_handles_request_batch(self):
+        """Test batched requests return responses in request order"""
+        gateway = APIGateway()
+
+        endpoints = [create_test_endpoint("user_service", port=8001)]
+        gateway.register_service("user_service", endpoints)
+
+        route = create_test_route(auth_required=False)
+        gateway.register_route(route)
+
+        requests = [
+            create_test_request(path="/api/users"),
+            create_test_request(path="/nonexistent"),
+            create_test_request(path="/api/users")
+        ]
+
+        responses = await gateway.handle_requests(requests)
+
+        assert [r.status_code for r in responses] == [200, 404, 200]
+        assert gateway.request_count == 3
+
 
 # ============================================================================
 # Error Handling Tests (4 tests)
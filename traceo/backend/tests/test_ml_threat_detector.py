@@ -646,6 +646,89 @@ class TestThreatScoring:
         assert user_id in detector.user_activity_history
         assert len(detector.user_activity_history[user_id]) > 0
 
+    def test_batch_scores_follow_input_order(self):
+        """Test batch scoring returns one score per activity, in order"""
+        detector = HybridThreatDetector()
+        now = datetime.utcnow()
+
+        activities = [
+            generate_normal_activity(f"user_{i:03d}", now + timedelta(minutes=i))
+            for i in range(5)
+        ]
+        threat_scores = detector.predict_threats_batch(activities)
+
+        assert len(threat_scores) == len(activities)
+        assert [t.user_id for t in threat_scores] == [a.user_id for a in activities]
+        # Without baselines every activity gets the default assessment
+        assert all(t.threat_level == ThreatLevel.MEDIUM for t in threat_scores)
+
+    def _trained_detector(self):
+        """Detector with trained models, one user with LSTM-length history and one without"""
+        detector = HybridThreatDetector()
+        detector.isolation_forest.train(np.random.normal(0.5, 0.2, (200, 16)))
+        detector.xgboost_ensemble.train(
+            np.random.normal(0.5, 0.2, (200, 16)), np.random.randint(0, 2, 200)
+        )
+        detector.lstm_autoencoder.train(np.random.normal(0, 1, (50, 24, 8)), epochs=1)
+
+        now = datetime.utcnow()
+        detector.establish_baseline("user_001", [
+            generate_normal_activity("user_001", now - timedelta(days=i))
+            for i in range(30)
+        ])
+        detector.establish_baseline("user_002", [
+            generate_normal_activity("user_002", now - timedelta(days=i))
+            for i in range(10)
+        ])
+
+        activities = [
+            generate_normal_activity("user_001", now + timedelta(minutes=1)),
+            generate_suspicious_activity("user_002", now + timedelta(minutes=2), "location"),
+            generate_suspicious_activity("user_001", now + timedelta(minutes=3), "location"),
+            generate_normal_activity("user_003", now + timedelta(minutes=4)),
+            generate_normal_activity("user_002", now + timedelta(minutes=5)),
+        ]
+        return detector, activities
+
+    def test_batch_matches_sequential_scoring(self):
+        """Test batch scoring equals predict_threat called on each activity in turn"""
+        detector, activities = self._trained_detector()
+        history = {u: list(acts) for u, acts in detector.user_activity_history.items()}
+
+        sequential = [detector.predict_threat(a) for a in activities]
+        history_after = {u: list(acts) for u, acts in detector.user_activity_history.items()}
+
+        detector.user_activity_history = {u: list(acts) for u, acts in history.items()}
+        detector.threat_history = {}
+        batch = detector.predict_threats_batch(activities)
+
+        assert [t.user_id for t in batch] == [t.user_id for t in sequential]
+        assert sequential[0].lstm_autoencoder_score > 0
+        assert sequential[1].lstm_autoencoder_score == 0
+        for b, s in zip(batch, sequential):
+            assert b.primary_anomalies == s.primary_anomalies
+            assert b.isolation_forest_score == pytest.approx(s.isolation_forest_score, abs=1e-4)
+            assert b.lstm_autoencoder_score == pytest.approx(s.lstm_autoencoder_score, abs=1e-4)
+            assert b.xgboost_ensemble_score == pytest.approx(s.xgboost_ensemble_score, abs=1e-4)
+            assert b.threat_score == pytest.approx(s.threat_score, abs=1e-4)
+            assert b.behavioral_deviation_score == s.behavioral_deviation_score
+        assert detector.user_activity_history == history_after
+
+    def test_batch_restores_history_when_model_fails(self):
+        """Test a failing model call leaves the activity history unchanged"""
+        detector, activities = self._trained_detector()
+        history = {u: list(acts) for u, acts in detector.user_activity_history.items()}
+
+        def fail(X):
+            raise RuntimeError("model unavailable")
+
+        detector.xgboost_ensemble.predict_threat_probability = fail
+        with pytest.raises(RuntimeError):
+            detector.predict_threats_batch(activities)
+
+        assert detector.user_activity_history == history
+        assert detector.threat_history == {}
+
     def test_multiple_anomalies_combined(self):
         """Test detection of multiple simultaneous anomalies"""
         detector = HybridThreatDetector()